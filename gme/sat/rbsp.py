@@ -354,6 +354,7 @@ class rbspFp(object):
 		**Args**: 
 			* **data**: a dictionnary containing ephemeris (with keys 'lat', 'lon', 'alt', 'time')
 		"""
+		from multiprocessing import cpu_count
 		import tsyganenko as ts
 		import numpy as np
 
@@ -363,7 +364,8 @@ class rbspFp(object):
 			print 'Read tracing results...'
 		except:
 			print 'Tracing...'
-			trace = ts.tsygTrace(data['lat'], data['lon'], data['alt'], datetime=data['time'], rmin=1.047)
+			trace = ts.tsygTrace(data['lat'], data['lon'], data['alt'], datetime=data['time'], rmin=1.047, 
+				nProcs=cpu_count(), storeTrace=False)
 			trace.save( fname )
 
 		self.lonNH = trace.lonNH
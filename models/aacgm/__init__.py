@@ -1,11 +1,418 @@
-# Copyright (C) 2012  VT SuperDARN Lab
-# Full license can be found in LICENSE.txt
-"""
-*********************
-**Module**: models.aacgm
-*********************
-"""
-try:
-    from aacgmlib import *
-except Exception, e:
-    print __file__+' -> aacgmlib: ', e
+# Copyright (C) 2012  VT SuperDARN Lab
+# Full license can be found in LICENSE.txt
+"""
+*********************
+**Module**: models.aacgm
+*********************
+
+**Functions**:
+    * :func:`models.aacgm.aacgmConv`: convert a single point to/from AACGM
+    * :func:`models.aacgm.aacgmConvArr`: convert lists of points to/from AACGM
+    * :func:`models.aacgm.aacgmConvNp`: convert arrays of any shape to/from AACGM
+    * :func:`models.aacgm.aacgmConvPar`: convert large arrays to/from AACGM using several processes
+    * :func:`models.aacgm.aacgmConvCached`: convert arrays to/from AACGM, reusing previous conversions
+    * :func:`models.aacgm.mltFromEpoch`: MLT from epoch time and magnetic longitude
+    * :func:`models.aacgm.mltFromYmdhms`: MLT from date and magnetic longitude
+    * :func:`models.aacgm.mltFromYrsec`: MLT from year seconds and magnetic longitude
+    * :func:`models.aacgm.mltFromEpochArr`: MLT from arrays of epoch times and magnetic longitudes
+    * :func:`models.aacgm.mltFromYmdhmsArr`: MLT from arrays of dates and magnetic longitudes
+    * :func:`models.aacgm.mltFromYrsecArr`: MLT from arrays of year seconds and magnetic longitudes
+
+**Classes**:
+    * :class:`models.aacgm.aacgmCache`: memory/disk cache of converted grids
+"""
+try:
+    from aacgmlib import *
+except Exception, e:
+    print __file__+' -> aacgmlib: ', e
+
+
+def aacgmConvNp(lat, lon, height, flg, out=None):
+    """Convert arrays of points to/from AACGM coordinates.
+    Inputs can be scalars or arrays of any broadcastable shape. The conversion runs in
+    a single C loop (with the GIL released) on contiguous float64 copies of the inputs.
+
+    **Args**:
+        * **lat**: latitude [degree]
+        * **lon**: longitude [degree]
+        * **height**: altitude [km]
+        * **flg**: 0: geo to aacgm; 1: aacgm to geo
+        * [**out**] (tuple): 3 preallocated contiguous float64 arrays (lat, lon, r) of the
+          broadcast shape of the inputs to write the output to. Outputs set to None are not returned, and
+          output arrays can be the input arrays themselves (e.g., out=(lat, lon, None) converts in place)
+    **Returns**:
+        * **lat**, **lon**, **r** (numpy.ndarray): converted latitude [degree], longitude [degree]
+          and radial distance [Re] (the arrays given in **out** if any)
+    **Example**:
+        ::
+
+            mlat, mlon, r = aacgmConvNp(myFov.latFull, myFov.lonFull, 300., 0)
+
+    """
+    import numpy as np
+
+    shape = np.broadcast(np.asarray(lat), np.asarray(lon), np.asarray(height)).shape
+    ins = []
+    for v in [lat, lon, height]:
+        v = np.asarray(v, dtype='float64')
+        if v.shape != shape:
+            v = np.zeros(shape) + v
+        ins.append( np.ascontiguousarray(v) )
+
+    if out is None: out = (np.empty(shape), np.empty(shape), np.empty(shape))
+    outs = list(out)
+    for o in outs:
+        if o is not None and o.shape != shape:
+            raise ValueError('aacgmConvNp: output arrays must have shape {}'.format(shape))
+
+    aacgmConvBuf(ins[0], ins[1], ins[2], flg, outs[0], outs[1], outs[2])
+
+    return tuple(outs)
+
+
+# Shared memory (inputs and outputs) of the current aacgmConvPar call, inherited by the forked workers
+_parBuf = None
+
+
+def _convChunk(args):
+    """Convert a chunk of the shared buffer of :func:`aacgmConvPar` (runs in a worker process)
+    """
+    i0, i1, flg = args
+    buf = _parBuf
+    aacgmConvBuf(buf[0, i0:i1], buf[1, i0:i1], buf[2, i0:i1], flg, 
+        buf[3, i0:i1], buf[4, i0:i1], buf[5, i0:i1])
+
+
+def aacgmConvPar(lat, lon, height, flg, nProcs=None, chunkSize=200000):
+    """Convert large arrays of points to/from AACGM coordinates using several processes.
+    The AACGM library is not re-entrant (its coefficients are kept in static variables), 
+    so the points are split in chunks that are converted by a pool of forked processes, 
+    all reading from and writing to a shared memory buffer. Small inputs (or nProcs=1) are 
+    converted in the calling process by :func:`aacgmConvNp`.
+
+    **Args**:
+        * **lat**: latitude [degree]
+        * **lon**: longitude [degree]
+        * **height**: altitude [km]
+        * **flg**: 0: geo to aacgm; 1: aacgm to geo
+        * [**nProcs**] (int): number of processes (defaults to the number of CPUs)
+        * [**chunkSize**] (int): number of points converted by each task
+    **Returns**:
+        * **lat**, **lon**, **r** (numpy.ndarray): converted latitude [degree], longitude [degree]
+          and radial distance [Re], with the broadcast shape of the inputs
+    **Example**:
+        ::
+
+            mlat, mlon, r = aacgmConvPar(lats, lons, 300., 0, nProcs=8)
+
+    """
+    from multiprocessing import Pool, cpu_count
+    from multiprocessing.sharedctypes import RawArray
+    import numpy as np
+    global _parBuf
+
+    shape = np.broadcast(np.asarray(lat), np.asarray(lon), np.asarray(height)).shape
+    nPnts = int(np.prod(shape))
+    if nProcs is None: nProcs = cpu_count()
+    nProcs = min(nProcs, (nPnts + chunkSize - 1) // chunkSize)
+    if nProcs <= 1:
+        return aacgmConvNp(lat, lon, height, flg)
+
+    # Inputs (3 rows) and outputs (3 rows) in memory shared with the workers
+    buf = np.frombuffer(RawArray('d', 6*nPnts), dtype='float64').reshape(6, nPnts)
+    for i, v in enumerate([lat, lon, height]):
+        buf[i].reshape(shape)[...] = v
+
+    _parBuf = buf
+    pool = Pool(nProcs)
+    try:
+        pool.map(_convChunk, [(i0, min(i0+chunkSize, nPnts), flg) for i0 in xrange(0, nPnts, chunkSize)])
+    finally:
+        pool.close()
+        pool.join()
+        _parBuf = None
+
+    return buf[3].reshape(shape), buf[4].reshape(shape), buf[5].reshape(shape)
+
+
+class aacgmCache(object):
+    """Least-recently-used cache of AACGM conversions of whole grids, bounded in memory and 
+    optionally backed by a directory of .npz files so that they can be shared between processes 
+    and sessions. Entries are keyed on the content of the input grids, the height, the direction 
+    of the conversion and the coefficient epoch.
+
+    **Args**:
+        * [**maxBytes**] (int): maximum size of the converted grids kept in memory [bytes]
+        * [**cacheDir**] (str): directory where converted grids are saved (no disk cache if None)
+    **Members**:
+        * **hits** (int): number of requests served from memory
+        * **diskHits** (int): number of requests served from the disk cache
+        * **misses** (int): number of requests that required a new conversion
+    **Methods**:
+        * :func:`aacgmCache.get`
+        * :func:`aacgmCache.clear`
+        * :func:`aacgmCache.stats`
+    **Example**:
+        ::
+
+            cache = models.aacgm.aacgmCache(maxBytes=2**28, cacheDir='/tmp/aacgm')
+            mlat, mlon, r = cache.get(lats, lons, 0., 0)
+            print cache.stats()
+
+    .. note:: cached arrays are shared between callers and are read-only.
+
+    """
+    def __init__(self, maxBytes=2**27, cacheDir=None):
+        from collections import OrderedDict
+        import os
+
+        self.maxBytes = maxBytes
+        self.cacheDir = cacheDir
+        if cacheDir and not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        self._grids = OrderedDict()
+        self._nBytes = 0
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+
+    def key(self, lat, lon, height, flg, year=None):
+        """Hash the input grids and conversion parameters into a cache key
+
+        **Args**:
+            * **lat**, **lon**, **height**, **flg**: as in :func:`aacgmConvNp`
+            * [**year**] (int): epoch of the AACGM coefficients
+        **Returns**:
+            * **key** (str): hexadecimal digest identifying the conversion
+        """
+        import numpy as np
+        import hashlib
+
+        h = hashlib.sha1()
+        h.update( repr((int(flg), year)) )
+        for v in [lat, lon, height]:
+            v = np.ascontiguousarray(v, dtype='float64')
+            h.update( repr(v.shape) )
+            h.update( v.tostring() )
+
+        return h.hexdigest()
+
+
+    def get(self, lat, lon, height, flg, year=None):
+        """Convert grids to/from AACGM, only if they are not already in the cache
+
+        **Args**:
+            * **lat**, **lon**, **height**, **flg**: as in :func:`aacgmConvNp`
+            * [**year**] (int): epoch of the AACGM coefficients
+        **Returns**:
+            * **lat**, **lon**, **r** (numpy.ndarray): read-only converted grids
+        """
+        import numpy as np
+        import os
+
+        key = self.key(lat, lon, height, flg, year=year)
+
+        # In memory: move entry to the most recently used end
+        if key in self._grids:
+            self.hits += 1
+            out = self._grids.pop(key)
+            self._grids[key] = out
+            return out
+
+        # On disk
+        out = None
+        if self.cacheDir:
+            fName = os.path.join(self.cacheDir, 'aacgm.{}.npz'.format(key))
+            if os.path.isfile(fName):
+                try:
+                    with np.load(fName) as f:
+                        out = (f['lat'], f['lon'], f['r'])
+                    self.diskHits += 1
+                except Exception as e:
+                    print 'aacgmCache: could not read {}: {}'.format(fName, e)
+                    out = None
+
+        # Convert
+        if out is None:
+            self.misses += 1
+            out = aacgmConvNp(lat, lon, height, flg)
+            if self.cacheDir:
+                # Write to a temporary file first so that concurrent readers never see partial files
+                tmpName = '{}.{}.tmp'.format(fName, os.getpid())
+                with open(tmpName, 'wb') as f:
+                    np.savez(f, lat=out[0], lon=out[1], r=out[2])
+                os.rename(tmpName, fName)
+
+        for o in out:
+            o.setflags(write=False)
+        self._grids[key] = out
+        self._nBytes += sum(o.nbytes for o in out)
+        while self._nBytes > self.maxBytes and len(self._grids) > 1:
+            _, old = self._grids.popitem(last=False)
+            self._nBytes -= sum(o.nbytes for o in old)
+
+        return out
+
+
+    def clear(self, disk=False):
+        """Empty the cache and reset counters
+
+        **Args**:
+            * [**disk**] (bool): also remove the saved grids from cacheDir
+        """
+        import os
+        import glob
+
+        self._grids.clear()
+        self._nBytes = 0
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        if disk and self.cacheDir:
+            for fName in glob.glob(os.path.join(self.cacheDir, 'aacgm.*.npz')):
+                os.remove(fName)
+
+
+    def stats(self):
+        """Cache usage statistics
+
+        **Returns**:
+            * **stats** (dict): hits, diskHits, misses, current number of in-memory entries and their size [bytes]
+        """
+        return {'hits': self.hits, 
+                'diskHits': self.diskHits, 
+                'misses': self.misses, 
+                'size': len(self._grids), 
+                'nBytes': self._nBytes}
+
+
+    def __len__(self):
+        return len(self._grids)
+
+
+# Cache shared by the plotting and fov routines
+defaultAacgmCache = aacgmCache()
+
+
+def aacgmConvCached(lat, lon, height, flg, year=None, cache=None, minSize=1000):
+    """Convert arrays of points to/from AACGM coordinates, reusing a previous conversion 
+    of the same grid when one exists.
+
+    **Args**:
+        * **lat**, **lon**, **height**, **flg**: as in :func:`aacgmConvNp`
+        * [**year**] (int): epoch of the AACGM coefficients (part of the cache key)
+        * [**cache**] (:class:`aacgmCache`): cache to use (defaults to the module-wide defaultAacgmCache)
+        * [**minSize**] (int): smaller inputs (one-off points, boundaries...) are converted 
+          directly, without going through the cache. Grids known to be repeated, such as 
+          :class:`pydarn.radar.radFov.fov` grids, are passed with minSize=0
+    **Returns**:
+        * **lat**, **lon**, **r** (numpy.ndarray): converted latitude [degree], 
+          longitude [degree] and radial distance [Re] (copies, the cached grids are not modified)
+    **Example**:
+        ::
+
+            mlat, mlon, _ = aacgmConvCached(myFov.latFull, myFov.lonFull, 0., 0)
+
+    """
+    import numpy as np
+
+    if np.broadcast(lat, lon, height).size < minSize:
+        return aacgmConvNp(lat, lon, height, flg)
+
+    if cache is None: cache = defaultAacgmCache
+
+    return tuple( o.copy() for o in cache.get(lat, lon, height, flg, year=year) )
+
+
+# MLT of the 0 magnetic meridian for each time already seen, keyed on (function name, time).
+# MLT is linear in magnetic longitude, so this holds all the (expensive) solar terms of a given time.
+_mltRef = {}
+_mltRefMaxSize = 100000
+
+
+def _mltArr(mltFunc, times, mLon):
+    """MLT for aligned arrays of times and magnetic longitudes, calling mltFunc once per distinct time
+    
+    **Args**:
+        * **mltFunc**: one of the scalar mltFrom* functions
+        * **times** (list): arrays of the time arguments of mltFunc (e.g., [year, yrsec])
+        * **mLon**: magnetic longitude [degree]
+    **Returns**:
+        * **mlt** (numpy.ndarray): MLT [hour] with the broadcast shape of the times and mLon
+    """
+    import numpy as np
+
+    arrs = np.broadcast_arrays( *([np.asarray(t) for t in times] + [np.asarray(mLon, dtype='float64')]) )
+    shape = arrs[0].shape
+    tArrs = [a.ravel() for a in arrs[:-1]]
+
+    # Distinct times
+    tRec = np.empty(tArrs[0].size, dtype=[('t{}'.format(i), a.dtype) for i, a in enumerate(tArrs)])
+    for i, a in enumerate(tArrs):
+        tRec['t{}'.format(i)] = a
+    uTimes, inv = np.unique(tRec, return_inverse=True)
+
+    if len(_mltRef) + len(uTimes) > _mltRefMaxSize: _mltRef.clear()
+    ref = np.empty(len(uTimes))
+    for i, t in enumerate(uTimes):
+        t = t.tolist()
+        key = (mltFunc.__name__, t)
+        if key not in _mltRef:
+            _mltRef[key] = mltFunc(*(t + (0.,)))
+        ref[i] = _mltRef[key]
+
+    mlt = np.mod(ref[inv] + arrs[-1].ravel()/15., 24.)
+    return mlt.reshape(shape)
+
+
+def mltFromEpochArr(epoch, mLon):
+    """Calculate MLT from arrays of epoch times and magnetic longitudes. 
+    The solar terms are computed once per distinct time (and cached between calls), 
+    so that many points sharing a few times are cheap.
+
+    **Args**:
+        * **epoch**: epoch time [s] (scalar or array)
+        * **mLon**: magnetic longitude [degree] (scalar or array)
+    **Returns**:
+        * **mlt** (numpy.ndarray): MLT [hour] with the broadcast shape of the inputs
+    **Example**:
+        ::
+
+            mlt = mltFromEpochArr(epochs, mlons)
+
+    """
+    return _mltArr(mltFromEpoch, [epoch], mLon)
+
+
+def mltFromYmdhmsArr(yr, mo, dy, hr, mt, sc, mLon):
+    """Calculate MLT from arrays of dates and magnetic longitudes. 
+    The solar terms are computed once per distinct time (and cached between calls).
+
+    **Args**:
+        * **yr**, **mo**, **dy**, **hr**, **mt**, **sc** (int): date and time (scalars or arrays)
+        * **mLon**: magnetic longitude [degree] (scalar or array)
+    **Returns**:
+        * **mlt** (numpy.ndarray): MLT [hour] with the broadcast shape of the inputs
+    """
+    import numpy as np
+
+    times = [np.asarray(t, dtype='int') for t in [yr, mo, dy, hr, mt, sc]]
+    return _mltArr(mltFromYmdhms, times, mLon)
+
+
+def mltFromYrsecArr(yr, yrSec, mLon):
+    """Calculate MLT from arrays of year seconds and magnetic longitudes. 
+    The solar terms are computed once per distinct time (and cached between calls).
+
+    **Args**:
+        * **yr** (int): year (scalar or array)
+        * **yrSec** (int): seconds since the start of the year (scalar or array)
+        * **mLon**: magnetic longitude [degree] (scalar or array)
+    **Returns**:
+        * **mlt** (numpy.ndarray): MLT [hour] with the broadcast shape of the inputs
+    """
+    import numpy as np
+
+    times = [np.asarray(yr, dtype='int'), np.asarray(yrSec, dtype='int')]
+    return _mltArr(mltFromYrsec, times, mLon)
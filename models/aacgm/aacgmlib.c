@@ -1,4 +1,5 @@
 #include <Python.h>
+#include <pythread.h>
 #include <datetime.h>
 #include <zlib.h>
 #include <stdlib.h>
@@ -16,6 +17,52 @@
 #include "radar.h"
 #include "rpos.h"
 
+/* The AACGM library keeps its coefficients in static variables, so calls 
+ * into it must be serialized when the GIL is released. */
+static PyThread_type_lock aacgm_lock = NULL;
+
+/* Acquire the AACGM lock, waiting without the GIL if it is busy */
+#define AACGM_LOCK() \
+	if (!PyThread_acquire_lock(aacgm_lock, NOWAIT_LOCK)) { \
+		Py_BEGIN_ALLOW_THREADS \
+		PyThread_acquire_lock(aacgm_lock, WAIT_LOCK); \
+		Py_END_ALLOW_THREADS \
+	}
+#define AACGM_UNLOCK() PyThread_release_lock(aacgm_lock)
+
+/* Get a C-contiguous buffer of doubles from obj (None gives an empty view) */
+static int
+get_double_buffer(PyObject *obj, Py_buffer *view, int writable)
+{
+	int flags = PyBUF_C_CONTIGUOUS | PyBUF_FORMAT;
+	const char *fmt;
+
+	view->obj = NULL;
+	view->buf = NULL;
+	view->len = 0;
+	if (obj == Py_None) return 0;
+
+	if (writable) flags |= PyBUF_WRITABLE;
+	if (PyObject_GetBuffer(obj, view, flags) < 0) return -1;
+
+	/* native doubles only: "d", "@d" or "=d" */
+	fmt = view->format;
+	if (fmt != NULL && (fmt[0] == '@' || fmt[0] == '=')) fmt++;
+	if (view->itemsize != sizeof(double) || fmt == NULL || strcmp(fmt, "d") != 0) {
+		PyErr_SetString(PyExc_TypeError, "buffers must hold C-contiguous native doubles (float64)");
+		PyBuffer_Release(view);
+		view->obj = NULL;
+		return -1;
+	}
+	return 0;
+}
+
+static void
+release_buffer(Py_buffer *view)
+{
+	if (view->obj != NULL) PyBuffer_Release(view);
+}
+
 static PyObject *
 aacgm_wrap(PyObject *self, PyObject *args)
 {
@@ -28,7 +75,9 @@ aacgm_wrap(PyObject *self, PyObject *args)
 	else
 	{
 		inlon = fmod(inlon, 360.);
+		AACGM_LOCK();
 		AACGMConvert(inlat, inlon, height, &outLat, &outLon, &r, flg);
+		AACGM_UNLOCK();
 		 
 		return Py_BuildValue("ddd", outLat, outLon, r);
 	}
@@ -59,6 +108,7 @@ aacgm_arr_wrap(PyObject *self, PyObject *args)
 		PyObject *lonOut = PyList_New(nElem);
 		PyObject *heightOut = PyList_New(nElem);
 
+		AACGM_LOCK();
 		for (i=0; i<nElem; i++) {
 			inlat = PyFloat_AsDouble( PyList_GetItem(latList, i) );
 			inlon = PyFloat_AsDouble( PyList_GetItem(lonList, i) );
@@ -70,6 +120,7 @@ aacgm_arr_wrap(PyObject *self, PyObject *args)
 			PyList_SetItem(lonOut, i, PyFloat_FromDouble(outLon));
 			PyList_SetItem(heightOut, i, PyFloat_FromDouble(r)); 
 		}
+		AACGM_UNLOCK();
 		
 		// PyObject *outList = PyList_New(0);
 		
@@ -81,6 +132,67 @@ aacgm_arr_wrap(PyObject *self, PyObject *args)
 	}
 	
 }
+
+static PyObject *
+aacgm_buf_wrap(PyObject *self, PyObject *args)
+{
+	PyObject *latObj, *lonObj, *heightObj, *latOutObj, *lonOutObj, *rOutObj;
+	Py_buffer latBuf, lonBuf, heightBuf, latOutBuf, lonOutBuf, rOutBuf;
+	double *inlat, *inlon, *height, *outLat, *outLon, *outR; 
+	double lat, lon, r;
+	int flg;
+	Py_ssize_t nElem, i;
+
+	if(!PyArg_ParseTuple(args, "OOOiOOO", &latObj,&lonObj,&heightObj,&flg,&latOutObj,&lonOutObj,&rOutObj))
+		return NULL;
+
+	if (latObj == Py_None || lonObj == Py_None || heightObj == Py_None) {
+		PyErr_SetString(PyExc_TypeError, "aacgmConvBuf: input buffers cannot be None");
+		return NULL;
+	}
+	latBuf.obj = lonBuf.obj = heightBuf.obj = latOutBuf.obj = lonOutBuf.obj = rOutBuf.obj = NULL;
+	if (get_double_buffer(latObj, &latBuf, 0) < 0 || get_double_buffer(lonObj, &lonBuf, 0) < 0 ||
+		get_double_buffer(heightObj, &heightBuf, 0) < 0 || get_double_buffer(latOutObj, &latOutBuf, 1) < 0 ||
+		get_double_buffer(lonOutObj, &lonOutBuf, 1) < 0 || get_double_buffer(rOutObj, &rOutBuf, 1) < 0)
+		goto fail;
+
+	nElem = latBuf.len / sizeof(double);
+	if (lonBuf.len != latBuf.len || heightBuf.len != latBuf.len ||
+		(latOutBuf.obj != NULL && latOutBuf.len != latBuf.len) ||
+		(lonOutBuf.obj != NULL && lonOutBuf.len != latBuf.len) ||
+		(rOutBuf.obj != NULL && rOutBuf.len != latBuf.len)) {
+		PyErr_SetString(PyExc_ValueError, "aacgmConvBuf: all buffers must have the same size");
+		goto fail;
+	}
+
+	inlat = (double *)latBuf.buf;
+	inlon = (double *)lonBuf.buf;
+	height = (double *)heightBuf.buf;
+	outLat = (double *)latOutBuf.buf;
+	outLon = (double *)lonOutBuf.buf;
+	outR = (double *)rOutBuf.buf;
+
+	/* Outputs may alias the inputs: each element is read before it is written */
+	Py_BEGIN_ALLOW_THREADS
+	PyThread_acquire_lock(aacgm_lock, WAIT_LOCK);
+	for (i=0; i<nElem; i++) {
+		AACGMConvert(inlat[i], fmod(inlon[i], 360.), height[i], &lat, &lon, &r, flg);
+		if (outLat != NULL) outLat[i] = lat;
+		if (outLon != NULL) outLon[i] = lon;
+		if (outR != NULL) outR[i] = r;
+	}
+	PyThread_release_lock(aacgm_lock);
+	Py_END_ALLOW_THREADS
+
+	release_buffer(&latBuf); release_buffer(&lonBuf); release_buffer(&heightBuf);
+	release_buffer(&latOutBuf); release_buffer(&lonOutBuf); release_buffer(&rOutBuf);
+	Py_RETURN_NONE;
+
+fail:
+	release_buffer(&latBuf); release_buffer(&lonBuf); release_buffer(&heightBuf);
+	release_buffer(&latOutBuf); release_buffer(&lonOutBuf); release_buffer(&rOutBuf);
+	return NULL;
+}
  
 static PyObject *
 MLTConvertYMDHMS_wrap(PyObject *self, PyObject *args)
@@ -92,7 +204,9 @@ MLTConvertYMDHMS_wrap(PyObject *self, PyObject *args)
 		return NULL;
 	else
 	{ 
-		mlt = MLTConvertYMDHMS(yr,mo,dy,hr,mt,sc,mLon); 
+		AACGM_LOCK();
+		mlt = MLTConvertYMDHMS(yr,mo,dy,hr,mt,sc,mLon);
+		AACGM_UNLOCK();
 		return PyFloat_FromDouble(mlt);
 	}
 	
@@ -107,7 +221,9 @@ MLTConvertEpoch_wrap(PyObject *self, PyObject *args)
 		return NULL;
 	else
 	{ 
-		mlt = MLTConvertEpoch(epoch,mLon); 
+		AACGM_LOCK();
+		mlt = MLTConvertEpoch(epoch,mLon);
+		AACGM_UNLOCK();
 		return PyFloat_FromDouble(mlt);
 	}
 	
@@ -123,7 +239,9 @@ MLTConvertYrsec_wrap(PyObject *self, PyObject *args)
 		return NULL;
 	else
 	{
-		mlt = MLTConvertYrsec(yr,yrSec,mLon); 
+		AACGM_LOCK();
+		mlt = MLTConvertYrsec(yr,yrSec,mLon);
+		AACGM_UNLOCK();
 		return PyFloat_FromDouble(mlt);
 	}
 
@@ -212,6 +330,7 @@ static PyMethodDef aacgmMethods[] =
 {
 	{"aacgmConv",  aacgm_wrap, METH_VARARGS, "convert to aacgm coords\nformat: lat, lon, r = aacgmConv(inLat, inLon, height, flg)\nheight in km; flg=0: geo to aacgm; flg=1: aacgm to geo"},
 	{"aacgmConvArr",  aacgm_arr_wrap, METH_VARARGS, "convert to aacgm coords when inputs are lists\nformat: lat, lon, r = aacgmConvArr(inLat, inLon, height, flg)\nflg=0: geo to aacgm, flg=1: aacgm to geo"},
+	{"aacgmConvBuf",  aacgm_buf_wrap, METH_VARARGS, "convert to aacgm coords when inputs are contiguous float64 buffers (e.g., numpy arrays) of the same size\nformat: aacgmConvBuf(inLat, inLon, height, flg, outLat, outLon, outR)\noutputs are filled in place and may be None or the input buffers; the GIL is released during the conversion\nflg=0: geo to aacgm, flg=1: aacgm to geo"},
  	{"mltFromEpoch",  MLTConvertEpoch_wrap, METH_VARARGS, "calculate mlt from epoch time and mag lon\nformat:mlt=mltFromEpoch(epoch,mLon)"},
 	{"mltFromYmdhms",  MLTConvertYMDHMS_wrap, METH_VARARGS, "calculate mlt from y,mn,d,h,m,s and mag lon\nformat:mlt=mltFromYmdhms(yr,mo,dy,hr,mt,sc,mLon)"},
  	{"mltFromYrsec", MLTConvertYrsec_wrap , METH_VARARGS, "calculate mlt from yr seconds and mag lon\nformat:mlt=mltFromEpoch(year,yrsec,mLon)"},
@@ -222,5 +341,6 @@ static PyMethodDef aacgmMethods[] =
 PyMODINIT_FUNC
 initaacgmlib(void)
 {
+	aacgm_lock = PyThread_allocate_lock();
 	(void) Py_InitModule("aacgmlib", aacgmMethods);
 }
@@ -0,0 +1,74 @@
+# Copyright (C) 2012  VT SuperDARN Lab
+# Full license can be found in LICENSE.txt
+"""
+*********************
+**Module**: models.aacgm.benchAacgm
+*********************
+Benchmark of the AACGM conversion routines: list-based (aacgmConvArr),
+buffer-based (aacgmConvNp) and multi-process (aacgmConvPar) with an increasing
+number of processes. The number of points and processes and the number of
+CPUs are printed along with the timings, so that results from different
+machines can be compared.
+
+**Usage**:
+    ::
+
+        python benchAacgm.py [nPnts [maxProcs]]
+
+"""
+
+
+def benchAacgm(nPnts=10000000, maxProcs=None, height=300.):
+    """Time the conversion of nPnts random points to AACGM
+
+    **Args**:
+        * [**nPnts**] (int): number of points
+        * [**maxProcs**] (int): largest number of processes to test (defaults to the number of CPUs)
+        * [**height**] (float): altitude [km]
+    **Returns**:
+        * **times** (dict): run time [s] for each method ('list', 'np', and the number of processes)
+    """
+    from multiprocessing import cpu_count
+    from models import aacgm
+    import numpy as np
+    import time
+
+    if maxProcs is None: maxProcs = cpu_count()
+
+    print 'Converting {} points at {} km, with up to {} processes ({} CPUs)'.format(
+        nPnts, height, maxProcs, cpu_count())
+
+    lat = np.random.uniform(-90., 90., nPnts)
+    lon = np.random.uniform(-180., 180., nPnts)
+    times = {}
+
+    # The list interface is slow and memory hungry, so time it on a subset only
+    nList = min(nPnts, 1000000)
+    t0 = time.time()
+    _ = aacgm.aacgmConvArr(list(lat[:nList]), list(lon[:nList]), [height]*nList, 0)
+    times['list'] = (time.time() - t0) * nPnts / nList
+    print '{:>12s}: {:8.2f} s (extrapolated from {} points)'.format('aacgmConvArr', times['list'], nList)
+
+    t0 = time.time()
+    ref = aacgm.aacgmConvNp(lat, lon, height, 0)
+    times['np'] = time.time() - t0
+    print '{:>12s}: {:8.2f} s'.format('aacgmConvNp', times['np'])
+
+    nProcs = 1
+    while nProcs <= maxProcs:
+        t0 = time.time()
+        out = aacgm.aacgmConvPar(lat, lon, height, 0, nProcs=nProcs)
+        times[nProcs] = time.time() - t0
+        assert all( np.array_equal(o, r) for o, r in zip(out, ref) )
+        print '{:>12s}: {:8.2f} s with {:2d} processes (speed-up {:.1f})'.format('aacgmConvPar',
+            times[nProcs], nProcs, times['np']/times[nProcs])
+        nProcs *= 2
+
+    return times
+
+
+if __name__ == '__main__':
+    import sys
+
+    args = [int(a) for a in sys.argv[1:3]]
+    benchAacgm(*args)
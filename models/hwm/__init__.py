@@ -7,6 +7,9 @@
 
 **Modules**:
     * :mod:`hwm07`: fortran subroutines
+
+**Functions**:
+    * :func:`models.hwm.hwm07Arr`: winds at many points, computed in parallel
   
 *********************
 """
@@ -15,3 +18,76 @@ try:
     from hwm07 import *
 except Exception as e:
     print __file__+' -> models.hwm.hwm07: ', e
+
+
+def hwm07Arr(times, glat, glon, alt, ap=None, nProcs=None, chunkSize=10000):
+    """Evaluate HWM07 at many points. The 3-hour AP index is filled in from the tabulated 
+    values (see :func:`models.msis.getF107ApArr`) unless given, and the points are evaluated 
+    in chunks over a pool of processes (HWM keeps its state in module variables and is not 
+    thread-safe).
+
+    **Args**:
+        * **times** (datetime or list): universal time(s)
+        * **glat** (float or array): geodetic latitude(s) [degrees]
+        * **glon** (float or array): geodetic longitude(s) [degrees]
+        * **alt** (float or array): altitude(s) [km]
+        * [**ap**] (float or array): current 3-hour AP index (scalar or one per point)
+        * [**nProcs**] (int): number of processes (defaults to the number of CPUs, 1 runs serially)
+        * [**chunkSize**] (int): number of points evaluated by each task
+    **Returns**:
+        * **out** (numpy.ndarray): structured array with one element per point and fields 
+          merid (meridional wind [m/s], +ve northward) and zonal (zonal wind [m/s], +ve eastward)
+    **Example**:
+        ::
+
+            from models import hwm
+            w = hwm.hwm07Arr(dt.datetime(2011,1,1), 40., -80., np.linspace(100., 400., 50))
+            plot(w['merid'], w['zonal'])
+
+    """
+    from multiprocessing import Pool, cpu_count
+    from models.msis import getMsisInputs
+    import numpy as np
+
+    # HWM only uses the current 3-hour AP (ap(2))
+    if ap is not None:
+        apIn = np.zeros((np.size(ap), 7))
+        apIn[:, 1] = ap
+        ap = apIn
+    inp = getMsisInputs(times, glat, glon, alt, f107=0., f107a=0., ap=ap)
+    nPnts = len(inp['iyd'])
+    tasks = [tuple(inp[k][i0:i0+chunkSize] for k in ['iyd', 'sec', 'alt', 'glat', 'glon', 'stl']) + 
+        (inp['ap'][i0:i0+chunkSize, :2],) for i0 in xrange(0, nPnts, chunkSize)]
+
+    if nProcs is None: nProcs = cpu_count()
+    nProcs = min(nProcs, len(tasks))
+    if nProcs > 1:
+        pool = Pool(nProcs)
+        try:
+            results = pool.map(_hwm07Chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_hwm07Chunk, tasks)
+
+    out = np.empty(nPnts, dtype=[('merid', 'f4'), ('zonal', 'f4')])
+    i0 = 0
+    for r in results:
+        out[i0:i0+len(r)] = r
+        i0 += len(r)
+
+    return out
+
+
+def _hwm07Chunk(args):
+    """Evaluate hwm07 at a chunk of points (module-level so that it can be sent to a process pool)
+    """
+    import numpy as np
+
+    iyd, sec, alt, glat, glon, stl, ap = args
+    out = np.empty(len(iyd), dtype=[('merid', 'f4'), ('zonal', 'f4')])
+    for i in xrange(len(iyd)):
+        out[i] = tuple(hwm07(iyd[i], sec[i], alt[i], glat[i], glon[i], stl[i], 0., 0., ap[i]))
+
+    return out
@@ -9,9 +9,66 @@ Basic plotting tools
 **Modules**:
   * :mod:`models.igrf`: fortran subroutines
 
+**Functions**:
+  * :func:`models.igrf.igrfArr`: field at arbitrary points
+
 """
 
 try:
     from igrf import *
 except Exception, e:
     print __file__+' -> igrf: ', e
+
+
+def igrfArr(dates, lat, lon, alt, itype=1, isv=0):
+    """Evaluate IGRF at arbitrary points in a single call (the underlying fortran loop 
+    runs without holding the GIL). Points are sorted by date so that the coefficients are 
+    only interpolated once per distinct date.
+
+    **Args**:
+        * **dates** (datetime, float or list): date(s) as datetime objects or decimal years
+        * **lat** (float or array): latitude(s) [degrees]
+        * **lon** (float or array): longitude(s) [degrees]
+        * **alt** (float or array): altitude(s) [km] (distance from the center of the Earth if itype=2)
+        * [**itype**] (int): 1 for geodetic, 2 for geocentric coordinates
+        * [**isv**] (int): 0 for main field, 1 for secular variation
+    **Returns**:
+        * **d** (numpy.ndarray): declination [degrees] (+ve east)
+        * **s** (numpy.ndarray): inclination [degrees] (+ve down)
+        * **h** (numpy.ndarray): horizontal intensity [nT]
+        * **x** (numpy.ndarray): north component [nT]
+        * **y** (numpy.ndarray): east component [nT]
+        * **z** (numpy.ndarray): vertical component [nT] (+ve down)
+        * **f** (numpy.ndarray): total intensity [nT] (1e8 for dates out of bounds)
+    **Example**:
+        ::
+
+            from models import igrf
+            d, s, h, x, y, z, f = igrf.igrfArr(dt.datetime(2012,7,5), lats, lons, 300.)
+
+    .. note:: with isv=1, x, y and z are in nT/year and d, s, h, f are meaningless.
+
+    """
+    from utils.timeUtils import dateToDecYear
+    import numpy as np
+
+    if not hasattr(dates, '__len__'): dates = [dates]
+    # Convert each distinct datetime only once
+    decYears = {}
+    for d in dates:
+        if hasattr(d, 'year') and d not in decYears: decYears[d] = dateToDecYear(d)
+    dates = np.array([decYears.get(d, d) for d in dates], dtype='float32')
+    lat, lon, alt = [np.atleast_1d(np.asarray(v, dtype='float64')) for v in [lat, lon, alt]]
+    nPnts = max(len(dates), len(lat), len(lon), len(alt))
+    dates, lat, lon, alt = [np.zeros(nPnts, dtype=v.dtype) + v for v in [dates, lat, lon, alt]]
+
+    order = np.argsort(dates, kind='mergesort')
+    x, y, z, f = [np.empty(nPnts) for _ in xrange(4)]
+    x[order], y[order], z[order], f[order] = igrf11synarr(isv, itype, dates[order], alt[order], 
+        90. - lat[order], np.mod(lon[order], 360.))
+
+    h = np.hypot(x, y)
+    d = np.degrees(np.arctan2(y, x))
+    s = np.degrees(np.arctan2(z, h))
+
+    return d, s, h, x, y, z, f
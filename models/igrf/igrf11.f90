@@ -588,12 +588,78 @@ c
       real date
 Cf2py intent(in) isv,date,itype,alt,colat,elong
 Cf2py intent(out) x,y,z,f
+      dimension gint(195)
+c
+      call igrf11coef (isv,date,gint,nmx)
+      if (nmx.eq.0) then
+       x     = 0.0
+       y     = 0.0
+       z     = 0.0
+       f     = 1.0d8
+       return
+      end if
+      call igrf11shc (itype,alt,colat,elong,nmx,gint,x,y,z,f)
+      return
+      end
+c
+      subroutine igrf11synarr (isv,itype,n,date,alt,colat,elong,
+     1                         x,y,z,f)
+c
+c     Array version of igrf11syn: synthesis at n arbitrary points.
+c     The coefficients are only interpolated when the date changes
+c     from one point to the next, so points should be sorted by date.
+c   INPUT
+c     isv, itype as in igrf11syn
+c     n     = number of points
+c     date, alt, colat, elong = one value per point, as in igrf11syn
+c   OUTPUT
+c     x, y, z, f = one value per point, as in igrf11syn
+c
+      implicit double precision (a-h,o-z)
+      real date(n)
+      dimension alt(n),colat(n),elong(n),x(n),y(n),z(n),f(n),gint(195)
+Cf2py threadsafe
+Cf2py intent(in) isv,itype,date,alt,colat,elong
+Cf2py integer intent(hide),depend(date) :: n=len(date)
+Cf2py intent(out) x,y,z,f
+c
+      nmx   = 0
+      do 1 i=1,n
+       if (i.eq.1.or.date(i).ne.date(i-1)) then
+        call igrf11coef (isv,date(i),gint,nmx)
+       end if
+       if (nmx.eq.0) then
+        x(i)  = 0.0
+        y(i)  = 0.0
+        z(i)  = 0.0
+        f(i)  = 1.0d8
+       else
+        call igrf11shc (itype,alt(i),colat(i),elong(i),nmx,gint,
+     1                  x(i),y(i),z(i),f(i))
+       end if
+    1 continue
+      return
+      end
+c
+      subroutine igrf11coef (isv,date,gint,nmx)
+c
+c     Interpolates (or extrapolates) the IGRF coefficients at a date.
+c   INPUT
+c     isv, date as in igrf11syn
+c   OUTPUT
+c     gint  = Schmidt quasi-normal coefficients (main field or secular
+c             variation), in the order used by igrf11shc
+c     nmx   = maximum degree of the coefficients (0 if date is out
+c             of bounds)
+c
+      implicit double precision (a-h,o-z)
+      real date
+      dimension gint(195)
       dimension gh(3256),g0(120),g1(120),g2(120),g3(120),g4(120),
      1          g5(120),g6(120),g7(120),g8(120),g9(120),ga(120),
      2          gb(120),gc(120),gd(120),ge(120),gf(120),gg(120),
      3          gi(120),gj(120),gk(195),gl(195),gm(195),gp(195),
-     4          gq(195),
-     5          p(105),q(105),cl(13),sl(13)
+     4          gq(195)
       equivalence (g0,gh(1)),(g1,gh(121)),(g2,gh(241)),(g3,gh(361)),
      1            (g4,gh(481)),(g5,gh(601)),(g6,gh(721)),(g7,gh(841)),
      2            (g8,gh(961)),(g9,gh(1081)),(ga,gh(1201)),
@@ -1006,11 +1072,6 @@ c
      a            -0.3,    0.4,    0.3,    0.1,    0.2,   -0.1,   -0.5,  2012
      b             0.4,    0.2,    0.4,115*0.0/                          2012
 c
-c     set initial values
-c
-      x     = 0.0
-      y     = 0.0
-      z     = 0.0
       if (date.lt.1900.0.or.date.gt.2020.0) go to 11
       if (date.gt.2015.0) write (6,960) date
   960 format (/' This version of the IGRF is intended for use up',
@@ -1028,7 +1089,6 @@ c
        nmx   = 10
        nc    = nmx*(nmx+2)
        ll    = nc*ll
-       kmx   = (nmx+1)*(nmx+2)/2
       else
        nmx   = 13
        nc    = nmx*(nmx+2)
@@ -1037,7 +1097,6 @@ c
 c     19 is the number of SH models that extend to degree 10
 c
        ll    = 120*19 + nc*ll
-       kmx   = (nmx+1)*(nmx+2)/2
       endif
       tc    = 1.0 - t
       if (isv.eq.1) then
@@ -1058,8 +1117,43 @@ c
       ll    = 2865
       nmx   = 13
       nc    = nmx*(nmx+2)
+c
+c     interpolated coefficients
+c
+    2 do 3 k=1,nc
+       gint(k) = tc*gh(ll+k) + t*gh(ll+k+nc)
+    3 continue
+      return
+c
+c     error return if date out of bounds
+c
+   11 nmx   = 0
+      write (6,961) date
+  961 format (/' This subroutine will not work with a date of',
+     1        f20.3,'.  Date must be in the range 1900.0.ge.date',
+     2        '.le.2020.0. On return f = 1.0d8., x = y = z = 0.')
+      return
+      end
+c
+      subroutine igrf11shc (itype,alt,colat,elong,nmx,gint,x,y,z,f)
+c
+c     Spherical harmonic synthesis of the field at one point.
+c   INPUT
+c     itype, alt, colat, elong as in igrf11syn
+c     nmx, gint as returned by igrf11coef
+c   OUTPUT
+c     x, y, z, f as in igrf11syn
+c
+      implicit double precision (a-h,o-z)
+      dimension gint(195),p(105),q(105),cl(13),sl(13)
+c
+c     set initial values
+c
+      x     = 0.0
+      y     = 0.0
+      z     = 0.0
       kmx   = (nmx+1)*(nmx+2)/2
-    2 r     = alt
+      r     = alt
       one   = colat*0.017453292
       ct    = cos(one)
       st    = sin(one)
@@ -1126,10 +1220,9 @@ c
 c
 c     synthesis of x, y and z in geocentric coordinates
 c
-    6  lm    = ll + l
-       one   = (tc*gh(lm) + t*gh(lm+nc))*rr                                     
+    6  one   = gint(l)*rr
        if (m.eq.0) go to 9                                                      
-       two   = (tc*gh(lm+1) + t*gh(lm+nc+1))*rr
+       two   = gint(l+1)*rr
        three = one*cl(m) + two*sl(m)
        x     = x + three*q(k)
        z     = z - (fn + 1.0)*three*p(k)
@@ -1152,14 +1245,5 @@ c
       f     = sqrt(x*x + y*y + z*z)
 c
       return
-c
-c     error return if date out of bounds
-c
-   11 f     = 1.0d8
-      write (6,961) date
-  961 format (/' This subroutine will not work with a date of',
-     1        f20.3,'.  Date must be in the range 1900.0.ge.date',
-     2        '.le.2020.0. On return f = 1.0d8., x = y = z = 0.')
-      return
       end
 
@@ -7,6 +7,12 @@
 
 **Modules**:
     * :mod:`iri`: fortran subroutines 
+
+**Functions**:
+    * :func:`models.iri.iriProfiles`: IRI profiles at many (lat, lon, time) points, computed in parallel
+
+**Classes**:
+    * :class:`models.iri.iriCache`: IRI profiles cached on a (lat, lon, time) lattice
     
 *******************************
 """
@@ -15,3 +21,353 @@ try:
       from iri import *
 except Exception, e:
       print __file__+' -> models.iri.iri: ', e
+
+
+def iriDefaultJf():
+    """Standard IRI option switches (see irisub.for), with messages turned off
+
+    **Returns**:
+        * **jf** (list): 50 booleans
+    """
+    jf = [True]*50
+    jf[3:6] = [False]*3
+    jf[20] = False
+    jf[22] = False
+    jf[27:30] = [False]*3
+    jf[32] = False
+    jf[33] = False
+    jf[34] = False
+    return jf
+
+
+def iriProfiles(lat, lon, times, heibeg=60., heiend=560., heistp=10., 
+    jf=None, jmag=0, oarr=None, nProcs=None):
+    """Compute IRI height profiles at many points. Identical (lat, lon, time) inputs are only 
+    computed once, and distinct ones are distributed over a pool of processes (IRI keeps 
+    its state in COMMON blocks and cannot be run from several threads).
+
+    **Args**:
+        * **lat** (float or array): latitude(s) [degrees]
+        * **lon** (float or array): longitude(s) [degrees]
+        * **times** (datetime or list): universal time(s)
+        * [**heibeg**] (float): first height [km]
+        * [**heiend**] (float): last height [km]
+        * [**heistp**] (float): height step [km] (at most 1000 heights)
+        * [**jf**] (list): 50 IRI option switches (defaults to :func:`iriDefaultJf`)
+        * [**jmag**] (int): 0 for geographic, 1 for geomagnetic coordinates
+        * [**oarr**] (list): 100 additional IRI inputs, used with some jf settings
+        * [**nProcs**] (int): number of processes (defaults to the number of CPUs, 1 runs serially)
+    **Returns**:
+        * **outf** (ndarray): (npoints, 20, nheights) IRI outputs (outf[:,0,:] is the electron density [m-3])
+        * **oarr** (ndarray): (npoints, 100) additional IRI outputs
+        * **heights** (ndarray): profile heights [km]
+    **Example**:
+        ::
+
+            from models import iri
+            outf, oarr, hgt = iri.iriProfiles(lats, lons, dates, 80., 500., 10.)
+            ne = outf[:,0,:]
+
+    """
+    from multiprocessing import Pool, cpu_count
+    import numpy as np
+
+    if jf is None: jf = iriDefaultJf()
+    if oarr is None: oarr = np.zeros(100)
+    nhei = min(int(abs(heiend - heibeg)/abs(heistp)) + 1, 1000)
+    heights = heibeg + heistp*np.arange(nhei)
+
+    lat, lon, times = _iriInputs(lat, lon, times)
+    nPnts = len(lat)
+
+    # Only compute each distinct input once
+    keys = {}
+    inverse = np.empty(nPnts, dtype='int')
+    for ip in xrange(nPnts):
+        t = times[ip]
+        key = (lat[ip], lon[ip], t.year, t.month*100 + t.day, 
+            t.hour + t.minute/60. + (t.second + t.microsecond*1e-6)/3600. + 25.)
+        inverse[ip] = keys.setdefault(key, len(keys))
+    tasks = [None]*len(keys)
+    for key, ik in keys.items():
+        tasks[ik] = (jf, jmag) + key + (heibeg, heiend, heistp, oarr, nhei)
+
+    if nProcs is None: nProcs = cpu_count()
+    nProcs = min(nProcs, len(tasks))
+    if nProcs > 1:
+        pool = Pool(nProcs)
+        try:
+            results = pool.map(_iriProfile, tasks, chunksize=max(1, len(tasks)//(4*nProcs)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_iriProfile, tasks)
+
+    outf = np.array([r[0] for r in results])[inverse]
+    oarrOut = np.array([r[1] for r in results])[inverse]
+    return outf, oarrOut, heights
+
+
+class iriCache(object):
+    """Least-recently-used cache of IRI profiles computed on a (latitude, longitude, time) 
+    lattice, bounded in memory and optionally backed by a directory of .npz files so that 
+    profiles can be shared between processes and sessions. Requested points are snapped to 
+    the nearest lattice node, or linearly interpolated between the surrounding nodes when 
+    approximation is allowed. Missing nodes are computed in one call to :func:`iriProfiles`.
+
+    **Args**:
+        * [**dLat**] (float): lattice latitude step [degrees]
+        * [**dLon**] (float): lattice longitude step [degrees]
+        * [**dTime**] (float): lattice time step [s]
+        * [**heibeg**], [**heiend**], [**heistp**], [**jf**], [**jmag**], [**oarr**]: IRI settings, as in :func:`iriProfiles`
+        * [**maxBytes**] (int): maximum size of the profiles kept in memory [bytes]
+        * [**cacheDir**] (str): directory where profiles are saved (no disk cache if None)
+        * [**nProcs**] (int): number of processes used to compute missing profiles
+    **Members**:
+        * **heights** (numpy.ndarray): profile heights [km]
+        * **hits** (int): number of lattice nodes served from memory
+        * **diskHits** (int): number of lattice nodes served from the disk cache
+        * **misses** (int): number of lattice nodes that had to be computed
+    **Methods**:
+        * :func:`iriCache.get`
+        * :func:`iriCache.clear`
+        * :func:`iriCache.stats`
+    **Example**:
+        ::
+
+            cache = models.iri.iriCache(dLat=0.5, dLon=0.5, dTime=900., cacheDir='/tmp/iri')
+            outf, oarr, hgt = cache.get(lats, lons, dates, approx=True)
+            ne = outf[:,0,:]
+
+    """
+    def __init__(self, dLat=0.5, dLon=0.5, dTime=900., 
+        heibeg=60., heiend=560., heistp=10., jf=None, jmag=0, oarr=None, 
+        maxBytes=2**27, cacheDir=None, nProcs=None):
+        from collections import OrderedDict
+        import numpy as np
+        import hashlib
+        import os
+
+        self.dLat = float(dLat)
+        self.dLon = float(dLon)
+        self.dTime = float(dTime)
+        self.heibeg, self.heiend, self.heistp = heibeg, heiend, heistp
+        self.jf = iriDefaultJf() if jf is None else list(jf)
+        self.jmag = jmag
+        self.oarr = np.zeros(100) if oarr is None else np.asarray(oarr, dtype='float')
+        nhei = min(int(abs(heiend - heibeg)/abs(heistp)) + 1, 1000)
+        self.heights = heibeg + heistp*np.arange(nhei)
+        self.maxBytes = maxBytes
+        self.cacheDir = cacheDir
+        self.nProcs = nProcs
+        if cacheDir and not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+        # Number of longitude nodes around the globe, and largest latitude node
+        self._nLon = int(round(360./self.dLon))
+        self._iLatMax = int(np.floor(90./self.dLat + 1e-9))
+
+        # Disk entries are only shared between caches with the same settings
+        h = hashlib.sha1()
+        h.update( repr((self.dLat, self.dLon, self.dTime, float(heibeg), float(heiend), float(heistp), 
+            [bool(j) for j in self.jf], int(jmag))) )
+        h.update( np.ascontiguousarray(self.oarr, dtype='float64').tostring() )
+        self._prefix = 'iri.{}'.format(h.hexdigest()[:16])
+
+        self._profiles = OrderedDict()
+        self._nBytes = 0
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+
+    def get(self, lat, lon, times, approx=False):
+        """IRI profiles at the given points, computing only the lattice nodes not already cached
+
+        **Args**:
+            * **lat**, **lon**, **times**: as in :func:`iriProfiles`
+            * [**approx**] (bool): linearly interpolate between the surrounding lattice nodes 
+              instead of using the nearest one
+        **Returns**:
+            * **outf** (numpy.ndarray): (npoints, 20, nheights) IRI outputs
+            * **oarr** (numpy.ndarray): (npoints, 100) additional IRI outputs (of the nearest lattice node)
+            * **heights** (numpy.ndarray): profile heights [km]
+        """
+        from utils.timeUtils import datetimeToEpoch
+        import numpy as np
+
+        lat, lon, times = _iriInputs(lat, lon, times)
+        x = [lat/self.dLat, lon/self.dLon, 
+            np.array([datetimeToEpoch(t) for t in times])/self.dTime]
+
+        # Lattice indices and weights of the nodes contributing to each point
+        near = [np.round(xi).astype('int') for xi in x]
+        if approx:
+            i0 = [np.floor(xi).astype('int') for xi in x]
+            w1 = [xi - ii for xi, ii in zip(x, i0)]
+            corners = []
+            for c in xrange(8):
+                bits = [(c >> k) & 1 for k in xrange(3)]
+                inds = [ii + b for ii, b in zip(i0, bits)]
+                w = np.ones(len(lat))
+                for b, wi in zip(bits, w1):
+                    w *= wi if b else 1. - wi
+                corners.append((inds, w))
+        else:
+            corners = [(near, np.ones(len(lat)))]
+
+        # Unique nodes, then the cached (or freshly computed) profiles of each
+        nodes = {}
+        cInds = []
+        for inds, w in corners:
+            iLat = np.clip(inds[0], -self._iLatMax, self._iLatMax)
+            iLon = inds[1] % self._nLon
+            cInds.append( np.array([nodes.setdefault(k, len(nodes)) 
+                for k in zip(iLat.tolist(), iLon.tolist(), inds[2].tolist())], dtype='int') )
+        iNear = cInds[0] if not approx else np.array([nodes[k] for k in 
+            zip(np.clip(near[0], -self._iLatMax, self._iLatMax).tolist(), 
+                (near[1] % self._nLon).tolist(), near[2].tolist())], dtype='int')
+        keys = sorted(nodes, key=nodes.get)
+        profiles = self._fetch(keys)
+        nodeOutf = np.array([p[0] for p in profiles])
+        nodeOarr = np.array([p[1] for p in profiles])
+
+        outf = np.zeros((len(lat),) + nodeOutf.shape[1:])
+        for (inds, w), ic in zip(corners, cInds):
+            outf += w[:, np.newaxis, np.newaxis]*nodeOutf[ic]
+
+        return outf, nodeOarr[iNear], self.heights
+
+
+    def _fetch(self, keys):
+        """Profiles at the given lattice nodes, from memory, disk, or IRI (in that order)
+        """
+        from datetime import datetime, timedelta
+        import numpy as np
+        import os
+
+        out = [None]*len(keys)
+        missing = []
+        for ik, key in enumerate(keys):
+            # In memory: move entry to the most recently used end
+            if key in self._profiles:
+                self.hits += 1
+                out[ik] = self._profiles.pop(key)
+                self._profiles[key] = out[ik]
+                continue
+
+            # On disk
+            if self.cacheDir:
+                fName = self._fileName(key)
+                if os.path.isfile(fName):
+                    try:
+                        with np.load(fName) as f:
+                            out[ik] = (f['outf'], f['oarr'])
+                        self.diskHits += 1
+                        self._store(key, out[ik])
+                        continue
+                    except Exception as e:
+                        print 'iriCache: could not read {}: {}'.format(fName, e)
+            missing.append(ik)
+
+        # Compute all missing nodes at once
+        if missing:
+            self.misses += len(missing)
+            lats = [keys[ik][0]*self.dLat for ik in missing]
+            lons = [keys[ik][1]*self.dLon for ik in missing]
+            dates = [datetime(1970, 1, 1) + timedelta(seconds=keys[ik][2]*self.dTime) for ik in missing]
+            outf, oarr, _ = iriProfiles(lats, lons, dates, self.heibeg, self.heiend, self.heistp, 
+                jf=self.jf, jmag=self.jmag, oarr=self.oarr, nProcs=self.nProcs)
+            for i, ik in enumerate(missing):
+                out[ik] = (outf[i], oarr[i])
+                if self.cacheDir:
+                    # Write to a temporary file first so that concurrent readers never see partial files
+                    fName = self._fileName(keys[ik])
+                    tmpName = '{}.{}.tmp'.format(fName, os.getpid())
+                    with open(tmpName, 'wb') as f:
+                        np.savez(f, outf=outf[i], oarr=oarr[i])
+                    os.rename(tmpName, fName)
+                self._store(keys[ik], out[ik])
+
+        return out
+
+
+    def _fileName(self, key):
+        """Disk cache file of a lattice node
+        """
+        import os
+
+        return os.path.join(self.cacheDir, '{}.{}_{}_{}.npz'.format(self._prefix, *key))
+
+
+    def _store(self, key, profile):
+        """Add a profile to the in-memory cache, evicting the least recently used ones if needed
+        """
+        for p in profile:
+            p.setflags(write=False)
+        self._profiles[key] = profile
+        self._nBytes += sum(p.nbytes for p in profile)
+        while self._nBytes > self.maxBytes and len(self._profiles) > 1:
+            _, old = self._profiles.popitem(last=False)
+            self._nBytes -= sum(p.nbytes for p in old)
+
+
+    def clear(self, disk=False):
+        """Empty the cache and reset counters
+
+        **Args**:
+            * [**disk**] (bool): also remove the saved profiles (with the same settings) from cacheDir
+        """
+        import os
+        import glob
+
+        self._profiles.clear()
+        self._nBytes = 0
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        if disk and self.cacheDir:
+            for fName in glob.glob(os.path.join(self.cacheDir, '{}.*.npz'.format(self._prefix))):
+                os.remove(fName)
+
+
+    def stats(self):
+        """Cache usage statistics
+
+        **Returns**:
+            * **stats** (dict): hits, diskHits, misses, current number of in-memory profiles and their size [bytes]
+        """
+        return {'hits': self.hits, 
+                'diskHits': self.diskHits, 
+                'misses': self.misses, 
+                'size': len(self._profiles), 
+                'nBytes': self._nBytes}
+
+
+def _iriInputs(lat, lon, times):
+    """Broadcast scalar or array positions and times to one element per point
+    """
+    import numpy as np
+
+    lat = np.atleast_1d(np.asarray(lat, dtype='float'))
+    lon = np.atleast_1d(np.asarray(lon, dtype='float'))
+    if not hasattr(times, '__len__'): times = [times]
+    nPnts = max(len(lat), len(lon), len(times))
+    lat = np.zeros(nPnts) + lat
+    lon = np.zeros(nPnts) + lon
+    if len(times) == 1: times = list(times)*nPnts
+    assert len(times) == nPnts, 'times must be a datetime or have one element per point'
+
+    return lat, lon, times
+
+
+def _iriProfile(args):
+    """Compute a single IRI profile (module-level so that it can be sent to a process pool)
+    """
+    import numpy as np
+
+    jf, jmag, alati, along, iyyyy, mmdd, dhour, heibeg, heiend, heistp, oarr, nhei = args
+    outf, oarr = iri_sub(jf, jmag, alati, along, iyyyy, mmdd, dhour, 
+        heibeg, heiend, heistp, np.array(oarr, dtype='float32'))
+    return np.array(outf[:, :nhei]), np.array(oarr)
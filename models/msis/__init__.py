@@ -38,6 +38,11 @@ This module contains the following functions:
       * **D(9)** - Anomalous oxygen number density(CM-3)
       * **T(1)** - exospheric temperature
       * **T(2)** - temperature at ALT
+
+  * :func:`models.msis.getF107Ap`: F107 and AP at a given time
+  * :func:`models.msis.getF107ApArr`: F107 and AP at many times
+  * :func:`models.msis.getMsisInputs`: gtd7 inputs at many times and positions
+  * :func:`models.msis.gtd7Arr`: gtd7 at many points, computed in parallel
   
 """
 
@@ -68,72 +73,246 @@ Obtain F107 and AP required for MSIS input from tabulated values in IRI data.
       * (7) Average of eight 3 hour AP indicies from 36 to 57 hrs prior to current time
 
   """
-  from models import iri
   from datetime import datetime
-  from numpy import mean, floor
-  
-  # Get current path to IRI module
-  path = iri.__file__.partition('__init__.py')[0]
-  
-  # open apf107.dat file
-  with open('{}apf107.dat'.format(path), 'r') as fileh:
-    data = []
-    for line in fileh:
-      data.append(line)
-
-  # read into array 
-  # (cannot use genfromtext because some columns are not separated by anything)
-  tdate = []
-  tap = []
-  tapd = []
-  tf107 = []
-  tf107a = []
-  tf107y = []
-  for ldat in data:
-    yy = int(ldat[1:3])
-    year = 1900+yy if (yy >= 58) else 2000+yy
-    tdate.append( datetime(year, int(ldat[4:6]), int(ldat[7:9])).date() )
-    ttap = []
-    for iap in xrange(8):
-      ttap.append( int(ldat[9+3*iap:9+3*iap+4]) )
-    tap.append( ttap )
-    tapd.append( int(ldat[33:36]) )
-    tf107.append( float(ldat[39:44]) )
-    tf107a.append( float(ldat[44:49]) )
-    tf107y.append( float(ldat[49:54]) )
+
+  table = _apf107Table()
 
   # Get required datetime
   dictOut = {}
   if mydatetime is None:
-    dictOut['datetime'] = datetime(tdate[-1].year, tdate[-1].month, tdate[-1].day)
-  elif mydatetime.date() <= tdate[-1]:
-    dictOut['datetime'] = mydatetime
+    last = datetime.fromordinal(table['day0'] + len(table['f107']) - 1)
+    dictOut['datetime'] = datetime(last.year, last.month, last.day)
   else:
+    dictOut['datetime'] = mydatetime
+
+  out = getF107ApArr([dictOut['datetime']])
+  if out['f107'][0] != out['f107'][0]:
     print 'Invalid date {}'.format(mydatetime)
-    print 'Date must be in range {} to {}'.format(tdate[0],tdate[-1])
+    print 'Date must be in range {} to {}'.format(datetime.fromordinal(table['day0'] + 3).date(), 
+      datetime.fromordinal(table['day0'] + len(table['f107']) - 1).date())
     return
 
-  # Find entry for date
-  dtInd = tdate.index(dictOut['datetime'].date())
-  # Find hour index
-  hrInd = int( floor( dictOut['datetime'].hour/3. ) )
-
-  # f107 output
-  dictOut['f107'] = tf107[dtInd-1]
-  dictOut['f107a'] = tf107a[dtInd]
-
-  # AP output
-  ttap = [ tap[dtInd][hrInd-i] for i in range(hrInd+1) ]
-  for id in xrange(3):
-    for ih in xrange(8):
-      ttap.append(tap[dtInd-id-1][-ih-1])
-  dictOut['ap'] = [ tapd[dtInd], 
-                    ttap[0], 
-                    ttap[1], 
-                    ttap[2], 
-                    ttap[3], 
-                    mean(ttap[4:13]), 
-                    mean(ttap[13:26])
-                  ]
+  dictOut['f107'] = out['f107'][0]
+  dictOut['f107a'] = out['f107a'][0]
+  dictOut['ap'] = out['ap'][0].tolist()
+
+  return dictOut
+
+
+def getF107ApArr(times):
+  """
+Vectorized version of getF107Ap: F107 and AP for many times at once.
+
+* **INPUT**:
+  * times: list (or array) of python datetime objects
+
+* **OUTPUT**:
+  * dictOut: a dictionnary containing:
+    * f107: (n) array of daily f10.7 flux for previous day
+    * f107a: (n) array of 81 day average of f10.7 flux (centered on date)
+    * ap: (n, 7) array of magnetic indices, as in getF107Ap
+    
+  Times outside of the tabulated range (or less than 3 days after its start) are set to NaN.
+
+  """
+  import numpy as np
+
+  table = _apf107Table()
+  nDays = len(table['f107'])
+
+  # Day index (the table has one line per day) and 3-hour index of each time
+  iDay = np.array([t.toordinal() for t in times], dtype='int') - table['day0']
+  valid = (iDay >= 3) & (iDay < nDays)
+  iDay = np.where(valid, iDay, 3)
+  k = iDay*8 + np.array([t.hour//3 for t in times], dtype='int')
+
+  # Averages over windows of 3-hour values from their cumulative sum
+  ap3 = table['ap3']
+  csum = np.concatenate([[0], np.cumsum(ap3)])
+
+  ap = np.empty((len(iDay), 7))
+  ap[:, 0] = table['apd'][iDay]
+  for i in xrange(4):
+    ap[:, i+1] = ap3[k - i]
+  ap[:, 5] = (csum[k - 3] - csum[k - 11])/8.
+  ap[:, 6] = (csum[k - 11] - csum[k - 19])/8.
+
+  dictOut = {'f107': table['f107'][iDay - 1], 
+             'f107a': table['f107a'][iDay], 
+             'ap': ap}
+  for v in dictOut.values():
+    v[~valid] = np.nan
+
+  return dictOut
+
+
+_apf107 = None
+
+def _apf107Table():
+  """
+Tabulated F107 and AP from the IRI apf107.dat file, parsed once per session (and again 
+only if the data file changes).
+
+* **OUTPUT**:
+  * table: a dictionnary containing:
+    * day0: ordinal of the first tabulated day
+    * ap3: (ndays*8) array of 3-hour AP indices
+    * apd: (ndays) array of daily AP
+    * f107, f107a, f107y: (ndays) arrays of daily, 81-day and 365-day F10.7
+
+  """
+  global _apf107
+  from models import iri
+  from datetime import date
+  import numpy as np
+  import os
+
+  # Get current path to IRI module
+  path = iri.__file__.partition('__init__.py')[0]
+  datName = '{}apf107.dat'.format(path)
+  mtime = os.path.getmtime(datName)
+  if _apf107 is not None and _apf107['mtime'] == mtime:
+    return _apf107
+
+  # Fixed-width columns (FORMAT(3I3,9I3,I3,3F5.1) in irifun.for), not always separated by blanks
+  data = np.genfromtxt(datName, delimiter=[3]*3 + [3]*9 + [3] + [5]*3, 
+    dtype=[('yy', 'i4'), ('mm', 'i4'), ('dd', 'i4'), ('ap3', 'i4', 8), ('apd', 'i4'), ('flag', 'i4'), 
+      ('f107', 'f8'), ('f107a', 'f8'), ('f107y', 'f8')])
+
+  year = np.where(data['yy'] >= 58, 1900, 2000) + data['yy']
+  days = np.array([date(y, m, d).toordinal() for y, m, d in zip(year, data['mm'], data['dd'])])
+  assert np.all(np.diff(days) == 1), '{} must have one line per day'.format(datName)
+
+  _apf107 = {'mtime': mtime, 
+             'day0': days[0], 
+             'ap3': data['ap3'].ravel().astype('float'), 
+             'apd': data['apd'].astype('float'), 
+             'f107': data['f107'], 
+             'f107a': data['f107a'], 
+             'f107y': data['f107y']}
+
+  return _apf107
+
+
+def getMsisInputs(times, glat, glon, alt, f107=None, f107a=None, ap=None):
+  """
+Build the per-point inputs of gtd7 (and hwm07) from arrays of times and positions.
+
+* **INPUT**:
+  * times: python datetime object or list of datetime objects (UT)
+  * glat: geodetic latitude(s) (DEG)
+  * glon: geodetic longitude(s) (DEG)
+  * alt: altitude(s) (KM)
+  * [f107, f107a, ap]: override the tabulated F107, F107A (scalar or one per point) 
+    and AP (7 values, or (n, 7) array); by default they are obtained with getF107ApArr
+
+* **OUTPUT**:
+  * dictOut: a dictionnary of arrays with one element (or row for ap) per point:
+    iyd, sec, alt, glat, glon, stl, f107a, f107, ap
+
+  """
+  import numpy as np
+
+  if not hasattr(times, '__len__'): times = [times]
+  glat, glon, alt = [np.atleast_1d(np.asarray(v, dtype='float')) for v in [glat, glon, alt]]
+  nPnts = max(len(times), len(glat), len(glon), len(alt))
+  if len(times) == 1: times = list(times)*nPnts
+  assert len(times) == nPnts, 'times must be a datetime or have one element per point'
+
+  # Only look up and convert distinct times
+  uTimes = {}
+  iTime = np.array([uTimes.setdefault(t, len(uTimes)) for t in times], dtype='int')
+  uTimes = sorted(uTimes, key=uTimes.get)
+  iyd = np.array([(t.year % 100)*1000 + t.timetuple().tm_yday for t in uTimes], dtype='int')
+  sec = np.array([t.hour*3600. + t.minute*60. + t.second + t.microsecond*1e-6 for t in uTimes])
+
+  dictOut = {'iyd': iyd[iTime], 
+             'sec': sec[iTime], 
+             'alt': np.zeros(nPnts) + alt, 
+             'glat': np.zeros(nPnts) + glat, 
+             'glon': np.zeros(nPnts) + glon}
+  dictOut['stl'] = np.mod(dictOut['sec']/3600. + dictOut['glon']/15., 24.)
+
+  if f107 is None or f107a is None or ap is None:
+    solar = getF107ApArr(uTimes)
+  dictOut['f107'] = np.zeros(nPnts) + (solar['f107'][iTime] if f107 is None else f107)
+  dictOut['f107a'] = np.zeros(nPnts) + (solar['f107a'][iTime] if f107a is None else f107a)
+  dictOut['ap'] = np.zeros((nPnts, 7)) + (solar['ap'][iTime] if ap is None else ap)
 
   return dictOut
+
+
+# Fields of the structured arrays returned by gtd7Arr
+_gtd7Dtype = [('He', 'f4'), ('O', 'f4'), ('N2', 'f4'), ('O2', 'f4'), ('Ar', 'f4'), 
+  ('rho', 'f4'), ('H', 'f4'), ('N', 'f4'), ('Oanom', 'f4'), ('Texo', 'f4'), ('T', 'f4')]
+
+def gtd7Arr(times, glat, glon, alt, mass=48, f107=None, f107a=None, ap=None, 
+  nProcs=None, chunkSize=10000):
+  """
+Evaluate MSIS (gtd7) at many points. F107 and AP are filled in from the tabulated values 
+(see getF107ApArr) unless given, and the points are evaluated in chunks over a pool of 
+processes (MSIS keeps its state in COMMON blocks and is not thread-safe).
+
+* **INPUT**:
+  * times, glat, glon, alt, [f107, f107a, ap]: as in getMsisInputs
+  * [mass]: mass number, as in gtd7 (48 for all)
+  * [nProcs]: number of processes (defaults to the number of CPUs, 1 runs serially)
+  * [chunkSize]: number of points evaluated by each task
+
+* **OUTPUT**:
+  * out: structured array with one element per point and fields He, O, N2, O2, Ar, rho, H, N, 
+    Oanom (D(1) to D(9) of gtd7), Texo and T (T(1) and T(2)). Units follow the setting of 
+    meters (CGS by default). The 7 element AP array is only used with tselec switch 9 set to -1.
+
+* **EXAMPLE**:
+  ::
+
+    from models import msis
+    out = msis.gtd7Arr(dt.datetime(2012,7,5,12,35), 40., -80., np.linspace(0., 500., 100))
+    plot(out['T'], out['N2'])
+
+  """
+  from multiprocessing import Pool, cpu_count
+  import numpy as np
+
+  inp = getMsisInputs(times, glat, glon, alt, f107=f107, f107a=f107a, ap=ap)
+  nPnts = len(inp['iyd'])
+  tasks = [tuple(inp[k][i0:i0+chunkSize] for k in 
+      ['iyd', 'sec', 'alt', 'glat', 'glon', 'stl', 'f107a', 'f107', 'ap']) + (mass,) 
+    for i0 in xrange(0, nPnts, chunkSize)]
+
+  if nProcs is None: nProcs = cpu_count()
+  nProcs = min(nProcs, len(tasks))
+  if nProcs > 1:
+    pool = Pool(nProcs)
+    try:
+      results = pool.map(_gtd7Chunk, tasks)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    results = map(_gtd7Chunk, tasks)
+
+  out = np.empty(nPnts, dtype=_gtd7Dtype)
+  i0 = 0
+  for r in results:
+    out[i0:i0+len(r)] = r
+    i0 += len(r)
+
+  return out
+
+
+def _gtd7Chunk(args):
+  """
+Evaluate gtd7 at a chunk of points (module-level so that it can be sent to a process pool)
+
+  """
+  import numpy as np
+
+  iyd, sec, alt, glat, glon, stl, f107a, f107, ap, mass = args
+  out = np.empty(len(iyd), dtype=_gtd7Dtype)
+  for i in xrange(len(iyd)):
+    d, t = gtd7(iyd[i], sec[i], alt[i], glat[i], glon[i], stl[i], f107a[i], f107[i], ap[i], mass)
+    out[i] = tuple(d) + tuple(t)
+
+  return out
@@ -0,0 +1,79 @@
+! Copyright (C) 2012  VT SuperDARN Lab
+! Full license can be found in LICENSE.txt
+! ***********************************************************************************
+! ***********************************************************************************
+! Library version of the ray tracing code (no MPI, no files)
+! ***********************************************************************************
+!
+! These subroutines are wrapped with f2py (see rtLib.pyf) so that the ray tracing
+! can be driven directly from python. One call to RT_EDENS generates the electron
+! density background along a given azimuth, and each call to RT_RAY then traces
+! one ray through that background.
+! Parallelization is left to the caller (see models.raydarn.rt).
+!
+! ***********************************************************************************
+! ***********************************************************************************
+
+
+! *************************************************************************
+! Generates the electron density background along a given azimuth (see IRI_ARR),
+! on the day of the UT time of the given hour (see IRI_DATE)
+! *************************************************************************
+SUBROUTINE RT_EDENS(txlat, txlon, year, mmdd, hour, azim, hmf2, nmf2, edensARR, edensTHT, dip)
+
+    use constants
+    implicit none
+    real*4,intent(in)::                         txlat, txlon, hour, azim, hmf2, nmf2
+    integer,intent(in)::                        year, mmdd
+    real*4,dimension(500,500),intent(out)::     edensARR
+    real*4,dimension(500),intent(out)::         edensTHT
+    real*4,dimension(500,2),intent(out)::       dip
+
+    real*4::        edensPOS(500,2), irihour
+    integer::       iriyear, irimmdd
+    type(prm)::     params
+
+    params%txlat = txlat
+    params%txlon = txlon
+    params%year = year
+    params%mmdd = mmdd
+    params%hmf2 = hmf2
+    params%nmf2 = nmf2
+
+    CALL IRI_DATE(params, hour, iriyear, irimmdd, irihour)
+    params%year = iriyear
+    params%mmdd = irimmdd
+    CALL IRI_ARR(params, irihour, azim, edensARR, edensPOS, edensTHT, dip)
+
+END SUBROUTINE RT_EDENS
+
+
+! *************************************************************************
+! Traces one ray through a given electron density background (see TRACE_RAY)
+! *************************************************************************
+SUBROUTINE RT_RAY(txlat, txlon, freq, nhop, hour, azim, elev, edensARR, edensTHT, dip, &
+                    nrstep, rsave, thsave, grpsave, nrsave, ngs, ranout, naspstep, ionosout)
+
+    use constants
+    implicit none
+    real*4,intent(in)::                         txlat, txlon, freq, hour, azim, elev
+    integer,intent(in)::                        nhop
+    real*4,dimension(500,500),intent(in)::      edensARR
+    real*4,dimension(500),intent(in)::          edensTHT
+    real*4,dimension(500,2),intent(in)::        dip
+    integer,intent(out)::                       nrstep, ngs, naspstep
+    real*4,dimension(5000),intent(out)::        rsave, thsave, grpsave, nrsave
+    real*4,dimension(8,nhop),intent(out)::      ranout
+    real*4,dimension(9,5000),intent(out)::      ionosout
+
+    type(prm)::     params
+
+    params%txlat = txlat
+    params%txlon = txlon
+    params%freq = freq
+    params%nhop = nhop
+
+    CALL TRACE_RAY(params, hour, azim, elev, edensARR, edensTHT, dip, &
+                    nrstep, rsave, thsave, grpsave, nrsave, ngs, ranout, naspstep, ionosout)
+
+END SUBROUTINE RT_RAY
@@ -14,6 +14,8 @@ This module runs the raytracing code
 
 .. note:: The ray tracing requires mpi to run. You can adjust the number of processors, but be wise about it and do not assign more than you have
 
+.. note:: Alternatively, the ray tracing can run in-process (backend='lib'), without mpi or temporary files, using the f2py-wrapped library rtLib and a python process pool
+
 """
 
 #########################################################################
@@ -38,11 +40,17 @@ class RtRun(object):
         * [**debug**] (bool): print some diagnostics of the fortran run and output processing
         * [**fext**] (str): output file id, max 10 character long (mostly used for multiple users environments, like a website)
         * [**loadFrom**] (str): file name where a pickled instance of RtRun was saved (supersedes all other args)
-        * [**nprocs**] (int): number of processes to use with MPI
+        * [**nprocs**] (int): number of processes to use with MPI (or in the process pool with backend='lib')
+        * [**backend**] (str): 'mpi' to run the fortran executable with mpiexec and read its output files, or 'lib' to run the fortran library in a process pool and keep the results in memory
+        * [**cacheDir**] (str): directory where each traced hour is saved (compressed arrays), keyed on a hash of the run parameters and of the IRI version; 
+          hours already there are not traced again, even from runs with a different time range (requires backend='lib')
+        * [**stream**] (bool): do not trace anything yet; hours are then traced and consumed one at a time with :func:`RtRun.iterHours` (requires backend='lib'). 
+          :func:`RtRun.readRays`, :func:`RtRun.readEdens` and :func:`RtRun.readScatter` are not available in this mode
     **Methods**:
         * :func:`RtRun.readRays`
         * :func:`RtRun.readEdens`
         * :func:`RtRun.readScatter`
+        * :func:`RtRun.iterHours`
         * :func:`RtRun.save`
         * :func:`RtRun.load`
 
@@ -55,6 +63,12 @@ class RtRun(object):
             radar = 'bks'
             # Save the results to your /tmp directory
             rto = raydarn.RtRun(sTime, eTime, rCode=radar, outDir='/tmp')
+            # Same run in-process, reusing hours traced by previous runs
+            rto = raydarn.RtRun(sTime, eTime, rCode=radar, backend='lib', cacheDir='/tmp/rtcache')
+            # Trace a whole day, keeping only the ground scatter of each hour
+            rto = raydarn.RtRun(sTime, sTime + dt.timedelta(days=1), rCode=radar, backend='lib', stream=True)
+            for rtime, gs in rto.iterHours(reduce=raydarn.gsReduce):
+                print rtime, gs['gran'].min()
 
     """
     def __init__(self, sTime=None, eTime=None, 
@@ -67,7 +81,10 @@ class RtRun(object):
         debug=False, 
         fext=None, 
         loadFrom=None, 
-        nprocs=4):
+        nprocs=4, 
+        backend='mpi', 
+        cacheDir=None, 
+        stream=False):
         import datetime as dt
         from os import path
         from pydarn import radar
@@ -126,11 +143,59 @@ class RtRun(object):
             self.outDir = path.join( outDir, '' )
             self.fExt = '0' if not fext else fext
 
-            # Write input file
-            inputFile = self._genInput()
-            
             # Run the ray tracing
-            success = self._execute(nprocs, inputFile, debug=debug)
+            assert (backend in ['mpi', 'lib']), 'Unknown backend %s' % backend
+            assert (not cacheDir or backend == 'lib'), 'cacheDir requires the lib backend'
+            assert (not stream or backend == 'lib'), 'stream requires the lib backend'
+            self.backend = backend
+            self.stream = stream
+            if stream:
+                # Settings for iterHours
+                self._nprocs = nprocs
+                self._cacheDir = cacheDir
+            elif self.backend == 'lib':
+                success = self._executeLib(nprocs, debug=debug, cacheDir=cacheDir)
+            else:
+                # Write input file
+                inputFile = self._genInput()
+                success = self._execute(nprocs, inputFile, debug=debug)
+
+
+    def _genParams(self):
+        """Generate run parameters, as read by the fortran code
+
+        **Returns**:
+            * **params** (OrderedDict): run parameters, in the order of the input file
+        """
+        from collections import OrderedDict
+
+        # Real values are read by the fortran code with 2 decimals
+        r2 = lambda v: float( "{:8.2f}".format(v) )
+        hourbeg = self.time[0].hour + self.time[0].minute/60.
+        hourbeg += 25.
+        hourend = self.time[1].hour + self.time[1].minute/60.
+        hourend += (self.time[1].day - self.time[0].day) * 24.
+        hourend += 25.
+        params = OrderedDict([
+            ('txlat', r2(self.site.geolat)), 
+            ('txlon', r2(self.site.geolon)), 
+            ('azimbeg', r2(self.azim[0])), 
+            ('azimend', r2(self.azim[1])), 
+            ('azimstp', r2(self.azim[2])), 
+            ('elevbeg', r2(self.elev[0])), 
+            ('elevend', r2(self.elev[1])), 
+            ('elevstp', r2(self.elev[2])), 
+            ('freq', r2(self.freq)), 
+            ('nhop', int(self.nhops)), 
+            ('year', self.time[0].year), 
+            ('mmdd', self.time[0].month*100 + self.time[0].day), 
+            ('hourbeg', r2(hourbeg)), 
+            ('hourend', r2(hourend)), 
+            ('hourstp', r2(self.dTime)), 
+            ('hmf2', r2(self.hmf2)), 
+            ('nmf2', r2(self.nmf2)) ])
+
+        return params
 
 
     def _genInput(self):
@@ -138,30 +203,29 @@ class RtRun(object):
         """
         from os import path
 
+        labels = ['Transmitter latitude (degrees N)', 
+            'Transmitter Longitude (degrees E', 
+            'Azimuth (degrees E) (begin)', 
+            'Azimuth (degrees E) (end)', 
+            'Azimuth (degrees E) (step)', 
+            'Elevation angle (begin)', 
+            'Elevation angle (end)', 
+            'Elevation angle (step)', 
+            'Frequency (Mhz)', 
+            'nubmer of hops (minimum 1)', 
+            'Year (yyyy)', 
+            'Month and day (mmdd)', 
+            'hour (add 25 for UT) (begin)', 
+            'hour (add 25 for UT) (end)', 
+            'hour (step)', 
+            'hmf2 (km, if 0 then ignored)', 
+            'nmf2 (log10, if 0 then ignored)']
+
         fname = path.join(self.outDir, 'rtrun.{}.inp'.format(self.fExt))
         with open(fname, 'w') as f:
-            f.write( "{:8.2f}  Transmitter latitude (degrees N)\n".format( self.site.geolat ) )
-            f.write( "{:8.2f}  Transmitter Longitude (degrees E\n".format( self.site.geolon ) )
-            f.write( "{:8.2f}  Azimuth (degrees E) (begin)\n".format( self.azim[0] ) )
-            f.write( "{:8.2f}  Azimuth (degrees E) (end)\n".format( self.azim[1] ) )
-            f.write( "{:8.2f}  Azimuth (degrees E) (step)\n".format( self.azim[2] ) )
-            f.write( "{:8.2f}  Elevation angle (begin)\n".format( self.elev[0] ) )
-            f.write( "{:8.2f}  Elevation angle (end)\n".format( self.elev[1] ) )
-            f.write( "{:8.2f}  Elevation angle (step)\n".format( self.elev[2] ) )
-            f.write( "{:8.2f}  Frequency (Mhz)\n".format( self.freq ) )
-            f.write( "{:8d}  nubmer of hops (minimum 1)\n".format( self.nhops) )
-            f.write( "{:8d}  Year (yyyy)\n".format( self.time[0].year ) )
-            f.write( "{:8d}  Month and day (mmdd)\n".format( self.time[0].month*100 + self.time[0].day ) )
-            tt = self.time[0].hour + self.time[0].minute/60.
-            tt += 25.
-            f.write( "{:8.2f}  hour (add 25 for UT) (begin)\n".format( tt ) )
-            tt = self.time[1].hour + self.time[1].minute/60.
-            tt += (self.time[1].day - self.time[0].day) * 24.
-            tt += 25.
-            f.write( "{:8.2f}  hour (add 25 for UT) (end)\n".format( tt ) )
-            f.write( "{:8.2f}  hour (step)\n".format( self.dTime ) )
-            f.write( "{:8.2f}  hmf2 (km, if 0 then ignored)\n".format( self.hmf2 ) )
-            f.write( "{:8.2f}  nmf2 (log10, if 0 then ignored)\n".format( self.nmf2 ) )
+            for v, label in zip(self._genParams().values(), labels):
+                strFmt = "{:8d}" if isinstance(v, int) else "{:8.2f}"
+                f.write( (strFmt+"  {}\n").format( v, label ) )
 
         return fname
         
@@ -194,6 +258,172 @@ class RtRun(object):
             return True
 
 
+    def _libGrid(self):
+        """Run parameters, output header and loop values of the fortran code
+
+        **Returns**:
+            * **params** (OrderedDict): run parameters (see :func:`RtRun._genParams`)
+            * **header** (OrderedDict): header, as written at the beginning of each fortran output file
+            * **hours**, **azims**, **elevs** (list): values of the time, azimuth and elevation loops
+        """
+        from collections import OrderedDict
+        import numpy as np
+
+        params = self._genParams()
+        f4 = np.float32
+
+        # Number of iterations of each loop (as in the fortran code)
+        nelev = int(round( (f4(params['elevend']) - f4(params['elevbeg']))/f4(params['elevstp']) )) + 1
+        nazim = int(round( (f4(params['azimend']) - f4(params['azimbeg']))/f4(params['azimstp']) )) + 1
+        nhour = int(round( (f4(params['hourend']) - f4(params['hourbeg']))/f4(params['hourstp']) )) + 1
+        if params['hourend'] < params['hourbeg']:
+            nhour = int(round( (24. - f4(params['hourbeg']) + f4(params['hourend']))/f4(params['hourstp']) )) + 1
+        if params['hourend'] == params['hourbeg']:
+            nhour = int(round( 24./f4(params['hourstp']) )) + 1
+
+        # Header, as written at the beginning of each fortran output file
+        header = OrderedDict( zip( ('nhour', 'nazim', 'nelev'), (nhour, nazim, nelev) ) )
+        for k, v in zip(('tlat', 'tlon', 'saz', 'eaz', 'daz', 'sel', 'eel', 'del', 'freq'), 
+                params.values()[:9]):
+            header[k] = float(f4(v))
+        for k in ('nhop', 'year', 'mmdd'):
+            header[k] = params[k]
+        for k, v in zip(('shour', 'ehour', 'dhour', 'hmf2', 'nmf2'), 
+                params.values()[12:]):
+            header[k] = float(f4(v))
+
+        # Loop values
+        hrbase = 49. if params['hourbeg'] >= 25. else 24.
+        hours = _rtSteps(params['hourbeg'], params['hourend'], params['hourstp'], nhour, base=hrbase)
+        azims = _rtSteps(params['azimbeg'], params['azimend'], params['azimstp'], nazim)
+        elevs = _rtSteps(params['elevbeg'], params['elevend'], params['elevstp'], nelev)
+
+        return params, header, hours, azims, elevs
+
+
+    def _executeLib(self, nprocs, debug=False, cacheDir=None):
+        """Execute raytracing in-process, with the fortran library rtLib
+
+        Each (hour, azimuth) pair is traced independently (electron density
+        background, then all elevations) in a pool of nprocs processes.
+        The output is kept in memory, as flat single precision arrays laid out
+        as the fortran files.
+        With a cacheDir, hours are first looked up there, and newly traced
+        hours are saved there.
+        """
+        from multiprocessing import Pool
+        import numpy as np
+        import time
+
+        params, header, hours, azims, elevs = self._libGrid()
+
+        # Hours already traced
+        out = [None]*len(hours)
+        if cacheDir:
+            cacheFiles = [_rtCacheFile(cacheDir, params, hr, azims, elevs) for hr in hours]
+            out = [_rtCacheLoad(fName, hr) for fName, hr in zip(cacheFiles, hours)]
+        todo = [ih for ih in range(len(hours)) if out[ih] is None]
+        tasks = [(params, hours[ih], az, elevs) for ih in todo for az in azims]
+
+        t0 = time.time()
+        nprocs = max(min(nprocs, len(tasks)), 1)
+        if nprocs > 1:
+            pool = Pool(nprocs)
+            try:
+                results = pool.map(_rtTrace, tasks, 1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(_rtTrace, tasks)
+        if debug:
+            print 'Traced {} hours x {} azimuths x {} elevations with {} processes in {:.3f} s ({} hours from cache)'.format(
+                len(todo), len(azims), len(elevs), nprocs, time.time() - t0, len(hours) - len(todo))
+
+        # Gather the azimuths of each new hour (and save them)
+        for n, ih in enumerate(todo):
+            out[ih] = _rtConcat( results[n*len(azims):(n+1)*len(azims)] )
+            if cacheDir:
+                _rtCacheSave(cacheFiles[ih], out[ih])
+
+        # Same layout as the body of the fortran output files
+        self._output = _rtConcat(out)
+        self._output['header'] = header
+
+        return True
+
+
+    def iterHours(self, reduce=None, nprocs=None, cacheDir=None, debug=False):
+        """Trace the run one hour (time step) at a time, in a pool of processes, 
+        and yield each hour as soon as it (and all the previous ones) are done. 
+        At most nprocs hours are traced ahead of the consumer, so that no more than 
+        nprocs + 1 hours of output (or their reductions) are held in memory at once.
+
+        **Args**:
+            * [**reduce**] (function): called on the output of each hour in the worker 
+              processes, so that only its result is sent back (must be a module-level function, 
+              such as :func:`gsReduce`)
+            * [**nprocs**] (int): number of processes (defaults to nprocs given to :class:`RtRun`)
+            * [**cacheDir**] (str): cache directory (defaults to cacheDir given to :class:`RtRun`)
+            * [**debug**] (bool): print some diagnostics
+        **Returns**:
+            * yields (**time**, **out**) for each hour, where out is reduce(output), or the output 
+              itself (which can be read with :class:`Rays`, :class:`Edens` and :class:`Scatter`) 
+              if reduce is None
+        **Example**:
+            ::
+
+                rto = raydarn.RtRun(sTime, eTime, rCode='bks', backend='lib', stream=True)
+                for rtime, out in rto.iterHours():
+                    scatter = raydarn.Scatter(out, out, site=rto.site)
+
+        .. note:: hours are distributed over the processes, each tracing all the azimuths of one hour
+        """
+        from multiprocessing import Pool
+        from collections import deque
+        from itertools import islice
+        import time
+
+        if nprocs is None: nprocs = getattr(self, '_nprocs', 4)
+        if cacheDir is None: cacheDir = getattr(self, '_cacheDir', None)
+
+        params, header, hours, azims, elevs = self._libGrid()
+        tasks = [(params, header, hr, azims, elevs, 
+            _rtCacheFile(cacheDir, params, hr, azims, elevs) if cacheDir else None, 
+            reduce) for hr in hours]
+
+        t0 = time.time()
+        nprocs = max(min(nprocs, len(tasks)), 1)
+        if nprocs > 1:
+            pool = Pool(nprocs)
+            done = False
+            try:
+                # Keep nprocs hours in flight, and wait on the oldest one
+                todo = iter(zip(hours, tasks))
+                pending = deque( (hr, pool.apply_async(_rtHour, (task,))) 
+                    for hr, task in islice(todo, nprocs) )
+                while pending:
+                    hr, res = pending.popleft()
+                    out = res.get()
+                    for nhr, ntask in islice(todo, 1):
+                        pending.append( (nhr, pool.apply_async(_rtHour, (ntask,))) )
+                    if debug:
+                        print 'Hour {} done after {:.3f} s'.format(hr, time.time() - t0)
+                    yield _hourToTime(header, hr), out
+                done = True
+            finally:
+                # Stop the remaining hours if the consumer stops early
+                if not done: pool.terminate()
+                else: pool.close()
+                pool.join()
+        else:
+            for hr, task in zip(hours, tasks):
+                out = _rtHour(task)
+                if debug:
+                    print 'Hour {} done after {:.3f} s'.format(hr, time.time() - t0)
+                yield _hourToTime(header, hr), out
+
+
     def readRays(self, saveToAscii=None, debug=False):
         """Read rays.dat fortran output into dictionnary
 
@@ -206,6 +436,14 @@ class RtRun(object):
         import subprocess as subp
         from os import path
 
+        # In-memory output
+        assert (not getattr(self, 'stream', False)), 'Nothing traced in stream mode: use iterHours()'
+        if getattr(self, 'backend', 'mpi') == 'lib':
+            self.rays = Rays(self._output, 
+                site=self.site, radar=self.radar,
+                saveToAscii=saveToAscii, debug=debug)
+            return
+
         # File name and path
         fName = path.join(self.outDir, 'rays.{}.dat'.format(self.fExt))
         if hasattr(self, 'rays') and not path.exists(fName):
@@ -232,6 +470,14 @@ class RtRun(object):
         import subprocess as subp
         from os import path
 
+        # In-memory output
+        assert (not getattr(self, 'stream', False)), 'Nothing traced in stream mode: use iterHours()'
+        if getattr(self, 'backend', 'mpi') == 'lib':
+            self.ionos = Edens(self._output, 
+                site=self.site, radar=self.radar,
+                debug=debug)
+            return
+
         # File name and path
         fName = path.join(self.outDir, 'edens.{}.dat'.format(self.fExt))
         if hasattr(self, 'ionos') and not path.exists(fName):
@@ -258,6 +504,14 @@ class RtRun(object):
         import subprocess as subp
         from os import path
 
+        # In-memory output
+        assert (not getattr(self, 'stream', False)), 'Nothing traced in stream mode: use iterHours()'
+        if getattr(self, 'backend', 'mpi') == 'lib':
+            self.scatter = Scatter(self._output, self._output, 
+                site=self.site, radar=self.radar,
+                debug=debug)
+            return
+
         # File name and path
         isName = path.join(self.outDir, 'iscat.{}.dat'.format(self.fExt))
         gsName = path.join(self.outDir, 'gscat.{}.dat'.format(self.fExt))
@@ -310,6 +564,9 @@ class RtRun(object):
         import subprocess as subp
         from os import path
 
+        # Nothing written to disk by the library backend
+        if getattr(self, 'backend', 'mpi') == 'lib': return
+
         files = ['rays', 'edens', 'gscat', 'iscat']
         for f in files:
             fName = path.join(self.outDir, '{}.{}.dat'.format(f, self.fExt))
@@ -323,10 +580,16 @@ class Edens(object):
     """Store and process electron density profiles after ray tracing
 
     **Args**:
-        * **readFrom** (str): edens.dat file to read the rays from
+        * **readFrom** (str or dict): edens.dat file to read the rays from (or in-memory output of :func:`RtRun._executeLib`)
         * [**site**] (:class:`pydarn.radar.site): radar site object
         * [**radar**] (:class:`pydarn.radar.radar): radar object
         * [**debug**] (bool): verbose mode
+    **Attributes**:
+        * **rec** (numpy.ndarray): one record per profile (time, beam, hour, azim)
+        * **th** (numpy.ndarray): ground range [rad] of each profile, shape (nrec, 250)
+        * **nel** (numpy.ndarray): electron densities [m^-3] of each profile, shape (nrec, 250 altitudes, 250 ranges)
+        * **dip** (numpy.ndarray): magnetic dip and declination [degrees] of each profile, shape (nrec, 250, 2)
+        * **edens** (dict): nested view edens[time][beam] of the profiles (built on first access)
     **Methods**:
         * :func:`Edens.readEdens`
         * :func:`Edens.plot`
@@ -335,7 +598,6 @@ class Edens(object):
         site=None, radar=None, 
         debug=False):
         self.readFrom = readFrom
-        self.edens = {}
 
         self.name = ''
         if radar:
@@ -352,43 +614,38 @@ class Edens(object):
             * [**site**] (pydarn.radar.radStrict.site): site object of current radar
             * [**debug**] (bool): print some i/o diagnostics
         **Returns**:
-            * Populate member edens :class:`rt.Edens`
+            * Populate members rec, th, nel and dip :class:`rt.Edens`
         """
-        from struct import unpack
-        import datetime as dt
-        from numpy import array
-
-        # Read binary file
-        with open(self.readFrom, 'rb') as f:
-            if debug:
-                print self.readFrom+' header: '
-            self.header = _readHeader(f, debug=debug)
-            self.edens = {}
-            while True:
-                bytes = f.read(2*4)
-                # Check for eof
-                if not bytes: break
-                # read hour and azimuth
-                hour, azim = unpack('2f', bytes)
-                # format time index
-                hour = hour - 25.
-                mm = self.header['mmdd']/100
-                dd = self.header['mmdd'] - mm*100
-                rtime = dt.datetime(self.header['year'], mm, dd) + dt.timedelta(hours=hour)
-                # format azimuth index (beam)
-                raz = site.azimToBeam(azim) if site else round(raz, 2)
-                # Initialize dicts
-                if rtime not in self.edens.keys(): self.edens[rtime] = {}
-                self.edens[rtime][raz] = {}
-                # Read edens dict
-                # self.edens[rtime][raz]['pos'] = array( unpack('{}f'.format(250*2), 
-                #     f.read(250*2*4)) )
-                self.edens[rtime][raz]['th'] = array( unpack('{}f'.format(250), 
-                    f.read(250*4)) )
-                self.edens[rtime][raz]['nel'] = array( unpack('{}f'.format(250*250), 
-                    f.read(250*250*4)) ).reshape((250,250), order='F')
-                self.edens[rtime][raz]['dip'] = array( unpack('{}f'.format(250*2), 
-                    f.read(250*2*4)) ).reshape((250,2), order='F')
+        import numpy as np
+
+        self.header, buf = _readBody(self.readFrom, 'edens', debug=debug)
+
+        # Fixed-size records: hour, azimuth, th(250), nel(250,250), dip(250,2)
+        # (2D arrays are in fortran order)
+        nth = 250
+        buf = buf.reshape((-1, 2 + nth + nth*nth + nth*2))
+        self.rec = np.empty(buf.shape[0], dtype=_recDtype)
+        self.rec['hour'] = buf[:,0]
+        self.rec['azim'] = buf[:,1]
+        _recKeys(self.rec, self.header, site=site)
+        self.th = buf[:,2:2+nth]
+        self.nel = buf[:,2+nth:2+nth+nth*nth].reshape((-1, nth, nth)).transpose((0, 2, 1))
+        self.dip = buf[:,2+nth+nth*nth:].reshape((-1, 2, nth)).transpose((0, 2, 1))
+        self._edens = None
+
+
+    @property
+    def edens(self):
+        """Nested view edens[time][beam] of the electron density profiles (built on first access)
+        """
+        if self._edens is None:
+            self._edens = {}
+            for i, (rtime, raz) in enumerate( zip(self.rec['time'], self.rec['beam']) ):
+                self._edens.setdefault(rtime, {})[raz] = {
+                    'th': self.th[i], 
+                    'nel': self.nel[i], 
+                    'dip': self.dip[i] }
+        return self._edens
 
 
     def plot(self, time, beam=None, maxground=2000, maxalt=500,
@@ -423,11 +680,15 @@ class Edens(object):
                 rto.readEdens() # read electron density into memory
                 ax, aax, cbax = rto.ionos.plot(sTime, title=True)
                 ax.grid()
+                # Animation frame: only the densities are updated
+                ax, aax, cbax = rto.ionos.plot(sTime + dt.timedelta(minutes=15), ax=ax, aax=aax)
+
+        .. note:: when called again with the same axes, the existing mesh is updated 
+            instead of drawing a new one. The curved-Earth mesh of each beam is only computed once.
                 
         written by Sebastien, 2013-04
         """
         from utils import plotUtils
-        from matplotlib.collections import LineCollection
         import matplotlib.pyplot as plt
         import numpy as np
 
@@ -450,19 +711,47 @@ class Edens(object):
         else:
             beam = self.edens[time].keys()[0]
 
-        X, Y = np.meshgrid(self.edens[time][beam]['th'], ax.Re + np.linspace(60,560,250))
-        im = aax.pcolormesh(X, Y, np.log10( self.edens[time][beam]['nel'] ), 
-            vmin=nel_lim[0], vmax=nel_lim[1], cmap=nel_cmap)
+        # Curved-Earth mesh (projected once per beam and axes)
+        if not hasattr(ax, 'nelMeshes'): ax.nelMeshes = {}
+        th = self.edens[time][beam]['th']
+        if beam not in ax.nelMeshes or not np.array_equal(ax.nelMeshes[beam][0], th):
+            X, Y = np.meshgrid(th, ax.Re + np.linspace(60,560,250))
+            xy = aax.transAux.transform( np.array([X.ravel(), Y.ravel()]).T )
+            ax.nelMeshes[beam] = (th, xy[:,0].reshape(X.shape), xy[:,1].reshape(X.shape))
+        th, X, Y = ax.nelMeshes[beam]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            nel = np.ma.masked_invalid( np.log10( self.edens[time][beam]['nel'] ) )
+
+        im = getattr(ax, 'nelMesh', None)
+        if im is not None and im.axes is aax and getattr(ax, 'nelTh', None) is th:
+            # Same axes and mesh: only update the densities
+            im.set_array( nel[:-1,:-1].ravel() )
+        else:
+            if im is not None and im.axes is aax: im.remove()
+            im = aax.pcolormesh(X, Y, nel, transform=ax.transData, 
+                vmin=nel_lim[0], vmax=nel_lim[1], cmap=nel_cmap)
+            ax.nelMesh, ax.nelTh = im, th
+
+            # Add a colorbar, or attach the existing one to the new mesh
+            if getattr(ax, 'nelCb', None) is None:
+                ax.nelCbax = plotUtils.addColorbar(im, ax)
+                ax.nelCb = im.colorbar
+                ax.nelCb.set_label(r"N$_{el}$ [$\log_{10}(m^{-3})$]")
+            else:
+                _updateColorbar(ax.nelCb, im)
+
+        # Color scale (the colorbar is only redrawn if it changes)
+        if im.get_clim() != tuple(nel_lim) or im.get_cmap().name != plt.get_cmap(nel_cmap).name:
+            im.set_cmap(nel_cmap)
+            im.set_clim(*nel_lim)
+            _updateColorbar(ax.nelCb, im)
+        cbax = ax.nelCbax
 
         # Plot title with date ut time and local time
         if title:
             stitle = _getTitle(time, beam, self.header, None)
             ax.set_title( stitle )
 
-        # Add a colorbar
-        cbax = plotUtils.addColorbar(im, ax)
-        _ = cbax.set_ylabel(r"N$_{el}$ [$\log_{10}(m^{-3})$]")
-
         ax.beam = beam
         return ax, aax, cbax
 
@@ -474,29 +763,41 @@ class Scatter(object):
     """Stores and process ground and ionospheric scatter
 
     **Args**:
-        * **readISFrom** (str): iscat.dat file to read the ionospheric scatter from
-        * **readGSFrom** (str): gscat.dat file to read the ground scatter from
+        * **readISFrom** (str or dict): iscat.dat file to read the ionospheric scatter from (or in-memory output of :func:`RtRun._executeLib`)
+        * **readGSFrom** (str or dict): gscat.dat file to read the ground scatter from (or in-memory output of :func:`RtRun._executeLib`)
         * [**site**] (:class:`pydarn.radar.site): radar site object
         * [**debug**] (bool): verbose mode
+    **Attributes**:
+        * **gsRec** (numpy.ndarray): one record per ground scatter (time, beam, hour, azim, elev, r, th, gran, lat, lon)
+        * **isRec** (numpy.ndarray): one record per ray (time, beam, hour, azim, elev, nstp, ind)
+        * **isSteps** (numpy.ndarray): ionospheric scatter of all rays (r, th, gran, rel, w, nr, lat, lon, h); 
+          the scatter of ray i is isSteps[isRec['ind'][i]:isRec['ind'][i]+isRec['nstp'][i]]
+        * **gsc**, **isc** (dict): nested views [time][beam][elevation] of the ground and ionospheric scatter (built on first access)
     **Methods**:
         * :func:`Scatter.readGS`
         * :func:`Scatter.readIS`
+        * :func:`Scatter.gsRti`
         * :func:`Scatter.plot`
     """
     def __init__(self, readGSFrom=None, readISFrom=None, 
         site=None, radar=None, 
         debug=False):
+        import numpy as np
+
         self.readISFrom = readISFrom
         self.readGSFrom = readGSFrom
+        self.gsRec = np.empty(0, dtype=_gsDtype)
+        self.isRec = np.empty(0, dtype=_stpDtype)
+        self.isSteps = np.empty(0, dtype=[(k, 'f4') for k in _isNames])
+        self._gsc = None
+        self._isc = None
 
         # Read ground scatter
         if self.readGSFrom:
-            self.gsc = {}
             self.readGS(site=site, debug=debug)
 
         # Read ionospheric scatter
         if self.readISFrom:
-            self.isc = {}
             self.readIS(site=site, debug=debug)
 
 
@@ -507,50 +808,19 @@ class Scatter(object):
             * [**site**] (pydarn.radar.radStrict.site): site object of current radar
             * [**debug**] (bool): print some i/o diagnostics
         **Returns**:
-            * Populate member isc :class:`rt.Scatter`
+            * Populate member gsRec :class:`rt.Scatter`
         """
-        from struct import unpack
-        import datetime as dt
         import numpy as np
 
-        with open(self.readGSFrom, 'rb') as f:
-            # read header
-            if debug:
-                print self.readGSFrom+' header: '
-            self.header = _readHeader(f, debug=debug)
-            # Then read ray data, one ray at a time
-            while True:
-                bytes = f.read(3*4)
-                # Check for eof
-                if not bytes: break
-                # read number of ray steps, time, azimuth and elevation
-                rhr, raz, rel = unpack('3f', bytes)
-                # Read reminder of the record
-                rr, tht, gran, lat, lon  = unpack('5f', f.read(5*4))
-                # Convert azimuth to beam number
-                raz = site.azimToBeam(raz) if site else np.round(raz, 2)
-                # Adjust rel to 2 decimal
-                rel = np.around(rel, 2)
-                # convert time to python datetime
-                rhr = rhr - 25.
-                mm = self.header['mmdd']/100
-                dd = self.header['mmdd'] - mm*100
-                rtime = dt.datetime(self.header['year'], mm, dd) + dt.timedelta(hours=rhr)
-                # Create new entries in rays dict
-                if rtime not in self.gsc.keys(): self.gsc[rtime] = {}
-                if raz not in self.gsc[rtime].keys(): self.gsc[rtime][raz] = {}
-                if rel not in self.gsc[rtime][raz].keys(): 
-                    self.gsc[rtime][raz][rel] = {
-                        'r': np.empty(0),
-                        'th': np.empty(0),
-                        'gran': np.empty(0),
-                        'lat': np.empty(0),
-                        'lon': np.empty(0) }
-                self.gsc[rtime][raz][rel]['r'] = np.append( self.gsc[rtime][raz][rel]['r'], rr )
-                self.gsc[rtime][raz][rel]['th'] = np.append( self.gsc[rtime][raz][rel]['th'], tht )
-                self.gsc[rtime][raz][rel]['gran'] = np.append( self.gsc[rtime][raz][rel]['gran'], gran )
-                self.gsc[rtime][raz][rel]['lat'] = np.append( self.gsc[rtime][raz][rel]['lat'], lat )
-                self.gsc[rtime][raz][rel]['lon'] = np.append( self.gsc[rtime][raz][rel]['lon'], lon )
+        self.header, buf = _readBody(self.readGSFrom, 'gscat', debug=debug)
+
+        # Fixed-size records: hour, azimuth, elevation, r, th, gran, lat, lon
+        buf = buf.reshape((-1, len(_gsNames)))
+        self.gsRec = np.empty(buf.shape[0], dtype=_gsDtype)
+        for i, k in enumerate(_gsNames):
+            self.gsRec[k] = buf[:,i]
+        _recKeys(self.gsRec, self.header, site=site)
+        self._gsc = None
 
 
     def readIS(self, site=None, debug=False):
@@ -560,58 +830,61 @@ class Scatter(object):
             * [**site**] (pydarn.radar.radStrict.site): site object of current radar
             * [**debug**] (bool): print some i/o diagnostics
         **Returns**:
-            * Populate member isc :class:`rt.Scatter`
+            * Populate members isRec and isSteps :class:`rt.Scatter`
         """
-        from struct import unpack
-        import datetime as dt
-        from numpy import around, array
-
-        with open(self.readISFrom, 'rb') as f:
-            # read header
-            if debug:
-                print self.readISFrom+' header: '
-            self.header = _readHeader(f, debug=debug)
-            # Then read ray data, one ray at a time
-            while True:
-                bytes = f.read(4*4)
-                # Check for eof
-                if not bytes: break
-                # read number of ray steps, time, azimuth and elevation
-                nstp, rhr, raz, rel = unpack('4f', bytes)
-                nstp = int(nstp)
-                # Convert azimuth to beam number
-                raz = site.azimToBeam(raz) if site else around(raz, 2)
-                # Adjust rel to 2 decimal
-                rel = around(rel, 2)
-                # convert time to python datetime
-                rhr = rhr - 25.
-                mm = self.header['mmdd']/100
-                dd = self.header['mmdd'] - mm*100
-                rtime = dt.datetime(self.header['year'], mm, dd) + dt.timedelta(hours=rhr)
-                # Create new entries in rays dict
-                if rtime not in self.isc.keys(): self.isc[rtime] = {}
-                if raz not in self.isc[rtime].keys(): self.isc[rtime][raz] = {}
-                self.isc[rtime][raz][rel] = {}
-                # Read to paths dict
-                self.isc[rtime][raz][rel]['nstp'] = nstp
-                self.isc[rtime][raz][rel]['r'] = array( unpack('{}f'.format(nstp), 
-                    f.read(nstp*4)) )
-                self.isc[rtime][raz][rel]['th'] = array( unpack('{}f'.format(nstp), 
-                    f.read(nstp*4)) )
-                self.isc[rtime][raz][rel]['gran'] = array( unpack('{}f'.format(nstp), 
-                    f.read(nstp*4)) )
-                self.isc[rtime][raz][rel]['rel'] = array( unpack('{}f'.format(nstp), 
-                    f.read(nstp*4)) )
-                self.isc[rtime][raz][rel]['w'] = array( unpack('{}f'.format(nstp), 
-                    f.read(nstp*4)) )
-                self.isc[rtime][raz][rel]['nr'] = array( unpack('{}f'.format(nstp), 
-                    f.read(nstp*4)) )
-                self.isc[rtime][raz][rel]['lat'] = array( unpack('{}f'.format(nstp), 
-                    f.read(nstp*4)) )
-                self.isc[rtime][raz][rel]['lon'] = array( unpack('{}f'.format(nstp), 
-                    f.read(nstp*4)) )
-                self.isc[rtime][raz][rel]['h'] = array( unpack('{}f'.format(nstp), 
-                    f.read(nstp*4)) )
+        self.header, buf = _readBody(self.readISFrom, 'iscat', debug=debug)
+
+        self.isRec, self.isSteps = _splitRecords(buf, _isNames)
+        _recKeys(self.isRec, self.header, site=site)
+        self._isc = None
+
+
+    def gsRti(self, site=None, **kwargs):
+        """Bin the ground scatter into (time, beam, range gate) arrays (see :func:`gsRti`)
+
+        **Args**:
+            * [**site**] (pydarn.radar.radStrict.site): site object of current radar
+            * [**kwargs**]: frang, rsep, recrise, nbeams, ngates (see :func:`gsRti`)
+        **Returns**:
+            * **times** (list): datetime of each time bin
+            * **beams** (numpy.ndarray): beam number (or azimuth if no site) of each beam bin
+            * **counts** (numpy.ndarray): number of ground scatter returns in each (time, beam, gate)
+            * **power** (numpy.ndarray): relative ground scatter power in each (time, beam, gate)
+        """
+        return gsRti(self.gsRec, header=self.header, site=site, **kwargs)
+
+
+    @property
+    def gsc(self):
+        """Nested view gsc[time][beam][elevation] of the ground scatter (built on first access)
+        """
+        import numpy as np
+
+        if self._gsc is None:
+            # Group records (one per hop) by ray
+            groups = {}
+            rels = np.around(self.gsRec['elev'].astype(float), 2)
+            for i, (rtime, raz, rel) in enumerate( zip(self.gsRec['time'], self.gsRec['beam'], rels) ):
+                groups.setdefault(rtime, {}).setdefault(raz, {}).setdefault(rel, []).append(i)
+            self._gsc = groups
+            for rtime in groups.keys():
+                for raz in groups[rtime].keys():
+                    for rel, inds in groups[rtime][raz].items():
+                        groups[rtime][raz][rel] = dict( (k, self.gsRec[k][inds]) 
+                            for k in ['r', 'th', 'gran', 'lat', 'lon'] )
+        return self._gsc
+
+
+    @property
+    def isc(self):
+        """Nested view isc[time][beam][elevation] of the ionospheric scatter (built on first access)
+        """
+        import numpy as np
+
+        if self._isc is None:
+            self._isc = _nestSteps(self.isRec, self.isSteps, 'nstp', 
+                np.around(self.isRec['elev'].astype(float), 2))
+        return self._isc
 
 
     def plot(self, time, beam=None, maxground=2000, maxalt=500,
@@ -729,11 +1002,16 @@ class Rays(object):
     """Store and process individual rays after ray tracing
 
     **Args**:
-        * **readFrom** (str): rays.dat file to read the rays from
+        * **readFrom** (str or dict): rays.dat file to read the rays from (or in-memory output of :func:`RtRun._executeLib`)
         * [**site**] (:class:`pydarn.radar.site): radar site object
         * [**radar**] (:class:`pydarn.radar.radar): radar object
         * [**saveToAscii**] (str): file name where to output ray positions
         * [**debug**] (bool): verbose mode
+    **Attributes**:
+        * **rec** (numpy.ndarray): one record per ray (time, beam, hour, azim, elev, nstp, ind)
+        * **steps** (numpy.ndarray): steps of all rays (r, th, gran, nr); 
+          the steps of ray i are steps[rec['ind'][i]:rec['ind'][i]+rec['nstp'][i]]
+        * **paths** (dict): nested view paths[time][beam][elevation] of the rays (built on first access)
     **Methods**:
         * :func:`Rays.readRays`
         * :func:`Rays.writeToAscii`
@@ -743,7 +1021,6 @@ class Rays(object):
         site=None, radar=None, 
         saveToAscii=None, debug=False):
         self.readFrom = readFrom
-        self.paths = {}
 
         self.name = ''
         if radar:
@@ -764,49 +1041,23 @@ class Rays(object):
             * [**site**] (pydarn.radar.radStrict.site): site object of current radar
             * [**debug**] (bool): print some i/o diagnostics
         **Returns**:
-            * Populate member paths :class:`rt.Rays`
+            * Populate members rec and steps :class:`rt.Rays`
         """
-        from struct import unpack
-        import datetime as dt
-        from numpy import round, array
-
-        # Read binary file
-        with open(self.readFrom, 'rb') as f:
-            # read header
-            if debug:
-                print self.readFrom+' header: '
-            self.header = _readHeader(f, debug=debug)
-            # Then read ray data, one ray at a time
-            while True:
-                bytes = f.read(4*4)
-                # Check for eof
-                if not bytes: break
-                # read number of ray steps, time, azimuth and elevation
-                nrstep, rhr, raz, rel = unpack('4f', bytes)
-                nrstep = int(nrstep)
-                # Convert azimuth to beam number
-                raz = site.azimToBeam(raz) if site else round(raz, 2)
-                # convert time to python datetime
-                rhr = rhr - 25.
-                mm = self.header['mmdd']/100
-                dd = self.header['mmdd'] - mm*100
-                rtime = dt.datetime(self.header['year'], mm, dd) + dt.timedelta(hours=rhr)
-                # Create new entries in rays dict
-                if rtime not in self.paths.keys(): self.paths[rtime] = {}
-                if raz not in self.paths[rtime].keys(): self.paths[rtime][raz] = {}
-                self.paths[rtime][raz][rel] = {}
-                # Read to paths dict
-                self.paths[rtime][raz][rel]['nrstep'] = nrstep
-                self.paths[rtime][raz][rel]['r'] = array( unpack('{}f'.format(nrstep), 
-                    f.read(nrstep*4)) )
-                self.paths[rtime][raz][rel]['th'] = array( unpack('{}f'.format(nrstep), 
-                    f.read(nrstep*4)) )
-                self.paths[rtime][raz][rel]['gran'] = array( unpack('{}f'.format(nrstep), 
-                    f.read(nrstep*4)) )
-                # self.paths[rtime][raz][rel]['pran'] = array( unpack('{}f'.format(nrstep), 
-                #     f.read(nrstep*4)) )
-                self.paths[rtime][raz][rel]['nr'] = array( unpack('{}f'.format(nrstep), 
-                    f.read(nrstep*4)) )
+        self.header, buf = _readBody(self.readFrom, 'rays', debug=debug)
+
+        self.rec, self.steps = _splitRecords(buf, _rayNames)
+        _recKeys(self.rec, self.header, site=site)
+        self._paths = None
+
+
+    @property
+    def paths(self):
+        """Nested view paths[time][beam][elevation] of the rays (built on first access)
+        """
+        if self._paths is None:
+            self._paths = _nestSteps(self.rec, self.steps, 'nrstep', 
+                self.rec['elev'].astype(float))
+        return self._paths
 
 
     def writeToAscii(self, fname):
@@ -875,6 +1126,12 @@ class Rays(object):
                 rto.readRays() # read rays into memory
                 ax, aax, cbax = rto.rays.plot(sTime, step=10, showrefract=True, nr_lim=[.85,1])
                 ax.grid()
+                # Animation frame: only the ray paths are updated
+                ax, aax, cbax = rto.rays.plot(sTime + dt.timedelta(minutes=15), step=10, 
+                    showrefract=True, nr_lim=[.85,1], ax=ax, aax=aax)
+
+        .. note:: all rays are drawn as a single collection, projected on the curved Earth once. 
+            When called again with the same axes, the existing collection is updated instead of drawing a new one.
                 
         written by Sebastien, 2013-04
         """
@@ -902,30 +1159,64 @@ class Rays(object):
             assert (beam in self.paths[time].keys()), 'Unkown beam %s' % beam
         else:
             beam = self.paths[time].keys()[0]
-        
-        for ir, (el, rays) in enumerate( sorted(self.paths[time][beam].items()) ):
-            if not ir % step:
-                if not showrefract:
-                    aax.plot(rays['th'], rays['r']*1e-3, c=raycolor, 
-                        zorder=zorder, alpha=alpha)
-                else:
-                    points = np.array([rays['th'], rays['r']*1e-3]).T.reshape(-1, 1, 2)
-                    segments = np.concatenate([points[:-1], points[1:]], axis=1)
-                    lcol = LineCollection( segments, zorder=zorder, alpha=alpha)
-                    _ = lcol.set_cmap( nr_cmap )
-                    _ = lcol.set_norm( plt.Normalize(*nr_lim) )
-                    _ = lcol.set_array( rays['nr'] )
-                    _ = aax.add_collection( lcol )
+
+        # Every step-th ray, by increasing elevation
+        inds = np.flatnonzero( (self.rec['time'] == time) & (self.rec['beam'] == beam) )
+        inds = inds[ np.argsort(self.rec['elev'][inds], kind='mergesort') ][::step]
+        inds = inds[ self.rec['nstp'][inds] > 0 ]
+        nstp = self.rec['nstp'][inds]
+        ends = np.cumsum(nstp)
+        pos = np.repeat(self.rec['ind'][inds] - (ends - nstp), nstp) + np.arange(nstp.sum())
+
+        # Project all steps on the curved Earth at once
+        xy = aax.transAux.transform( np.array([self.steps['th'][pos], self.steps['r'][pos]*1e-3]).T )
+        if not showrefract:
+            segments = np.split(xy, ends[:-1])
+        else:
+            # One segment between each pair of steps of a ray
+            starts = np.ones(len(pos), dtype=bool)
+            starts[ends - 1] = False
+            starts = np.flatnonzero(starts)
+            segments = np.concatenate([xy[starts][:,np.newaxis], xy[starts+1][:,np.newaxis]], axis=1)
+
+        lcol = getattr(ax, 'rayLines', None)
+        if lcol is not None and lcol.axes is aax and ax.rayRefract == showrefract:
+            # Same axes: only update the ray paths
+            _ = lcol.set_segments( segments )
+        else:
+            if lcol is not None and lcol.axes is aax: lcol.remove()
+            lcol = LineCollection( segments, zorder=zorder, alpha=alpha, 
+                transform=ax.transData )
+            _ = aax.add_collection( lcol, autolim=False )
+            ax.rayLines, ax.rayRefract = lcol, showrefract
+            if showrefract:
+                _ = lcol.set_cmap( nr_cmap )
+                _ = lcol.set_norm( plt.Normalize(*nr_lim) )
+        if showrefract:
+            _ = lcol.set_array( self.steps['nr'][pos][starts] )
+        else:
+            _ = lcol.set_color( raycolor )
 
         # Plot title with date ut time and local time
         if title:
             stitle = _getTitle(time, beam, self.header, self.name)
             ax.set_title( stitle )
 
-        # Add a colorbar when plotting refractive index
+        # Add a colorbar when plotting refractive index (or attach the existing one to a new collection)
         if showrefract:
-            cbax = plotUtils.addColorbar(lcol, ax)
-            _ = cbax.set_ylabel("refractive index")
+            cb = getattr(ax, 'rayCb', None)
+            if cb is None:
+                ax.rayCbax = plotUtils.addColorbar(lcol, ax)
+                ax.rayCb = lcol.colorbar
+                ax.rayCb.set_label("refractive index")
+            elif cb.mappable is not lcol:
+                _updateColorbar(cb, lcol)
+            # Color scale (the colorbar is only redrawn if it changes)
+            if lcol.get_clim() != tuple(nr_lim) or lcol.get_cmap().name != plt.get_cmap(nr_cmap).name:
+                _ = lcol.set_cmap( nr_cmap )
+                _ = lcol.set_clim( *nr_lim )
+                _updateColorbar(ax.rayCb, lcol)
+            cbax = ax.rayCbax
         else: cbax = None
 
         # Declare a new method to show range markers
@@ -1012,6 +1303,502 @@ def _readHeader(fObj, debug=False):
     return header
 
 
+def _hourToTime(header, hour):
+    """Convert a ray-tracing hour (+25 for UT) to a datetime
+
+    **Args**:
+        * **header** (dict): header of fortran output
+        * **hour** (float): hour (+25 for UT)
+    **Returns**:
+        * **rtime** (datetime.datetime): time
+    """
+    import datetime as dt
+
+    mm = header['mmdd']/100
+    dd = header['mmdd'] - mm*100
+    return dt.datetime(header['year'], mm, dd) + dt.timedelta(hours=hour - 25.)
+
+
+# Record tables of the ray tracing output: keys of each record, followed by
+# the fixed-size part of the record
+_recDtype = [('time', 'O'), ('beam', 'O'), ('hour', 'f4'), ('azim', 'f4')]
+_gsDtype = _recDtype + [(k, 'f4') for k in ['elev', 'r', 'th', 'gran', 'lat', 'lon']]
+_stpDtype = _recDtype + [('elev', 'f4'), ('nstp', 'i4'), ('ind', 'i8')]
+# Names of the values of gscat.dat records
+_gsNames = ['hour', 'azim', 'elev', 'r', 'th', 'gran', 'lat', 'lon']
+# Names of the variable-length arrays of rays.dat and iscat.dat records
+_rayNames = ['r', 'th', 'gran', 'nr']
+_isNames = ['r', 'th', 'gran', 'rel', 'w', 'nr', 'lat', 'lon', 'h']
+
+
+def _readBody(readFrom, name, debug=False):
+    """Read the header and records of a ray-tracing output
+
+    **Args**:
+        * **readFrom** (str or dict): *.dat file name (or in-memory output of :func:`RtRun._executeLib`)
+        * **name** (str): output name (rays, edens, gscat or iscat), used for in-memory output
+        * [**debug**] (bool): print some i/o diagnostics
+    **Returns**:
+        * **header** (dict): a dictionary of header values
+        * **buf** (numpy.ndarray): all records, as a flat single precision array
+    """
+    import numpy as np
+
+    if isinstance(readFrom, dict):
+        return readFrom['header'], readFrom[name]
+
+    with open(readFrom, 'rb') as f:
+        if debug:
+            print readFrom+' header: '
+        header = _readHeader(f, debug=debug)
+        buf = np.fromfile(f, dtype=np.float32)
+
+    return header, buf
+
+
+def _recStarts(buf, nvar):
+    """Start of each variable-length record (number of steps, hour, azimuth, elevation, 
+    then nvar arrays)
+
+    **Args**:
+        * **buf** (numpy.ndarray): all records, as a flat single precision array
+        * **nvar** (int): number of arrays in each record
+    **Returns**:
+        * **starts** (numpy.ndarray): index in buf of the first value of each record
+    """
+    import numpy as np
+
+    # Record boundaries (each one depends on the length of the previous record)
+    starts = []
+    i = 0
+    while i < buf.size:
+        starts.append(i)
+        i += 4 + nvar*int(buf[i])
+
+    return np.array(starts, dtype=np.int64)
+
+
+def _splitRecords(buf, names):
+    """Split variable-length records (number of steps, hour, azimuth, elevation, 
+    then one array per name) into a record table and flat arrays of steps
+
+    **Args**:
+        * **buf** (numpy.ndarray): all records, as a flat single precision array
+        * **names** (list): names of the arrays in each record
+    **Returns**:
+        * **rec** (numpy.ndarray): record table (see _stpDtype), without time and beam
+        * **steps** (numpy.ndarray): steps of all records, one field per name
+    """
+    import numpy as np
+
+    nvar = len(names)
+    starts = _recStarts(buf, nvar)
+    nstp = buf[starts].astype(np.int64)
+    ind = np.concatenate(( [0], np.cumsum(nstp) ))
+
+    rec = np.empty(len(starts), dtype=_stpDtype)
+    rec['hour'] = buf[starts+1]
+    rec['azim'] = buf[starts+2]
+    rec['elev'] = buf[starts+3]
+    rec['nstp'] = nstp
+    rec['ind'] = ind[:-1]
+
+    # Position in buf of the first array value of each step
+    pos = np.repeat(starts + 4 - ind[:-1], nstp) + np.arange(ind[-1])
+    nrep = np.repeat(nstp, nstp)
+    steps = np.empty(ind[-1], dtype=[(k, 'f4') for k in names])
+    for j, k in enumerate(names):
+        steps[k] = buf[pos + j*nrep]
+
+    return rec, steps
+
+
+def _recKeys(rec, header, site=None):
+    """Fill the time and beam fields of a record table (in place)
+
+    **Args**:
+        * **rec** (numpy.ndarray): record table
+        * **header** (dict): header of fortran output
+        * [**site**] (pydarn.radar.radStrict.site): site object of current radar (if None, beam is the azimuth rounded to 2 decimals)
+    """
+    import numpy as np
+
+    # Conversions are done once per distinct hour and azimuth
+    hours, inds = np.unique(rec['hour'], return_inverse=True)
+    keys = np.empty(len(hours), dtype=object)
+    keys[:] = [_hourToTime(header, float(hr)) for hr in hours]
+    rec['time'] = keys[inds]
+    azims, inds = np.unique(rec['azim'], return_inverse=True)
+    keys = np.empty(len(azims), dtype=object)
+    keys[:] = [site.azimToBeam(float(az)) if site else round(float(az), 2) for az in azims]
+    rec['beam'] = keys[inds]
+
+
+def _nestSteps(rec, steps, nName, rels):
+    """Nested dict view [time][beam][elevation] of variable-length records
+
+    **Args**:
+        * **rec** (numpy.ndarray): record table
+        * **steps** (numpy.ndarray): steps of all records
+        * **nName** (str): key of the number of steps in each record dict
+        * **rels** (numpy.ndarray): elevation key of each record
+    **Returns**:
+        * **nest** (dict): nest[time][beam][elevation] is a dict of the number of steps and 
+          of each steps array (views of steps)
+    """
+    nest = {}
+    for rtime, raz, rel, n, i in zip(rec['time'], rec['beam'], rels, rec['nstp'], rec['ind']):
+        d = {nName: int(n)}
+        for k in steps.dtype.names:
+            d[k] = steps[k][i:i+n]
+        nest.setdefault(rtime, {}).setdefault(raz, {})[rel] = d
+    return nest
+
+
+def _rtSteps(beg, end, stp, n, base=None):
+    """Values taken by a loop variable of the fortran code (run on a single process)
+
+    **Args**:
+        * **beg**, **end**, **stp** (float): loop start, end and step
+        * **n** (int): maximum number of iterations
+        * [**base**] (float): only clamp values to **end** once this value has been reached (time loop)
+    **Returns**:
+        * **vals** (list): loop values (in single precision, as in the fortran code)
+    """
+    from numpy import float32
+
+    beg, end, stp = float32(beg), float32(end), float32(stp)
+    vals = []
+    v = beg
+    clamp = base is None
+    for i in range(n):
+        if v > end: break
+        vals.append( float(v) )
+        v = float32(v + stp)
+        if base is not None and v >= base: clamp = True
+        if clamp and (v > max(beg, end) or v < min(beg, end)): v = end
+
+    return vals
+
+
+# Outputs of the ray tracing (one file each with the mpi backend)
+_rtOutputs = ['edens', 'rays', 'gscat', 'iscat']
+# IRI version identifier (see _iriVersion)
+_iriVer = None
+
+
+def _iriVersion():
+    """Identify the IRI model used by the ray tracing: last revision listed in irisub.for, 
+    and content of the solar and magnetic index files (which are updated regularly)
+
+    **Returns**:
+        * **version** (str): a hash of the above
+    """
+    import hashlib
+    import re
+    import os
+
+    global _iriVer
+    if _iriVer is None:
+        iriDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'iri')
+        h = hashlib.sha1()
+        with open(os.path.join(iriDir, 'irisub.for')) as f:
+            revs = re.findall(r'^C\s+(\d{4}\.\d{2})\s', f.read(), re.M | re.I)
+        h.update(revs[-1] if revs else '')
+        for fName in ['ig_rz.dat', 'apf107.dat']:
+            with open(os.path.join(iriDir, fName), 'rb') as f:
+                h.update(f.read())
+        _iriVer = h.hexdigest()
+
+    return _iriVer
+
+
+def _rtUtTime(params, hour):
+    """UT time of a ray tracing hour, rounded to the second. This is the time given to IRI 
+    (after midnight, on the following day, see IRI_DATE in raytrace_sub.f90)
+
+    **Args**:
+        * **params** (dict): run parameters (see :func:`RtRun._genParams`)
+        * **hour** (float): hour (+25 for UT), as in the loop of the fortran code
+    **Returns**:
+        * **rtime** (datetime.datetime): UT time
+    """
+    import datetime as dt
+
+    rtime = _hourToTime(params, hour)
+    midnight = dt.datetime(rtime.year, rtime.month, rtime.day)
+
+    return midnight + dt.timedelta(seconds=round( (rtime - midnight).total_seconds() ))
+
+
+def _rtCacheKey(params, hour, azims, elevs):
+    """Cache key of one hour of ray tracing
+
+    **Args**:
+        * **params** (dict): run parameters (see :func:`RtRun._genParams`)
+        * **hour** (float): hour (+25 for UT)
+        * **azims**, **elevs** (list): azimuths and elevations traced
+    **Returns**:
+        * **key** (str): a hash of all inputs of the fortran code for that hour (with the 
+          UT time of the hour rather than the loop value, see :func:`_rtUtTime`), and of the IRI version
+    """
+    import hashlib
+
+    inputs = [params[k] for k in ['txlat', 'txlon', 'freq', 'nhop', 'hmf2', 'nmf2']]
+    rtime = _rtUtTime(params, hour)
+    h = hashlib.sha1()
+    h.update( repr((inputs, rtime.isoformat(), azims, elevs)) )
+    h.update( _iriVersion() )
+
+    return h.hexdigest()
+
+
+def _rtCacheFile(cacheDir, params, hour, azims, elevs):
+    """Cache file of one hour of ray tracing (see :func:`_rtCacheKey`)
+    """
+    import os
+
+    if not os.path.isdir(cacheDir):
+        try:
+            os.makedirs(cacheDir)
+        except OSError:
+            # Created in the meantime by another process
+            if not os.path.isdir(cacheDir): raise
+
+    return os.path.join(cacheDir, 'rt.{}.npz'.format( _rtCacheKey(params, hour, azims, elevs) ))
+
+
+def _rtCacheLoad(fName, hour):
+    """Read one hour of ray tracing from the cache
+
+    **Args**:
+        * **fName** (str): cache file
+        * **hour** (float): hour (+25 for UT) of the current run, to label the records with 
+          (the cache may have been filled by a run that started on another day or at another time)
+    **Returns**:
+        * **out** (dict): edens, rays, gscat and iscat records (None if not in the cache)
+    """
+    import numpy as np
+    import os
+
+    if not os.path.isfile(fName): return None
+    try:
+        with np.load(fName) as f:
+            out = dict( (k, f[k]) for k in _rtOutputs )
+    except Exception as e:
+        print 'RtRun: could not read {}: {}'.format(fName, e)
+        return None
+
+    # Hour is the second value of the variable-length records, and the first of the others
+    out['rays'][_recStarts(out['rays'], len(_rayNames)) + 1] = hour
+    out['iscat'][_recStarts(out['iscat'], len(_isNames)) + 1] = hour
+    out['gscat'].reshape((-1, len(_gsNames)))[:,0] = hour
+    out['edens'].reshape((-1, 2 + 250 + 250*250 + 250*2))[:,0] = hour
+
+    return out
+
+
+def _rtCacheSave(fName, out):
+    """Save one hour of ray tracing to the cache (compressed)
+    """
+    import numpy as np
+    import os
+
+    # Write to a temporary file first so that concurrent readers never see partial files
+    tmpName = '{}.{}.tmp'.format(fName, os.getpid())
+    with open(tmpName, 'wb') as f:
+        np.savez_compressed(f, **dict( (k, out[k]) for k in _rtOutputs ))
+    os.rename(tmpName, fName)
+
+
+def _rtConcat(outs):
+    """Concatenate ray tracing outputs (in order)
+
+    **Args**:
+        * **outs** (list): dicts of edens, rays, gscat and iscat records
+    **Returns**:
+        * **out** (dict): concatenated records
+    """
+    import numpy as np
+
+    empty = np.empty(0, dtype=np.float32)
+    return dict( (k, np.concatenate( [empty] + [o[k] for o in outs] )) for k in _rtOutputs )
+
+
+def _rtHour(args):
+    """Trace (or read from the cache) all azimuths of one hour, and reduce the output 
+    (used by :func:`RtRun.iterHours`)
+
+    **Args**:
+        * **args** (tuple): run parameters (dict), header, hour, azimuths, elevations, 
+          cache file (or None) and reduce function (or None)
+    **Returns**:
+        * **out**: reduce(output) or output (dict of header, edens, rays, gscat and iscat)
+    """
+    params, header, hour, azims, elevs, cacheFile, reduce = args
+
+    out = _rtCacheLoad(cacheFile, hour) if cacheFile else None
+    if out is None:
+        out = _rtConcat( [_rtTrace((params, hour, az, elevs)) for az in azims] )
+        if cacheFile: _rtCacheSave(cacheFile, out)
+    out['header'] = header
+
+    return reduce(out) if reduce else out
+
+
+def gsReduce(out):
+    """Keep only the ground scatter of a ray tracing output (see :func:`RtRun.iterHours`)
+
+    **Args**:
+        * **out** (dict): in-memory ray tracing output
+    **Returns**:
+        * **gs** (numpy.ndarray): one record per ground scatter, with fields hour, azim, elev, 
+          r (reflection radius [m]), th (ground range [rad]), gran (group range [m]), lat, lon
+    """
+    import numpy as np
+
+    buf = out['gscat'].reshape((-1, len(_gsNames)))
+    gs = np.empty(buf.shape[0], dtype=[(k, 'f4') for k in _gsNames])
+    for i, k in enumerate(_gsNames):
+        gs[k] = buf[:,i]
+
+    return gs
+
+
+def gsRti(gs, header=None, site=None, frang=180., rsep=45., recrise=None, 
+    nbeams=None, ngates=None):
+    """Bin ground scatter into (time, beam, range gate) arrays, with the range gates 
+    of :class:`pydarn.radar.radFov.fov`, so that they can be compared with observed RTIs
+
+    **Args**:
+        * **gs** (numpy.ndarray): ground scatter records, with at least the fields hour, azim 
+          and gran (such as :attr:`Scatter.gsRec` or the output of :func:`gsReduce`)
+        * [**header**] (dict): header of the ray tracing output (to convert hours to datetimes)
+        * [**site**] (pydarn.radar.radStrict.site): site object of current radar (if None, 
+          the beams are the traced azimuths)
+        * [**frang**] (float): first range gate position [km]
+        * [**rsep**] (float): range gate separation [km]
+        * [**recrise**] (float): receiver rise time [us] (defaults to site.recrise, or 0)
+        * [**nbeams**] (int): number of beams (defaults to site.maxbeam)
+        * [**ngates**] (int): number of range gates (defaults to site.maxgate, or 75)
+    **Returns**:
+        * **times** (list): datetime (or hour if no header) of each time bin, in order of appearance
+        * **beams** (numpy.ndarray): beam number (or azimuth if no site) of each beam bin
+        * **counts** (numpy.ndarray): number of ground scatter returns in each (time, beam, gate)
+        * **power** (numpy.ndarray): relative ground scatter power in each (time, beam, gate), 
+          i.e., the sum of the returns weighted by their group range [km] to the power -3
+    **Example**:
+        ::
+
+            # Ground scatter counts of a whole day, hour by hour
+            rto = raydarn.RtRun(sTime, sTime + dt.timedelta(days=1), rCode='bks', 
+                backend='lib', stream=True)
+            counts = []
+            for rtime, gs in rto.iterHours(reduce=raydarn.gsReduce):
+                times, beams, cnt, pwr = raydarn.gsRti(gs, site=rto.site)
+                counts.append(cnt)
+            counts = np.concatenate(counts)
+
+    .. note:: returns outside of the beams or range gates are dropped
+    """
+    from pydarn.radar.radFov import slantRange
+    import numpy as np
+
+    if site:
+        if recrise is None: recrise = site.recrise
+        if nbeams is None: nbeams = site.maxbeam
+        if ngates is None: ngates = site.maxgate
+    if recrise is None: recrise = 0.
+    if ngates is None: ngates = 75
+
+    # Time bins, in order of appearance (hours may wrap around midnight)
+    hours, first, tinds = np.unique(gs['hour'], return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(hours), dtype=int)
+    rank[order] = np.arange(len(hours))
+    tinds = rank[tinds]
+    times = [_hourToTime(header, float(hr)) if header else float(hr) for hr in hours[order]]
+
+    # Beam bins
+    if site:
+        binds = np.asarray( site.azimToBeam(gs['azim'].astype(float)) ).reshape(-1)
+        beams = np.arange(nbeams)
+    else:
+        beams, binds = np.unique(gs['azim'], return_inverse=True)
+        beams = np.around(beams.astype(float), 2)
+        nbeams = len(beams)
+
+    # Range gates (same edges as radFov.fov)
+    edges = slantRange(frang, rsep, recrise, np.arange(ngates+1), center=False)
+    gran = gs['gran'] * 1e-3
+    ginds = np.searchsorted(edges, gran, side='right') - 1
+
+    # Count and sum all returns at once
+    valid = (binds >= 0) & (binds < nbeams) & (ginds >= 0) & (ginds < ngates)
+    finds = ( tinds[valid]*nbeams + binds[valid] )*ngates + ginds[valid]
+    shape = (len(times), nbeams, ngates)
+    counts = np.bincount(finds, minlength=np.prod(shape)).reshape(shape)
+    power = np.bincount(finds, weights=gran[valid].astype(float)**-3, 
+        minlength=np.prod(shape)).reshape(shape)
+
+    return times, beams, counts, power
+
+
+def _rtTrace(args):
+    """Trace all elevations for one hour and azimuth with the fortran library (used by :func:`RtRun._executeLib`)
+
+    **Args**:
+        * **args** (tuple): run parameters (dict), hour, azimuth and list of elevations
+    **Returns**:
+        * **out** (dict): edens, rays, gscat and iscat records (flat single precision arrays, as in the fortran files)
+    """
+    from rtLib import rt_edens, rt_ray
+    import numpy as np
+
+    params, hour, azim, elevs = args
+    f4 = np.float32
+    out = {'edens': [], 'rays': [], 'gscat': [], 'iscat': []}
+
+    # Electron density background (rt_edens moves hours past midnight to the following day)
+    edensARR, edensTHT, dip = rt_edens(params['txlat'], params['txlon'], 
+        params['year'], params['mmdd'], hour, azim, 
+        params['hmf2'], params['nmf2'])
+    # Only every other point is kept (as in edens.dat)
+    out['edens'].append( np.concatenate(( f4([hour, azim]), edensTHT[::2], 
+        edensARR[::2,::2].ravel(order='F'), dip[::2,:].ravel(order='F') )) )
+
+    # Elevation loop
+    for elev in elevs:
+        nrstep, r, th, gran, nr, ngs, ranout, nasp, ionos = rt_ray(params['txlat'], params['txlon'], 
+            params['freq'], params['nhop'], hour, azim, elev, 
+            edensARR, edensTHT, dip)
+        out['rays'].append( np.concatenate(( f4([nrstep, hour, azim, elev]), 
+            r[:nrstep], th[:nrstep], gran[:nrstep], nr[:nrstep] )) )
+        out['gscat'].append( ranout[:,:ngs].ravel(order='F') )
+        out['iscat'].append( np.concatenate(( f4([nasp, hour, azim, elev]), 
+            ionos[:,:nasp].ravel() )) )
+
+    for k in _rtOutputs:
+        out[k] = np.concatenate( out[k] ).astype(f4)
+
+    return out
+
+
+def _updateColorbar(cb, mappable):
+    """Attach a colorbar to a (possibly new) mappable, and redraw it with the color scale of the mappable
+
+    **Args**:
+        * **cb** (matplotlib.colorbar.Colorbar): colorbar
+        * **mappable**: image or collection shown by the colorbar
+    """
+    cb.mappable = mappable
+    if hasattr(cb, 'on_mappable_changed'):
+        cb.on_mappable_changed(mappable)
+    else:
+        # matplotlib >= 3.5
+        cb.update_normal(mappable)
+
+
 def _getTitle(time, beam, header, name):
     """Create a title for ground/altitude plots
 
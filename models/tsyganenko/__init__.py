@@ -8,6 +8,7 @@
 This modules containes the following object(s):
 
     * :class:`models.tsyganenko.tsygTrace`: Wraps fortran subroutines in one convenient class
+    * :func:`models.tsyganenko.getSwParams`: Solar wind and Dst parameters at given times (from OMNI and Dst data)
   
 This module contains the following module(s):
 
@@ -22,12 +23,12 @@ class tsygTrace(object):
     def __init__(self, lat=None, lon=None, rho=None, filename=None, 
         coords='geo', datetime=None,
         vswgse=[-400.,0.,0.], pdyn=2., dst=-5., byimf=0., bzimf=-5.,
-        lmax=5000, rmax=60., rmin=1., dsmax=0.01, err=0.000001):
+        lmax=5000, rmax=60., rmin=1., dsmax=0.01, err=0.000001, nProcs=1, storeTrace=True):
         """
 |   **PACKAGE**: models.tsyganenko.trace
 |   **FUNCTION**: trace(lat, lon, rho, coords='geo', datetime=None,
 |        vswgse=[-400.,0.,0.], Pdyn=2., Dst=-5., ByIMF=0., BzIMF=-5.
-|        lmax=5000, rmax=60., rmin=1., dsmax=0.01, err=0.000001)
+|        lmax=5000, rmax=60., rmin=1., dsmax=0.01, err=0.000001, nProcs=1, storeTrace=True)
 |   **PURPOSE**: trace magnetic field line(s) from point(s)
 |
 |   **INPUTS**:
@@ -37,22 +38,29 @@ class tsygTrace(object):
 |       **filename**: load a trace object directly from a file
 |       **[coords]**: coordinates used for start point ['geo']
 |       **[datetime]**: a python datetime object
-|       **[vswgse]**: solar wind velocity in GSE coordinates [m/s, m/s, m/s]
-|       **[pdyn]**: solar wind dynamic pressure [nPa]
-|       **[dst]**: Dst index [nT]
-|       **[byimf]**: IMF By [nT]
-|       **[bzimf]**: IMF Bz [nT]
+|       **[vswgse]**: solar wind velocity in GSE coordinates [m/s, m/s, m/s], or (npoints, 3) array
+|       **[pdyn]**: solar wind dynamic pressure [nPa], scalar or one per point
+|       **[dst]**: Dst index [nT], scalar or one per point
+|       **[byimf]**: IMF By [nT], scalar or one per point
+|       **[bzimf]**: IMF Bz [nT], scalar or one per point
 |       **[lmax]**: maximum number of points to trace
 |       **[rmax]**: upper trace boundary in Re
 |       **[rmin]**: lower trace boundary in Re
 |       **[dsmax]**: maximum tracing step size
 |       **[err]**: tracing step tolerance
+|       **[nProcs]**: number of processes tracing in parallel
+|       **[storeTrace]**: store the traced field lines (set to False if only the footpoints are needed)
 |
 |   **OUTPUTS**:
 |       Elements of this object:
 |       **.lat[N/S]H**: latitude of the trace footpoint in Northern/Southern hemispher
 |       **.lon[N/S]H**: longitude of the trace footpoint in Northern/Southern hemispher
 |       **.rho[N/S]H**: distance of the trace footpoint in Northern/Southern hemispher
+|       **.l**: number of points in each traced field line
+|       **.traceValues**: (3, l.sum()) array of all traced field lines (GSW x, y, z [Re]) end to end,
+|           or None if storeTrace is False (see getTrace)
+|       **.traceOffsets**: index of the start of each field line in traceValues (and of the end of the last one)
+|       **.[x/y/z]Trace**: field lines as dense (npoints, l.max()) arrays, built on request
 |
 |   **EXAMPLES**:
 from numpy import arange, zeros, ones
@@ -72,6 +80,8 @@ ax = trace.plot3d()
 trace.save('trace.dat')
 # And when you want to re-use the saved trace
 trace = tsyganenko.tsygTrace(filename='trace.dat')
+# Trace with the observed solar wind conditions at each point
+trace = tsyganenko.tsygTrace(lats, lons, rhos, datetime=times, **tsyganenko.getSwParams(times))
 |
 |   Written by Sebastien 2012-10
         """
@@ -96,7 +106,8 @@ trace = tsyganenko.tsygTrace(filename='trace.dat')
             iTest = self.__test_valid__()
             if not iTest: self.__del__()
 
-            self.trace()
+            self.trace(lmax=lmax, rmax=rmax, rmin=rmin, dsmax=dsmax, err=err, nProcs=nProcs, 
+                storeTrace=storeTrace)
 
         elif filename:
             self.load(filename)
@@ -108,7 +119,9 @@ trace = tsyganenko.tsygTrace(filename='trace.dat')
 |
 |   Written by Sebastien 2012-10
         """
-        assert (len(self.vswgse) == 3), 'vswgse must have 3 elements'
+        from numpy import shape, ndim
+
+        assert (shape(self.vswgse)[-1:] == (3,)), 'vswgse must have 3 elements (per point)'
         assert (self.coords.lower() == 'geo'), '{}: this coordinae system is not supported'.format(self.coords.lower())
         # A provision for those who want to batch trace
         try:
@@ -130,153 +143,192 @@ trace = tsyganenko.tsygTrace(filename='trace.dat')
         # Make sure they're all the sam elength
         assert (len(self.lat) == len(self.lon) == len(self.rho) == len(self.datetime)), \
             'lat, lon, rho and datetime must me the same length'
+        # Solar wind parameters are either the same for all points or given for each point
+        for k in ['vswgse', 'pdyn', 'dst', 'byimf', 'bzimf']:
+            v = getattr(self, k)
+            assert (ndim(v) == (k == 'vswgse')) or (len(v) == len(self.lat)), \
+                '{} must be a scalar or have one element per point'.format(k)
         
         return True
 
 
     def trace(self, lat=None, lon=None, rho=None, coords=None, datetime=None,
         vswgse=None, pdyn=None, dst=None, byimf=None, bzimf=None,
-        lmax=5000, rmax=60., rmin=1., dsmax=0.01, err=0.000001):
+        lmax=5000, rmax=60., rmin=1., dsmax=0.01, err=0.000001, nProcs=1, storeTrace=True):
         """
 |   See tsygTrace for a description of each parameter
 |   Any unspecified parameter default to the one stored in the object
-|   Unspecified lmax, rmax, rmin, dsmax, err has a set default value
+|   Unspecified lmax, rmax, rmin, dsmax, err, nProcs, storeTrace has a set default value
+|   Points sharing the same epoch and solar wind parameters are traced together (one call 
+|   to recalc_08 per group), and groups of points are distributed over nProcs processes
 |
 |   Written by Sebastien 2012-10
         """
-        from numpy import radians, degrees, zeros
+        from numpy import zeros, empty, cumsum, r_, asarray, column_stack
 
         # Store existing values of class attributes in case something is wrong
         # and we need to revert back to them
-        if lat: _lat = self.lat
-        if lon: _lon = self.lon
-        if rho: _rho = self.rho
-        if coords: _coords = self.coords
-        if vswgse: _vswgse = self.vswgse
+        if lat is not None: _lat = self.lat
+        if lon is not None: _lon = self.lon
+        if rho is not None: _rho = self.rho
+        if coords is not None: _coords = self.coords
+        if vswgse is not None: _vswgse = self.vswgse
         if not datetime==None: _datetime = self.datetime
 
         # Pass position if new
-        if lat: self.lat = lat
+        if lat is not None: self.lat = lat
         lat = self.lat
-        if lon: self.lon = lon
+        if lon is not None: self.lon = lon
         lon = self.lon
-        if rho: self.rho = rho
+        if rho is not None: self.rho = rho
         rho = self.rho
         if not datetime==None: self.datetime = datetime
         datetime = self.datetime
 
         # Set necessary parameters if new
-        if coords: self.coords = coords
+        if coords is not None: self.coords = coords
         coords = self.coords
         if not datetime==None: self.datetime = datetime
         datetime = self.datetime
-        if vswgse: self.vswgse = vswgse
+        if vswgse is not None: self.vswgse = vswgse
         vswgse = self.vswgse
-        if pdyn: self.pdyn = pdyn
+        if pdyn is not None: self.pdyn = pdyn
         pdyn = self.pdyn
-        if dst: self.dst = dst
+        if dst is not None: self.dst = dst
         dst = self.dst
-        if byimf: self.byimf = byimf
+        if byimf is not None: self.byimf = byimf
         byimf = self.byimf
-        if bzimf: self.bzimf = bzimf
+        if bzimf is not None: self.bzimf = bzimf
         bzimf = self.bzimf
 
         # Test that everything is in order, if not revert to existing values
         iTest = self.__test_valid__()
         if not iTest: 
-            if lat: self.lat = _lat
-            if lon: _self.lon = lon
-            if rho: self.rho = _rho
-            if coords: self.coords = _coords 
-            if vswgse: self.vswgse = _vswgse
+            if lat is not None: self.lat = _lat
+            if lon is not None: self.lon = _lon
+            if rho is not None: self.rho = _rho
+            if coords is not None: self.coords = _coords 
+            if vswgse is not None: self.vswgse = _vswgse
             if not datetime==None: self.datetime = _datetime
+        lat, lon, rho, datetime = self.lat, self.lon, self.rho, self.datetime
 
-        # Declare the same Re as used in Tsyganenko models [km]
-        Re = 6371.2
-        
-        # Initialize trace array
-        self.l = zeros(len(lat))
-        self.xTrace = zeros((len(lat),2*lmax))
-        self.yTrace = self.xTrace.copy()
-        self.zTrace = self.xTrace.copy()
-        self.xGsw = self.l.copy()
-        self.yGsw = self.l.copy()
-        self.zGsw = self.l.copy()
-        self.latNH = self.l.copy()
-        self.lonNH = self.l.copy()
-        self.rhoNH = self.l.copy()
-        self.latSH = self.l.copy()
-        self.lonSH = self.l.copy()
-        self.rhoSH = self.l.copy()
-
-        # And now iterate through the desired points
+        # Solar wind parameters of each point
+        vsw = zeros((len(lat), 3)) + asarray(vswgse, dtype='float')
+        par = column_stack([zeros(len(lat)) + asarray(v, dtype='float') for v in [pdyn, dst, byimf, bzimf]])
+
+        # Group points sharing the same epoch and parameters: recalc_08 only has to be called once per group
+        groups = {}
         for ip in xrange(len(lat)):
-            # This has to be called first
-            tsygFort.recalc_08(datetime[ip].year,datetime[ip].timetuple().tm_yday,
-                                datetime[ip].hour,datetime[ip].minute,datetime[ip].second,
-                                vswgse[0],vswgse[1],vswgse[2])
-
-            # Convert lat,lon to geographic cartesian and then gsw
-            r, theta, phi, xgeo, ygeo, zgeo = tsygFort.sphcar_08(
-                                                    rho[ip]/Re, radians(90.-lat[ip]), radians(lon[ip]),
-                                                    0., 0., 0.,
-                                                    1)
-            if coords.lower() == 'geo':
-                xgeo, ygeo, zgeo, xgsw, ygsw, zgsw = tsygFort.geogsw_08(
-                                                            xgeo, ygeo, zgeo,
-                                                            0. ,0. ,0. ,
-                                                            1)
-            self.xGsw[ip] = xgsw
-            self.yGsw[ip] = ygsw
-            self.zGsw[ip] = zgsw
-
-            # Trace field line
-            inmod = 'IGRF_GSW_08'
-            exmod = 'T96_01'
-            parmod = [pdyn, dst, byimf, bzimf, 0, 0, 0, 0, 0, 0]
-            # First towards southern hemisphere
-            maptoL = [-1, 1]
-            for mapto in maptoL:
-                xfgsw, yfgsw, zfgsw, xarr, yarr, zarr, l = tsygFort.trace_08( xgsw, ygsw, zgsw,
-                                                                mapto, dsmax, err, rmax, rmin, 0,
-                                                                parmod, exmod, inmod,
-                                                                lmax )
-
-                # Convert back to spherical geographic coords
-                xfgeo, yfgeo, zfgeo, xfgsw, yfgsw, zfgsw  = tsygFort.geogsw_08(
-                                                                    0. ,0. ,0. ,
-                                                                    xfgsw, yfgsw, zfgsw,
-                                                                    -1)
-                geoR, geoColat, geoLon, xgeo, ygeo, zgeo = tsygFort.sphcar_08(
-                                                                    0., 0., 0.,
-                                                                    xfgeo, yfgeo, zfgeo,
-                                                                    -1)
-
-                # Get coordinates of traced point
-                if mapto == 1:
-                    self.latSH[ip] = 90. - degrees(geoColat)
-                    self.lonSH[ip] = degrees(geoLon)
-                    self.rhoSH[ip] = geoR*Re
-                elif mapto == -1:
-                    self.latNH[ip] = 90. - degrees(geoColat)
-                    self.lonNH[ip] = degrees(geoLon)
-                    self.rhoNH[ip] = geoR*Re
-                    
-                # Store trace
-                if mapto == -1:
-                    self.xTrace[ip,0:l] = xarr[l-1::-1]
-                    self.yTrace[ip,0:l] = yarr[l-1::-1]
-                    self.zTrace[ip,0:l] = zarr[l-1::-1]
-                elif mapto == 1:
-                    self.xTrace[ip,self.l[ip]:self.l[ip]+l] = xarr[0:l]
-                    self.yTrace[ip,self.l[ip]:self.l[ip]+l] = yarr[0:l]
-                    self.zTrace[ip,self.l[ip]:self.l[ip]+l] = zarr[0:l]
-                self.l[ip] += l
-
-        # Resize trace output to more minimum possible length
-        self.xTrace = self.xTrace[:,0:self.l.max()]
-        self.yTrace = self.yTrace[:,0:self.l.max()]
-        self.zTrace = self.zTrace[:,0:self.l.max()]
+            epoch = (datetime[ip].year, datetime[ip].timetuple().tm_yday, 
+                    datetime[ip].hour, datetime[ip].minute, datetime[ip].second)
+            groups.setdefault((epoch, tuple(vsw[ip]), tuple(par[ip])), []).append(ip)
+        tasks = [(epoch, list(gvsw), list(gpar) + [0, 0, 0, 0, 0, 0], 
+                [lat[ip] for ip in inds], [lon[ip] for ip in inds], [rho[ip] for ip in inds], 
+                coords, lmax, rmax, rmin, dsmax, err, storeTrace) for (epoch, gvsw, gpar), inds in groups.items()]
+
+        # Trace each group, in parallel if requested
+        if nProcs > 1 and len(tasks) > 1:
+            from multiprocessing import Pool
+
+            pool = Pool(min(nProcs, len(tasks)))
+            try:
+                results = pool.map(_traceGroup, tasks, chunksize=max(1, len(tasks)//(4*nProcs)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(_traceGroup, tasks)
+
+        # Initialize trace array
+        self.l = zeros(len(lat), dtype='int')
+        self.xGsw = zeros(len(lat))
+        self.yGsw = self.xGsw.copy()
+        self.zGsw = self.xGsw.copy()
+        self.latNH = self.xGsw.copy()
+        self.lonNH = self.xGsw.copy()
+        self.rhoNH = self.xGsw.copy()
+        self.latSH = self.xGsw.copy()
+        self.lonSH = self.xGsw.copy()
+        self.rhoSH = self.xGsw.copy()
+
+        # Put the results of each group back in place
+        for inds, res in zip(groups.values(), results):
+            for k in ['xGsw', 'yGsw', 'zGsw', 'latNH', 'lonNH', 'rhoNH', 'latSH', 'lonSH', 'rhoSH', 'l']:
+                getattr(self, k)[inds] = res[k]
+
+        # Store traces end to end (no padding)
+        self.traceOffsets = r_[0, cumsum(self.l)]
+        self.traceValues = None
+        if storeTrace:
+            self.traceValues = empty((3, self.traceOffsets[-1]), dtype='float32')
+            for inds, res in zip(groups.values(), results):
+                for ip, path in zip(inds, res['paths']):
+                    self.traceValues[:, self.traceOffsets[ip]:self.traceOffsets[ip+1]] = path
+
+
+    def getTrace(self, ip):
+        """
+|   Get the field line traced from a given point
+|
+|   **INPUTS**:
+|       **ip**: index of the point
+|
+|   **OUTPUTS**:
+|       **x, y, z**: GSW coordinates [Re] along the field line, from the NH to the SH footpoint
+        """
+        assert self.traceValues is not None, 'getTrace: field lines were not stored (storeTrace=False)'
+
+        return self.traceValues[:, self.traceOffsets[ip]:self.traceOffsets[ip+1]]
+
+
+    def _denseTrace(self, i):
+        """
+|   Field lines along GSW axis i as a zero-padded (npoints, l.max()) array.
+|   The array is built on first access and kept until the traces change (it is read-only).
+        """
+        from numpy import zeros, arange
+
+        if self.traceValues is None: return None
+        cached = getattr(self, '_denseTraces', None)
+        if cached is None or cached[0] is not self.traceValues:
+            cached = (self.traceValues, {})
+            self._denseTraces = cached
+        if i not in cached[1]:
+            out = zeros((len(self.l), self.l.max() if len(self.l) else 0))
+            out[arange(out.shape[1]) < self.l[:,None]] = self.traceValues[i]
+            out.setflags(write=False)
+            cached[1][i] = out
+        return cached[1][i]
+
+    xTrace = property(lambda self: self._denseTrace(0), doc='GSW x of the field lines (npoints, l.max()) [Re]')
+    yTrace = property(lambda self: self._denseTrace(1), doc='GSW y of the field lines (npoints, l.max()) [Re]')
+    zTrace = property(lambda self: self._denseTrace(2), doc='GSW z of the field lines (npoints, l.max()) [Re]')
+
+
+    def __getstate__(self):
+        """
+|   Pickle without the dense copies of the traces
+        """
+        state = self.__dict__.copy()
+        state.pop('_denseTraces', None)
+        return state
+
+
+    def __setstate__(self, state):
+        """
+|   Restore a pickled object, converting traces saved as dense arrays by older versions
+        """
+        from numpy import empty, cumsum, r_
+
+        if 'xTrace' in state:
+            xTrace, yTrace, zTrace = [state.pop(k) for k in ['xTrace', 'yTrace', 'zTrace']]
+            state['l'] = state['l'].astype('int')
+            state['traceOffsets'] = r_[0, cumsum(state['l'])]
+            state['traceValues'] = empty((3, state['traceOffsets'][-1]), dtype='float32')
+            for ip, l in enumerate(state['l']):
+                for i, tr in enumerate([xTrace, yTrace, zTrace]):
+                    state['traceValues'][i, state['traceOffsets'][ip]:state['traceOffsets'][ip+1]] = tr[ip,0:l]
+        self.__dict__.update(state)
 
 
     def __str__(self):
@@ -285,8 +337,11 @@ trace = tsyganenko.tsygTrace(filename='trace.dat')
 |
 |   Written by Sebastien 2012-10
         """
+        from numpy import ndim
+
         # Declare print format
-        outstr =    '''
+        if ndim(self.vswgse) == 1 and max(ndim(v) for v in [self.pdyn, self.dst, self.byimf, self.bzimf]) == 0:
+            outstr =    '''
 vswgse=[{:6.0f},{:6.0f},{:6.0f}]    [m/s]
 pdyn={:3.0f}                        [nPa]
 dst={:3.0f}                         [nT]
@@ -299,6 +354,8 @@ bzimf={:3.0f}                       [nT]
                                self.dst,
                                self.byimf,
                                self.bzimf)
+        else:
+            outstr = '\nvswgse, pdyn, dst, byimf, bzimf: given for each point\n'
         outstr += '\nCoords: {}\n'.format(self.coords)
         outstr += '(latitude [degrees], longitude [degrees], distance from center of the Earth [km])\n'
 
@@ -391,47 +448,48 @@ bzimf={:3.0f}                       [nT]
 
         # Then plot the traced field line
         for ip in inds:
+            xTrace, yTrace, zTrace = self.getTrace(ip)
             # Select projection plane
             if proj[0] == 'x':
-                xx = self.xTrace[ip,0:self.l[ip]]
+                xx = xTrace
                 xpt = self.xGsw[ip]
                 ax.set_xlabel(r'$X_{GSW}$')
                 xdir = [1,0,0]
             elif proj[0] == 'y':
-                xx = self.yTrace[ip,0:self.l[ip]]
+                xx = yTrace
                 xpt = self.yGsw[ip]
                 ax.set_xlabel(r'$Y_{GSW}$')
                 xdir = [0,1,0]
             elif proj[0] == 'z':
-                xx = self.zTrace[ip,0:self.l[ip]]
+                xx = zTrace
                 xpt = self.zGsw[ip]
                 ax.set_xlabel(r'$Z_{GSW}$')
                 xdir = [0,0,1]
             if proj[1] == 'x':
-                yy = self.xTrace[ip,0:self.l[ip]]
+                yy = xTrace
                 ypt = self.xGsw[ip]
                 ax.set_ylabel(r'$X_{GSW}$')
                 ydir = [1,0,0]
             elif proj[1] == 'y':
-                yy = self.yTrace[ip,0:self.l[ip]]
+                yy = yTrace
                 ypt = self.yGsw[ip]
                 ax.set_ylabel(r'$Y_{GSW}$')
                 ydir = [0,1,0]
             elif proj[1] == 'z':
-                yy = self.zTrace[ip,0:self.l[ip]]
+                yy = zTrace
                 ypt = self.zGsw[ip]
                 ax.set_ylabel(r'$Z_{GSW}$')
                 ydir = [0,0,1]
             sign = 1 if -1 not in cross(xdir,ydir) else -1
             if 'x' not in proj: 
                 zz = sign*self.xGsw[ip]
-                indMask = sign*self.xTrace[ip,0:self.l[ip]] < 0
+                indMask = sign*xTrace < 0
             if 'y' not in proj: 
                 zz = sign*self.yGsw[ip]
-                indMask = sign*self.yTrace[ip,0:self.l[ip]] < 0
+                indMask = sign*yTrace < 0
             if 'z' not in proj: 
                 zz = sign*self.zGsw[ip]
-                indMask = sign*self.zTrace[ip,0:self.l[ip]] < 0
+                indMask = sign*zTrace < 0
             # Plot
             ax.plot(masked_array(xx, mask=~indMask), 
                     masked_array(yy, mask=~indMask), 
@@ -497,9 +555,10 @@ bzimf={:3.0f}                       [nT]
 
         # Then plot the traced field line
         for ip in inds:
-            ax.plot3D(  self.xTrace[ip,0:self.l[ip]],
-                        self.yTrace[ip,0:self.l[ip]],
-                        self.zTrace[ip,0:self.l[ip]], 
+            xTrace, yTrace, zTrace = self.getTrace(ip)
+            ax.plot3D(  xTrace,
+                        yTrace,
+                        zTrace, 
                         zorder=zorder, linewidth=linewidth, color=color, **kwargs)
             if showPts:
                 ax.scatter3D(self.xGsw[ip], self.yGsw[ip], self.zGsw[ip], c='k')
@@ -516,3 +575,143 @@ bzimf={:3.0f}                       [nT]
         if disp: show()
 
         return ax
+
+
+def _traceGroup(args):
+    """
+|   Trace field lines from a group of points sharing the same epoch (see tsygTrace.trace).
+|   This is a module-level function so that it can be sent to worker processes.
+|
+|   **INPUTS**:
+|       **args**: (epoch, vswgse, parmod, lat, lon, rho, coords, lmax, rmax, rmin, dsmax, err, storeTrace), 
+|           where epoch is (year, doy, hour, minute, second) and lat, lon, rho are lists
+|
+|   **OUTPUTS**:
+|       **res**: a dictionnary of arrays (one element per point) with keys xGsw, yGsw, zGsw, 
+|           latNH, lonNH, rhoNH, latSH, lonSH, rhoSH, l, and paths, the list of 
+|           traced field lines (x, y, z) from the NH to the SH footpoint (empty if storeTrace is False)
+        """
+    from numpy import radians, degrees, zeros, concatenate
+
+    epoch, vswgse, parmod, lat, lon, rho, coords, lmax, rmax, rmin, dsmax, err, storeTrace = args
+
+    # Declare the same Re as used in Tsyganenko models [km]
+    Re = 6371.2
+
+    npts = len(lat)
+    res = dict( (k, zeros(npts)) for k in ['xGsw', 'yGsw', 'zGsw', 
+        'latNH', 'lonNH', 'rhoNH', 'latSH', 'lonSH', 'rhoSH'] )
+    res['l'] = zeros(npts, dtype='int')
+    res['paths'] = []
+
+    # This has to be called first (once for the whole group)
+    tsygFort.recalc_08(epoch[0], epoch[1], epoch[2], epoch[3], epoch[4],
+                        vswgse[0], vswgse[1], vswgse[2])
+
+    inmod = 'IGRF_GSW_08'
+    exmod = 'T96_01'
+    for ip in xrange(npts):
+        # Convert lat,lon to geographic cartesian and then gsw
+        r, theta, phi, xgeo, ygeo, zgeo = tsygFort.sphcar_08(
+                                                rho[ip]/Re, radians(90.-lat[ip]), radians(lon[ip]),
+                                                0., 0., 0.,
+                                                1)
+        if coords.lower() == 'geo':
+            xgeo, ygeo, zgeo, xgsw, ygsw, zgsw = tsygFort.geogsw_08(
+                                                        xgeo, ygeo, zgeo,
+                                                        0. ,0. ,0. ,
+                                                        1)
+        res['xGsw'][ip] = xgsw
+        res['yGsw'][ip] = ygsw
+        res['zGsw'][ip] = zgsw
+
+        # Trace field line, first towards southern hemisphere
+        path = {}
+        for mapto in [-1, 1]:
+            xfgsw, yfgsw, zfgsw, xarr, yarr, zarr, l = tsygFort.trace_08( xgsw, ygsw, zgsw,
+                                                            mapto, dsmax, err, rmax, rmin, 0,
+                                                            parmod, exmod, inmod,
+                                                            lmax )
+
+            # Convert back to spherical geographic coords
+            xfgeo, yfgeo, zfgeo, xfgsw, yfgsw, zfgsw  = tsygFort.geogsw_08(
+                                                                0. ,0. ,0. ,
+                                                                xfgsw, yfgsw, zfgsw,
+                                                                -1)
+            geoR, geoColat, geoLon, xgeo, ygeo, zgeo = tsygFort.sphcar_08(
+                                                                0., 0., 0.,
+                                                                xfgeo, yfgeo, zfgeo,
+                                                                -1)
+
+            # Get coordinates of traced point, and trace (from NH to SH footpoint)
+            if mapto == 1:
+                res['latSH'][ip] = 90. - degrees(geoColat)
+                res['lonSH'][ip] = degrees(geoLon)
+                res['rhoSH'][ip] = geoR*Re
+                path[mapto] = (xarr[0:l], yarr[0:l], zarr[0:l])
+            elif mapto == -1:
+                res['latNH'][ip] = 90. - degrees(geoColat)
+                res['lonNH'][ip] = degrees(geoLon)
+                res['rhoNH'][ip] = geoR*Re
+                path[mapto] = (xarr[l-1::-1], yarr[l-1::-1], zarr[l-1::-1])
+            res['l'][ip] += l
+
+        if storeTrace:
+            res['paths'].append( [concatenate([path[-1][i], path[1][i]]) for i in range(3)] )
+
+    return res
+
+
+def getSwParams(times, omniList=None, dstList=None, res=5):
+    """
+|   Get the solar wind and Dst parameters used by tsygTrace at each one of a set of times, 
+|   interpolated (linearly) from OMNI and Dst time series. Missing values in the time series 
+|   are ignored, and parameters without any data are set to the tsygTrace defaults.
+|
+|   **INPUTS**:
+|       **times**: list of datetime objects
+|       **[omniList]**: list of gme.ind.omniRec objects (read with gme.ind.readOmni if None)
+|       **[dstList]**: list of gme.ind.dstRec objects (read with gme.ind.readDst if None)
+|       **[res]**: time resolution of the OMNI data to read [min] (1 or 5)
+|
+|   **OUTPUTS**:
+|       **params**: a dictionnary with keys vswgse (npoints, 3), pdyn, dst, byimf, bzimf (npoints), 
+|           which can be passed directly to tsygTrace
+|
+|   **EXAMPLES**:
+params = getSwParams(times)
+trace = tsygTrace(lats, lons, rhos, datetime=times, **params)
+        """
+    from datetime import timedelta
+    from numpy import array, interp, isfinite, nan, empty
+    from utils.timeUtils import datetimeToEpoch
+
+    sTime, eTime = min(times) - timedelta(hours=1), max(times) + timedelta(hours=1)
+    if omniList is None:
+        from gme.ind import readOmni
+        omniList = readOmni(sTime, eTime, res=res)
+    if dstList is None:
+        from gme.ind import readDst
+        dstList = readDst(sTime, eTime)
+
+    tEpoch = array([datetimeToEpoch(t) for t in times])
+
+    def _interp(recs, attr, default):
+        # Interpolate one member of a list of records to the requested times
+        recs = recs or []
+        t = array([datetimeToEpoch(r.time) for r in recs])
+        v = array([getattr(r, attr, None) for r in recs], dtype='float')
+        good = isfinite(v) if len(v) else []
+        if not any(good): return default + 0.*tEpoch
+        return interp(tEpoch, t[good], v[good])
+
+    params = {}
+    params['vswgse'] = empty((len(times), 3))
+    for i, (attr, default) in enumerate([('vxe', -400.), ('vye', 0.), ('vze', 0.)]):
+        params['vswgse'][:,i] = _interp(omniList, attr, default)
+    params['pdyn'] = _interp(omniList, 'pDyn', 2.)
+    params['byimf'] = _interp(omniList, 'bym', 0.)
+    params['bzimf'] = _interp(omniList, 'bzm', -5.)
+    params['dst'] = _interp(dstList, 'dst', -5.)
+
+    return params
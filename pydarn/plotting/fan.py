@@ -180,7 +180,7 @@ def plotFan(sTime,rad,interval=60,fileType='fitex',param='velocity',filtered=Fal
       lonFull.append(x[1])
       latC.append(x[0])
       lonC.append(x[1])
-    myFov = pydarn.radar.radFov.fov(site=site,rsep=allBeams[i].prm.rsep,\
+    myFov = pydarn.radar.radFov.getFov(site=site,rsep=allBeams[i].prm.rsep,\
             ngates=allBeams[i].prm.nrang+1,nbeams=site.maxbeam,coords=coords)
     fovs.append(myFov)
     for b in range(0,site.maxbeam+1):
@@ -410,7 +410,7 @@ def overlayFan(myData,myMap,myFig,param,coords='geo',gsct=0,site=None,\
   if(site == None):
     site = pydarn.radar.site(radId=myData[0].stid, dt=myData[0].time)
   if(fov == None):
-    fov = pydarn.radar.radFov.fov(site=site,rsep=myData[0].prm.rsep,\
+    fov = pydarn.radar.radFov.getFov(site=site,rsep=myData[0].prm.rsep,\
     ngates=myData[0].prm.nrang+1,nbeams= site.maxbeam,coords=coords) 
   
   if(isinstance(myData,pydarn.sdio.beamData)): myData = [myData]
@@ -166,7 +166,7 @@ def overlayFov(Basemap, codes=None, ids=None, names=None,
 	written by Sebastien, 2012-09
 	"""
 	from pydarn.radar import network
-	from pydarn.radar.radFov import fov
+	from pydarn.radar.radFov import getFov
 	from datetime import datetime as dt
 	from datetime import timedelta
 	import matplotlib.cm as cm
@@ -212,9 +212,9 @@ def overlayFov(Basemap, codes=None, ids=None, names=None,
 			eGate = site.maxgate-1 if not maxGate else maxGate
 
 			if not hasattr(Basemap, 'coords'): 
-				radFov = fov(site=site, ngates=eGate+1,model=model)
+				radFov = getFov(site=site, ngates=eGate+1,model=model)
 			else:
-				radFov = fov(site=site, ngates=eGate+1, coords=Basemap.coords, model=model)
+				radFov = getFov(site=site, ngates=eGate+1, coords=Basemap.coords, model=model)
 		else:
 			radFov = fovObj
 			eGate = len(fovObj.gates)
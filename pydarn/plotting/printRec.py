@@ -139,6 +139,7 @@ def fitPrintRec(sTime, eTime, rad, outfile, fileType='fitex', summ=0):
   """
 
   import pydarn, utils, models
+  import numpy
   
   myPtr = pydarn.sdio.radDataOpen(sTime,rad,eTime=eTime,fileType=fileType)
   if(myPtr == None): return None
@@ -149,7 +150,7 @@ def fitPrintRec(sTime, eTime, rad, outfile, fileType='fitex', summ=0):
   
   radar = pydarn.radar.network().getRadarByCode(rad)
   site = radar.getSiteByDate(myData.time)
-  myFov = pydarn.radar.radFov.fov(site=site,rsep=myData.prm.rsep,ngates=myData.prm.nrang, model=None, altitude=300.)
+  myFov = pydarn.radar.radFov.getFov(site=site,rsep=myData.prm.rsep,ngates=myData.prm.nrang, model=None, altitude=300.)
   
   
   f = open(outfile, 'w')
@@ -185,14 +186,17 @@ def fitPrintRec(sTime, eTime, rad, outfile, fileType='fitex', summ=0):
       ('gate','pwr_0','pwr_l','vel','gsf','vel_err','width_l','geo_lat','geo_lon','geo_azm',
         'mag_lat','mag_lon','mag_azm','range'))
       
-      for i in range(len(myData.fit.slist)):
+      # geographic azimuth of every gate with scatter in one call
+      slist = numpy.array(myData.fit.slist, dtype='int')
+      d = utils.geoPack.calcDistPnt(myFov.latFull[myData.bmnum][slist],
+                                    myFov.lonFull[myData.bmnum][slist], 300,
+                                    distLat=myFov.latFull[myData.bmnum][slist+1], \
+                                    distLon=myFov.lonFull[myData.bmnum][slist+1],distAlt=300)
+      gazms = d['az']
 
-        d = utils.geoPack.calcDistPnt(myFov.latFull[myData.bmnum][myData.fit.slist[i]],
-                                      myFov.lonFull[myData.bmnum][myData.fit.slist[i]], 300,
-                                      distLat=myFov.latFull[myData.bmnum][myData.fit.slist[i]+1], \
-                                      distLon=myFov.lonFull[myData.bmnum][myData.fit.slist[i]+1 ],distAlt=300)
+      for i in range(len(myData.fit.slist)):
 
-        gazm = d['az']
+        gazm = gazms[i]
 
         mlat,mlon,a = models.aacgm.aacgmConv(myFov.latFull[myData.bmnum][myData.fit.slist[i]],
                                                 myFov.lonFull[myData.bmnum][myData.fit.slist[i]],300,0)
@@ -434,7 +434,7 @@ class musicArray(object):
                         1: ground backscatter only
                         2: ionospheric backscatter only
                         3: all backscatter data with a ground backscatter flag.
-        * [**fovElevation**] (float or None): Passed directly to pydarn.radar.radFov.fov()
+        * [**fovElevation**] (float or None): Passed directly to pydarn.radar.radFov.getFov()
         * [**fovModel**] (str): Scatter mapping model.
                         'GS': Ground Scatter Mapping Model.  See Bristow et al. [1994]
                         'IS': Standard SuperDARN scatter mapping model.
@@ -514,7 +514,8 @@ class musicArray(object):
                 if fov == None:
                     radStruct = pydarn.radar.radStruct.radar(radId=myPtr.stid)
                     site      = pydarn.radar.radStruct.site(radId=myPtr.stid,dt=sTime)
-                    fov       = pydarn.radar.radFov.fov(frang=myBeam.prm.frang, rsep=myBeam.prm.rsep, site=site,elevation=fovElevation,model=fovModel,coords=fovCoords)
+                    #The cached fov is shared, so work on a copy (it is trimmed to the data below).
+                    fov       = copy.deepcopy(pydarn.radar.radFov.getFov(frang=myBeam.prm.frang, rsep=myBeam.prm.rsep, site=site,elevation=fovElevation,model=fovModel,coords=fovCoords))
 
                 #Get information from each beam in the scan.
                 beamTime = myBeam.time 
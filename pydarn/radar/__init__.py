@@ -8,6 +8,7 @@ This subpackage contains various radar information/routines for DaViT-py
 
 **Modules**:
     * :mod:`pydarn.radar.radFov`: radar fields-of-view calculations
+    * :mod:`pydarn.radar.radGeoloc`: batch geolocation of radar echoes
     * :mod:`pydarn.radar.radInfo`: radar information
     * :mod:`pydarn.radar.radUtils`: misc. radar parameters (cpid...)
 """
@@ -17,6 +18,11 @@ try:
 except Exception as e:
     print __file__+' -> pydarn.radar.radFov: ', e
 
+try:
+    from radGeoloc import *
+except Exception as e:
+    print __file__+' -> pydarn.radar.radGeoloc: ', e
+
 try:
     from radUtils import *
 except Exception as e:
@@ -8,8 +8,10 @@ This module handles generating field-of-view projctions
 
 **Classes**:
     * :class:`fov`: field of view position
+    * :class:`fovCache`: LRU (and optional on-disk) cache of :class:`fov` objects
 
 **Functions**:
+    * :func:`pydarn.radar.radFov.getFov`: Get a (possibly cached) field of view
     * :func:`pydarn.radar.radFov.slantRange`: Calculate slant range
     * :func:`pydarn.radar.radFov.calcAzOffBore`: Calculate off-array-normal azimuth
     * :func:`pydarn.radar.radFov.calcFieldPnt`: Calculate field point projection
@@ -56,7 +58,8 @@ class fov(object):
             elevation=None, altitude=300., \
             model='IS', coords='geo'):
         # Get fov
-        from numpy import ndarray, array, arange, zeros, nan
+        from numpy import ndarray, array, arange, zeros, ones, nan
+        import numpy as np
         import models.aacgm as aacgm
         
         # Test that we have enough input arguments to work with
@@ -119,7 +122,7 @@ class fov(object):
                 # Array is adjusted to add on extra beam/gate edge by copying the last row and column
                 else: 
                     altitude = np.append(altitude, altitude[-1,:].reshape(1,ngates), axis=0)
-                    altitude = np.append(altitude, altitude[:,-1].reshape(nbeams,1), axis=1)
+                    altitude = np.append(altitude, altitude[:,-1].reshape(nbeams+1,1), axis=1)
             else:
                 print 'getFov: altitude must be of a scalar or ndarray(ngates) or ndarray(nbeans,ngates). Using first element: {}'.format(altitude[0])
                 altitude = altitude[0] * ones((nbeams+1, ngates+1))
@@ -137,7 +140,7 @@ class fov(object):
                 # Array is adjusted to add on extra beam/gate edge by copying the last row and column
                 else: 
                     elevation = np.append(elevation, elevation[-1,:].reshape(1,ngates), axis=0)
-                    elevation = np.append(elevation, elevation[:,-1].reshape(nbeams,1), axis=1)
+                    elevation = np.append(elevation, elevation[:,-1].reshape(nbeams+1,1), axis=1)
             else:
                 print 'getFov: elevation must be of a scalar or ndarray(ngates) or ndarray(nbeans,ngates). Using first element: {}'.format(elevation[0])
                 elevation = elevation[0] * ones((nbeams+1, ngates+1))
@@ -153,66 +156,54 @@ class fov(object):
         slantRangeCenter = zeros((nbeams+1, ngates+1), dtype='float')
         latCenter = zeros((nbeams+1, ngates+1), dtype='float')
         lonCenter = zeros((nbeams+1, ngates+1), dtype='float')
+        validFull = zeros((nbeams+1, ngates+1), dtype='bool')
         
         # Calculate deviation from boresight for center of beam
         bOffCenter = bmsep * (beams - nbeams/2.0)
         # Calculate deviation from boresight for edge of beam
         bOffEdge = bmsep * (beams - nbeams/2.0 - 0.5)
         
-        # Iterates through beams
+        # Iterates through beams, all gates of a beam being projected at once
         for ib in beams:
             # if none of frang, rsep or recrise are arrays, then only execute this for the first loop, otherwise, repeat for every beam
-            if (~isParamArray and ib == 0) or isParamArray:
+            if ib == 0 or isParamArray:
                 # Calculate center slant range
                 sRangCenter = slantRange(frang[ib], rsep[ib], recrise[ib], gates, center=True)
                 # Calculate edges slant range
                 sRangEdge = slantRange(frang[ib], rsep[ib], recrise[ib], gates, center=False)
+                # Map slant range to ground scatter range
+                if model == 'GS':
+                    sRangCenter = gsMapSlantRange(sRangCenter,altitude=None,elevation=None)
+                    sRangEdge = gsMapSlantRange(sRangEdge,altitude=None,elevation=None)
             # Save into output arrays
             slantRangeCenter[ib, :-1] = sRangCenter[:-1]
             slantRangeFull[ib,:] = sRangEdge
+
+            # Elevation/altitude of each gate of the current beam
+            tElev = elevation[ib,:] if isinstance(elevation, ndarray) else elevation
+            tAlt = altitude[ib,:] if isinstance(altitude, ndarray) else altitude
             
             # Calculate coordinates for Edge and Center of the current beam
-            for ig in gates:
-                # This is a bit redundant, but I could not think of any other way to deal with the array-or-not-array issue
-                if not isinstance(altitude, ndarray) and not isinstance(elevation, ndarray):
-                    tElev = elevation
-                    tAlt = altitude
-                elif isinstance(altitude, ndarray) and not isinstance(elevation, ndarray):
-                    tElev = elevation
-                    tAlt = altitude[ib,ig]
-                elif isinstance(elevation, ndarray) and not isinstance(altitude, ndarray):
-                    tElev = elevation[ib,ig]
-                    tAlt = altitude
-                else:
-                    tElev = elevation[ib,ig]
-                    tAlt = altitude[ib,ig]
+            latC, lonC = calcFieldPnt(siteLat, siteLon, siteAlt*1e-3, siteBore, bOffCenter[ib], sRangCenter, \
+                        elevation=tElev, altitude=tAlt, model=model)
+            latE, lonE = calcFieldPnt(siteLat, siteLon, siteAlt*1e-3, siteBore, bOffEdge[ib], sRangEdge, \
+                        elevation=tElev, altitude=tAlt, model=model)
 
-                if model == 'GS':
-                  if (~isParamArray and ib == 0) or isParamArray:
-                    slantRangeCenter[ib,ig] = gsMapSlantRange(sRangCenter[ig],altitude=None,elevation=None)
-                    slantRangeFull[ib,ig]   = gsMapSlantRange(sRangEdge[ig],altitude=None,elevation=None)
-                    sRangCenter[ig]         = slantRangeCenter[ib,ig]
-                    sRangEdge[ig]           = slantRangeFull[ib,ig] 
-
-                if (sRangCenter[ig] != -1) and (sRangEdge[ig] != -1):
-                  # Then calculate projections
-                  latC, lonC = calcFieldPnt(siteLat, siteLon, siteAlt*1e-3, siteBore, bOffCenter[ib], sRangCenter[ig], \
-                              elevation=tElev, altitude=tAlt, model=model)
-                  latE, lonE = calcFieldPnt(siteLat, siteLon, siteAlt*1e-3, siteBore, bOffEdge[ib], sRangEdge[ig], \
-                              elevation=tElev, altitude=tAlt, model=model)
-                              
-                  if(coords == 'mag'):
-                      latC, lonC, _ = aacgm.aacgmlib.aacgmConv(latC,lonC,0.,0)
-                      latE, lonE, _ = aacgm.aacgmlib.aacgmConv(latE,lonE,0.,0)
-                else:
-                  latC, lonC = nan, nan
-                  latE, lonE = nan, nan
+            # Gates for which the projection model breaks down
+            valid = (sRangCenter != -1) & (sRangEdge != -1)
                     
-                # Save into output arrays
-                latCenter[ib, ig] = latC
-                lonCenter[ib, ig] = lonC
-                latFull[ib, ig] = latE
-                lonFull[ib, ig] = lonE
+            # Save into output arrays
+            latCenter[ib, :] = np.where(valid, latC, nan)
+            lonCenter[ib, :] = np.where(valid, lonC, nan)
+            latFull[ib, :] = np.where(valid, latE, nan)
+            lonFull[ib, :] = np.where(valid, lonE, nan)
+            validFull[ib, :] = valid
+
+        # Convert the whole grids at once (not beam by beam), so that a repeated fov hits the cache
+        if(coords == 'mag') and validFull.any():
+            v = validFull
+            latFull[v], lonFull[v], _ = aacgm.aacgmConvCached(latFull[v], lonFull[v], 0., 0, minSize=0)
+            latCenter[v], lonCenter[v], _ = aacgm.aacgmConvCached(latCenter[v], lonCenter[v], 0., 0, minSize=0)
         
         # Output is...
         self.latCenter= latCenter[:-1,:-1]
@@ -249,6 +240,194 @@ class fov(object):
         return outstring
 
 
+# *************************************************************
+class fovCache(object):
+    """ Least-recently-used cache of :class:`fov` objects, optionally backed by a directory of 
+    pickled fov objects so that they can be shared between processes and sessions.
+    Entries are keyed on the site hardware record (tval, position, boresight, beam separation, 
+    receiver rise time, number of beams/gates) and on all the other :class:`fov` arguments.
+
+    **Args**:
+        * [**maxsize**] (int): maximum number of fov objects kept in memory
+        * [**cacheDir**] (str): directory where fov objects are pickled (no disk cache if None)
+    **Members**:
+        * **hits** (int): number of requests served from memory
+        * **diskHits** (int): number of requests served from the disk cache
+        * **misses** (int): number of requests that required a new projection
+    **Methods**:
+        * :func:`fovCache.get`
+        * :func:`fovCache.clear`
+        * :func:`fovCache.stats`
+    **Example**:
+        ::
+
+            cache = pydarn.radar.fovCache(maxsize=32, cacheDir='/tmp/fovs')
+            myFov = cache.get(site=site, rsep=45., ngates=75)
+            print cache.stats()
+
+    .. note:: cached fov objects are shared between callers and should not be modified in place.
+
+    """
+    def __init__(self, maxsize=64, cacheDir=None):
+        from collections import OrderedDict
+        import os
+
+        self.maxsize = maxsize
+        self.cacheDir = cacheDir
+        if cacheDir and not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        self._fovs = OrderedDict()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+
+    def key(self, site=None, **kwargs):
+        """Hash the site hardware record and fov arguments into a cache key
+
+        **Args**:
+            * [**site**]: site structure for a given radar and date-time
+            * all other keywords are passed on to :class:`fov`
+        **Returns**:
+            * **key** (str): hexadecimal digest identifying the projection
+        """
+        from numpy import ndarray, asarray
+        import inspect
+        import hashlib
+        import cPickle as pickle
+
+        def _norm(val):
+            # Arrays are keyed on their content, not their identity
+            if isinstance(val, ndarray) or isinstance(val, list):
+                val = asarray(val, dtype='float')
+                return ('array', val.shape, val.tostring())
+            return val
+
+        if site:
+            siteKey = (getattr(site, 'id', None), site.tval, 
+                site.geolat, site.geolon, site.alt, site.boresite, site.bmsep, 
+                site.recrise, site.maxbeam, site.maxgate)
+        else:
+            siteKey = None
+        # Fill in the fov defaults so that omitted and explicit default arguments share a key
+        args, _, _, defaults = inspect.getargspec(fov.__init__)
+        allArgs = dict( zip(args[-len(defaults):], defaults) )
+        allArgs.update(kwargs)
+        allArgs.pop('site', None)
+        argKey = tuple( (k, _norm(allArgs[k])) for k in sorted(allArgs.keys()) )
+
+        return hashlib.sha1( pickle.dumps((siteKey, argKey), 2) ).hexdigest()
+
+
+    def get(self, site=None, **kwargs):
+        """Get a fov object, computing it only if it is not already in the cache
+
+        **Args**:
+            * [**site**]: site structure for a given radar and date-time
+            * all other keywords are passed on to :class:`fov`
+        **Returns**:
+            * **fov** (:class:`fov`)
+        """
+        import os
+        import cPickle as pickle
+
+        key = self.key(site=site, **kwargs)
+
+        # In memory: move entry to the most recently used end
+        if key in self._fovs:
+            self.hits += 1
+            myFov = self._fovs.pop(key)
+            self._fovs[key] = myFov
+            return myFov
+
+        # On disk
+        myFov = None
+        if self.cacheDir:
+            fName = os.path.join(self.cacheDir, 'fov.{}.pkl'.format(key))
+            if os.path.isfile(fName):
+                try:
+                    with open(fName, 'rb') as f:
+                        myFov = pickle.load(f)
+                    self.diskHits += 1
+                except Exception as e:
+                    print 'fovCache: could not read {}: {}'.format(fName, e)
+                    myFov = None
+
+        # Compute a new projection
+        if myFov is None:
+            self.misses += 1
+            myFov = fov(site=site, **kwargs)
+            if self.cacheDir:
+                # Write to a temporary file first so that concurrent readers never see partial pickles
+                tmpName = '{}.{}.tmp'.format(fName, os.getpid())
+                with open(tmpName, 'wb') as f:
+                    pickle.dump(myFov, f, 2)
+                os.rename(tmpName, fName)
+
+        self._fovs[key] = myFov
+        while len(self._fovs) > self.maxsize:
+            self._fovs.popitem(last=False)
+
+        return myFov
+
+
+    def clear(self, disk=False):
+        """Empty the cache and reset counters
+
+        **Args**:
+            * [**disk**] (bool): also remove the pickled fov objects from cacheDir
+        """
+        import os
+        import glob
+
+        self._fovs.clear()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        if disk and self.cacheDir:
+            for fName in glob.glob(os.path.join(self.cacheDir, 'fov.*.pkl')):
+                os.remove(fName)
+
+
+    def stats(self):
+        """Cache usage statistics
+
+        **Returns**:
+            * **stats** (dict): hits, diskHits, misses and current number of in-memory entries
+        """
+        return {'hits': self.hits, 
+                'diskHits': self.diskHits, 
+                'misses': self.misses, 
+                'size': len(self._fovs)}
+
+
+    def __len__(self):
+        return len(self._fovs)
+
+
+# Cache shared by the plotting routines
+defaultFovCache = fovCache()
+
+
+# *************************************************************
+def getFov(site=None, cache=None, **kwargs):
+    """Get a field of view, reusing a previously computed projection when one exists 
+    for the same site hardware record and fov arguments.
+
+**INPUTS**:
+    * [**site**]: site structure for a given radar and date-time
+    * [**cache**] (:class:`fovCache`): cache to use (defaults to the module-wide defaultFovCache)
+    * all other keywords are passed on to :class:`fov`
+
+**OUTPUT**:
+    * **fov** (:class:`fov`): shared object, do not modify in place
+
+    """
+    if cache is None: cache = defaultFovCache
+
+    return cache.get(site=site, **kwargs)
+
+
 # *************************************************************
 # *************************************************************
 def calcFieldPnt(tGeoLat, tGeoLon, tAlt, boreSight, boreOffset, slantRange, \
@@ -259,6 +438,9 @@ the pointing direction deviation from boresight and elevation angle, and the
 field point slant range and altitude. Either the elevation or the altitude must 
 be provided. If none is provided, the altitude is set to 300 km and the elevation 
 evaluated to accomodate altitude and range.
+All inputs can be scalars or arrays of any broadcastable shape (e.g., one slant range, 
+boresight offset and elevation per echo), in which case the outputs are arrays of the 
+broadcast shape.
 
 **INPUTS**:
     * **tGeoLat**: transmitter latitude [degree, N]
@@ -276,9 +458,31 @@ evaluated to accomodate altitude and range.
         * ... more to come
     * **coords**: 'geo' (more to come)
 
+**OUTPUT**:
+    * **lat**: field point latitude [degree, N]
+    * **lon**: field point longitude [degree, E]
+
     """
-    from math import radians, degrees, sin, cos, asin, atan, sqrt, pi
+    import numpy as np
     from utils import Re, geoPack
+
+    # Elevation and altitude are considered missing if None (or a zero scalar)
+    noElev = elevation is None or (np.ndim(elevation) == 0 and not elevation)
+    noAlt = altitude is None or (np.ndim(altitude) == 0 and not altitude)
+
+    # Work on flat arrays of the broadcast shape
+    bcast = np.broadcast(tGeoLat, tGeoLon, tAlt, boreSight, boreOffset, slantRange, 
+        0. if noElev else elevation, 0. if noAlt else altitude)
+    shape = bcast.shape
+    def _flat(val):
+        return ( np.zeros(shape) + np.asarray(val, dtype='float') ).ravel()
+    tGeoLat, tGeoLon, tAlt = _flat(tGeoLat), _flat(tGeoLon), _flat(tAlt)
+    boreSight, boreOffset, slantRange = _flat(boreSight), _flat(boreOffset), _flat(slantRange)
+    if not noElev: elevation = _flat(elevation)
+    if not noAlt: altitude = _flat(altitude)
+
+    def _out(lat, lon):
+        return lat.reshape(shape)[()], lon.reshape(shape)[()]
     
     # Make sure we have enough input stuff
     # if (not model) and (not elevation or not altitude): model = 'IS'
@@ -287,69 +491,96 @@ evaluated to accomodate altitude and range.
     # Classic Ionospheric/Ground scatter projection model
     if model in ['IS','GS']:
         # Make sure you have altitude, because these 2 projection models rely on it
-        if not elevation and not altitude:
+        if noElev and noAlt:
             # Set default altitude to 300 km
-            altitude = 300.0
-        elif elevation and not altitude:
+            altitude = _flat(300.0)
+        elif noAlt:
             # If you have elevation but not altitude, then you calculate altitude, and elevation will be adjusted anyway
-            altitude = sqrt( Re**2 + slantRange**2 + 2. * slantRange * Re * sin( radians(elevation) ) ) - Re
+            altitude = np.sqrt( Re**2 + slantRange**2 + 2. * slantRange * Re * np.sin( np.radians(elevation) ) ) - Re
         
         # Now you should have altitude (and maybe elevation too, but it won't be used in the rest of the algorithm)
         # Adjust altitude so that it makes sense with common scatter distribution
-        xAlt = altitude
-        if model == 'IS':
-            if altitude > 150. and slantRange <= 600: 
-                xAlt = 115.
-            elif altitude > 150. and slantRange > 600. and  slantRange <= 800.:
-                xAlt = 115. + ( slantRange - 600. ) / 200. * ( altitude - 115. )
-        elif model == 'GS':
-            if altitude > 150. and slantRange <= 300: 
-                xAlt = 115.
-            elif altitude > 150. and slantRange > 300. and  slantRange <= 500.:
-                xAlt = 115. + ( slantRange - 300. ) / 200. * ( altitude - 115. )
-        if slantRange < 150.: xAlt = slantRange / 150. * 115.
+        xAlt = _virtualHeight(slantRange, altitude, model)
         
         # To start, set Earth radius below field point to Earth radius at radar
         (lat,lon,tRe) = geoPack.geodToGeoc(tGeoLat, tGeoLon)
-        RePos = tRe
+        RePos = tRe.copy()
+
+        latOut = np.empty(slantRange.shape)
+        lonOut = np.empty(slantRange.shape)
         
         # Iterate until the altitude corresponding to the calculated elevation matches the desired altitude
+        # Only the field points that have not converged yet are updated at each iteration
+        todo = np.arange(slantRange.size)
         n = 0L # safety counter
-        while True:
+        while todo.size > 0:
+            sr = slantRange[todo]
+            tR = tRe[todo] + tAlt[todo]
+
             # pointing elevation (spherical Earth value) [degree]
-            tel = degrees( asin( ((RePos+xAlt)**2 - (tRe+tAlt)**2 - slantRange**2) / (2. * (tRe+tAlt) * slantRange) ) )
+            with np.errstate(invalid='ignore'):
+                tel = np.degrees( np.arcsin( ((RePos[todo]+xAlt[todo])**2 - tR**2 - sr**2) / (2. * tR * sr) ) )
             
             # estimate off-array-normal azimuth (because it varies slightly with elevation) [degree]
-            bOff = calcAzOffBore(tel, boreOffset)
+            bOff = calcAzOffBore(tel, boreOffset[todo])
             
             # pointing azimuth
-            taz = boreSight + bOff
+            taz = boreSight[todo] + bOff
             
             # calculate position of field point
-            dictOut = geoPack.calcDistPnt(tGeoLat, tGeoLon, tAlt, dist=slantRange, el=tel, az=taz)
+            dictOut = geoPack.calcDistPnt(tGeoLat[todo], tGeoLon[todo], tAlt[todo], dist=sr, el=tel, az=taz)
+            latOut[todo] = dictOut['distLat']
+            lonOut[todo] = dictOut['distLon']
             
             # Update Earth radius 
-            RePos = dictOut['distRe']
+            RePos[todo] = dictOut['distRe']
             
             # stop if the altitude is what we want it to be (or close enough)
             n += 1L
-            if abs(xAlt - dictOut['distAlt']) <= 0.5 or n > 2:
-                return dictOut['distLat'], dictOut['distLon']
-                break
+            if n > 2: break
+            with np.errstate(invalid='ignore'):
+                todo = todo[ ~(np.abs(xAlt[todo] - dictOut['distAlt']) <= 0.5) ]
+
+        return _out(latOut, lonOut)
     
     # No projection model (i.e., the elevation or altitude is so good that it gives you the proper projection by simple geometric considerations)
     elif not model:
         # Using no models simply means tracing based on trustworthy elevation or altitude
-        if not altitude:
-            altitude = sqrt( Re**2 + slantRange**2 + 2. * slantRange * Re * sin( radians(elevation) ) ) - Re
-        if not elevation:
-            if(slantRange < altitude): altitude = slantRange - 10
-            elevation = degrees( asin( ((Re+altitude)**2 - (Re+tAlt)**2 - slantRange**2) / (2. * (Re+tAlt) * slantRange) ) )
+        if noAlt:
+            altitude = np.sqrt( Re**2 + slantRange**2 + 2. * slantRange * Re * np.sin( np.radians(elevation) ) ) - Re
+        if noElev:
+            altitude = np.where(slantRange < altitude, slantRange - 10, altitude)
+            with np.errstate(invalid='ignore'):
+                elevation = np.degrees( np.arcsin( ((Re+altitude)**2 - (Re+tAlt)**2 - slantRange**2) / (2. * (Re+tAlt) * slantRange) ) )
         # The tracing is done by calcDistPnt
         dict = geoPack.calcDistPnt(tGeoLat, tGeoLon, tAlt, dist=slantRange, el=elevation, az=boreSight+boreOffset)
-        return dict['distLat'], dict['distLon']
+        return _out(dict['distLat'], dict['distLon'])
     
 
+# *************************************************************
+def _virtualHeight(slantRange, altitude, model):
+    """Altitude assigned to field points by the IS/GS projection models, 
+    given their slant range and nominal altitude (scalars or broadcastable arrays)
+    """
+    import numpy as np
+
+    slantRange = np.asarray(slantRange, dtype='float')
+    altitude = np.zeros(slantRange.shape) + altitude
+    xAlt = altitude.copy()
+    if model == 'IS':
+        r0, r1 = 600., 800.
+    elif model == 'GS':
+        r0, r1 = 300., 500.
+    inds = (altitude > 150.) & (slantRange <= r0)
+    xAlt[inds] = 115.
+    inds = (altitude > 150.) & (slantRange > r0) & (slantRange <= r1)
+    xAlt[inds] = 115. + ( slantRange[inds] - r0 ) / 200. * ( altitude[inds] - 115. )
+    inds = slantRange < 150.
+    xAlt[inds] = slantRange[inds] / 150. * 115.
+
+    return xAlt
+
+
 # *************************************************************
 # *************************************************************
 def slantRange(frang, rsep, recrise, range_gate, center=True):
@@ -387,31 +618,29 @@ Calculate off-boresight azimuth as a function of elevation angle and zero-elevat
 See Milan et al. [1997] for more details on how this works.
 
 **INPUTS**:
-    * **elevation**: elevation angle [degree]
-    * **boreOffset0**: zero-elevation off-boresight azimuth [degree]
+    * **elevation**: elevation angle [degree] (scalar or ndarray)
+    * **boreOffset0**: zero-elevation off-boresight azimuth [degree] (scalar or ndarray)
 
 **OUTPUT**:
     * **boreOffset**: off-boresight azimuth [degree]
 
     """
-    from math import radians, degrees, cos, sin, atan, pi, sqrt
+    import numpy as np
     
-    if ( cos(radians(boreOffset0))**2 - sin(radians(elevation))**2 ) < 0:
-        if boreOffset0 >= 0: boreOffset = pi/2.
-        else: boreOffset = -pi/2.
-    else:
-        tan_bOff = sqrt( sin(radians(boreOffset0))**2 / ( cos(radians(boreOffset0))**2 - sin(radians(elevation))**2 ) )
-        if boreOffset0 >= 0: boreOffset = atan( tan_bOff )
-        else: boreOffset = -atan( tan_bOff )
+    cosb2 = np.cos(np.radians(boreOffset0))**2 - np.sin(np.radians(elevation))**2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tan_bOff = np.sqrt( np.sin(np.radians(boreOffset0))**2 / cosb2 )
+    boreOffset = np.where(cosb2 < 0, np.pi/2., np.arctan( tan_bOff ))
+    boreOffset = np.where(np.asarray(boreOffset0) >= 0, boreOffset, -boreOffset)
         
-    return degrees(boreOffset)
+    return np.degrees(boreOffset)[()]
 
 def gsMapSlantRange(slantRange,altitude=None,elevation=None):
   """
 Calculate the ground scatter mapped slant range. See Bristow et al. [1994] for more details.
 
 **INPUTS**:
-    * **slantRange**: normal slant range [km]
+    * **slantRange**: normal slant range [km] (scalar or ndarray)
     * **altitude**:   altitude [km] (defaults to 300 km)
     * **elevation**:  elevation angle [degree]
 
@@ -421,20 +650,19 @@ Calculate the ground scatter mapped slant range. See Bristow et al. [1994] for m
       this model breaks down.
 
   """
-  from math import radians, degrees, sin, cos, asin, atan, sqrt, pi
+  import numpy as np
   from utils import Re, geoPack
 
   # Make sure you have altitude, because these 2 projection models rely on it
-  if not elevation and not altitude:
+  if elevation is None and altitude is None:
       # Set default altitude to 300 km
       altitude = 300.0
-  elif elevation and not altitude:
+  elif altitude is None:
       # If you have elevation but not altitude, then you calculate altitude, and elevation will be adjusted anyway
-      altitude = sqrt( Re**2 + slantRange**2 + 2. * slantRange * Re * sin( radians(elevation) ) ) - Re
+      altitude = np.sqrt( Re**2 + slantRange**2 + 2. * slantRange * Re * np.sin( np.radians(elevation) ) ) - Re
 
-  if (slantRange**2)/4. - altitude**2 >= 0:
-    gsSlantRange = Re * asin(sqrt(slantRange**2/4. - altitude**2)/Re) #From Bristow et al. [1994]
-  else:
-    gsSlantRange = -1
+  gsr2 = (np.asarray(slantRange, dtype='float')**2)/4. - altitude**2
+  with np.errstate(invalid='ignore'):
+    gsSlantRange = np.where(gsr2 >= 0, Re * np.arcsin(np.sqrt(gsr2)/Re), -1) #From Bristow et al. [1994]
 
-  return gsSlantRange
+  return gsSlantRange[()]
@@ -0,0 +1,189 @@
+# Copyright (C) 2012  VT SuperDARN Lab
+# Full license can be found in LICENSE.txt
+"""
+*********************
+**Module**: pydarn.radar.radGeoloc
+*********************
+Batch geolocation of radar echoes. Echoes are handled in columnar form,
+i.e., a dictionary of 1-D arrays with one element per (beam, gate) echo,
+so that days of fitted data can be geolocated with a handful of vectorized calls.
+
+**Functions**:
+    * :func:`pydarn.radar.radGeoloc.readFitColumns`: Read fitted data into columns
+    * :func:`pydarn.radar.radGeoloc.geolocateEchoes`: Calculate echo positions
+
+"""
+
+# Columns filled by readFitColumns, one element per echo
+_echoCols = ['time', 'stid', 'bmnum', 'slist', 'frang', 'rsep', 'recrise',
+    'tfreq', 'gflg', 'p_l', 'v', 'w_l', 'elv']
+
+
+# *************************************************************
+def readFitColumns(myPtr, eTime=None):
+    """Read fitted records from an open data pointer into columns (one element per echo)
+
+    **Args**:
+        * **myPtr** (:class:`pydarn.sdio.radDataTypes.radDataPtr`): open data pointer
+        * [**eTime**] (datetime.datetime): stop reading after this time (defaults to the pointer end time)
+    **Returns**:
+        * **cols** (dict): 1-D arrays with keys 'time', 'stid', 'bmnum', 'slist', 'frang', 'rsep',
+          'recrise', 'tfreq', 'gflg', 'p_l', 'v', 'w_l', 'elv'. Missing elevation angles are set to NaN.
+    **Example**:
+        ::
+
+            myPtr = pydarn.sdio.radDataOpen(sTime, 'bks', eTime=eTime, fileType='fitacf')
+            cols = pydarn.radar.readFitColumns(myPtr)
+
+    """
+    from pydarn.sdio import radDataReadRec
+    import numpy as np
+
+    tmp = dict( (k, []) for k in _echoCols )
+
+    myBeam = radDataReadRec(myPtr)
+    while myBeam is not None:
+        if eTime and myBeam.time > eTime: break
+        slist = myBeam.fit.slist
+        if slist:
+            npnts = len(slist)
+            tmp['time'].append( np.repeat(myBeam.time, npnts) )
+            tmp['stid'].append( np.repeat(myBeam.stid, npnts) )
+            tmp['bmnum'].append( np.repeat(myBeam.bmnum, npnts) )
+            tmp['frang'].append( np.repeat(myBeam.prm.frang, npnts) )
+            tmp['rsep'].append( np.repeat(myBeam.prm.rsep, npnts) )
+            tmp['recrise'].append( np.repeat(myBeam.prm.rxrise, npnts) )
+            tmp['tfreq'].append( np.repeat(myBeam.prm.tfreq, npnts) )
+            tmp['slist'].append( np.asarray(slist) )
+            for k in ['gflg', 'p_l', 'v', 'w_l']:
+                tmp[k].append( np.asarray(getattr(myBeam.fit, k), dtype='float') )
+            elv = myBeam.fit.elv
+            if elv is None or len(elv) != npnts:
+                elv = np.nan * np.ones(npnts)
+            tmp['elv'].append( np.asarray(elv, dtype='float') )
+        myBeam = radDataReadRec(myPtr)
+
+    cols = {}
+    for k, v in tmp.items():
+        cols[k] = np.concatenate(v) if v else np.empty(0)
+    for k in ['stid', 'bmnum', 'slist']:
+        cols[k] = cols[k].astype('int')
+
+    return cols
+
+
+# *************************************************************
+def geolocateEchoes(cols, model='IS', altitude=300., coords='geo', site=None, cache=True):
+    """Calculate the position of every echo in columnar fitted data
+
+    **Args**:
+        * **cols** (dict): 1-D arrays with one element per echo, with at least the keys 'time', 'bmnum',
+          'slist', 'frang' and 'rsep' (and 'elv' for model 'elv'), as returned by :func:`readFitColumns`.
+          'stid' is needed if no site is given and 'recrise' defaults to the site receiver rise time.
+        * [**model**]:
+            * **'IS'**: ionospheric scatter projection model at a fixed virtual height (default)
+            * **'GS'**: ground scatter projection model at a fixed virtual height
+            * **'elv'**: straight line projection using the measured elevation angle of each echo
+        * [**altitude**] (float): virtual height [km] for the 'IS' and 'GS' models
+        * [**coords**]: 'geo' or 'mag'
+        * [**site**] (:class:`pydarn.radar.site`): radar site (looked up from 'stid' and 'time' if None)
+        * [**cache**] (bool): use the shared fov cache for the fixed-height models
+    **Returns**:
+        * **pos** (dict): 1-D arrays with keys:
+            * **lat**: echo latitude [degree]
+            * **lon**: echo longitude [degree]
+            * **alt**: echo altitude [km]
+            * **azm**: azimuth of the echo as seen from the radar [degree E]
+          Echoes that cannot be projected are set to NaN.
+    **Example**:
+        ::
+
+            cols = pydarn.radar.readFitColumns(myPtr)
+            pos = pydarn.radar.geolocateEchoes(cols, model='elv')
+
+    """
+    from utils import Re, greatCircleAzm
+    from radFov import fov, getFov, slantRange, calcFieldPnt, gsMapSlantRange, _virtualHeight
+    from radStruct import radar
+    import numpy as np
+
+    assert model in ['IS', 'GS', 'elv'], 'geolocateEchoes: unknown model {}'.format(model)
+
+    nEchoes = len(cols['slist'])
+    bmnum = np.asarray(cols['bmnum'], dtype='int')
+    slist = np.asarray(cols['slist'], dtype='int')
+    frang = np.asarray(cols['frang'], dtype='float')
+    rsep = np.asarray(cols['rsep'], dtype='float')
+
+    pos = dict( (k, np.nan * np.ones(nEchoes)) for k in ['lat', 'lon', 'alt', 'azm'] )
+    if nEchoes == 0: return pos
+
+    # Site of each echo
+    if site:
+        sites = [site]
+        siteInd = np.zeros(nEchoes, dtype='int')
+    else:
+        stids = np.asarray(cols['stid'], dtype='int')
+        times = np.asarray(cols['time'])
+        sites, siteInd = [], np.zeros(nEchoes, dtype='int')
+        for stid in np.unique(stids):
+            rad = radar(radId=stid)
+            radInd = rad.sitesAt(times[stids == stid], index=True)
+            uInd, uInv = np.unique(radInd, return_inverse=True)
+            siteInd[stids == stid] = np.arange(len(sites), len(sites)+len(uInd))[uInv]
+            sites += [rad.sites[i] if i >= 0 else None for i in uInd]
+
+    for isite, site in enumerate(sites):
+        if not site: continue
+        inSite = np.flatnonzero(siteInd == isite)
+        recrise = np.asarray(cols['recrise'], dtype='float')[inSite] \
+            if 'recrise' in cols else site.recrise * np.ones(inSite.size)
+
+        if model == 'elv':
+            # Straight line projection using the measured elevation angle
+            bOff = site.bmsep * (bmnum[inSite] - site.maxbeam/2.0)
+            sRange = slantRange(frang[inSite], rsep[inSite], recrise, slist[inSite], center=True)
+            elv = np.asarray(cols['elv'], dtype='float')[inSite]
+            good = np.isfinite(elv)
+            lat, lon = calcFieldPnt(site.geolat, site.geolon, site.alt*1e-3, site.boresite,
+                bOff[good], sRange[good], elevation=elv[good], model=None)
+            ind = inSite[good]
+            pos['lat'][ind] = lat
+            pos['lon'][ind] = lon
+            pos['alt'][ind] = np.sqrt( Re**2 + sRange[good]**2 +
+                2. * sRange[good] * Re * np.sin( np.radians(elv[good]) ) ) - Re
+        else:
+            # Fixed virtual height: one (cached) fov per radar operating mode
+            modes = np.empty(inSite.size, dtype=[('frang', 'float'), ('rsep', 'float'), ('recrise', 'float')])
+            modes['frang'] = frang[inSite]
+            modes['rsep'] = rsep[inSite]
+            modes['recrise'] = recrise
+            uModes, modeInd = np.unique(modes, return_inverse=True)
+            for im, mode in enumerate(uModes):
+                inMode = inSite[modeInd == im]
+                mfrang, mrsep, mrecrise = float(mode['frang']), float(mode['rsep']), float(mode['recrise'])
+                kwargs = dict(site=site, frang=mfrang, rsep=mrsep, recrise=mrecrise,
+                    nbeams=site.maxbeam, ngates=max(site.maxgate, slist[inMode].max()+1),
+                    altitude=altitude, model=model, coords='geo')
+                myFov = getFov(**kwargs) if cache else fov(**kwargs)
+                pos['lat'][inMode] = myFov.latCenter[bmnum[inMode], slist[inMode]]
+                pos['lon'][inMode] = myFov.lonCenter[bmnum[inMode], slist[inMode]]
+                # Virtual height actually used by the projection model
+                sRange = slantRange(mfrang, mrsep, mrecrise, slist[inMode], center=True)
+                if model == 'GS':
+                    sRange = gsMapSlantRange(sRange, altitude=None, elevation=None)
+                pos['alt'][inMode] = _virtualHeight(sRange, altitude, model)
+
+        pos['alt'][inSite[~np.isfinite(pos['lat'][inSite])]] = np.nan
+        ind = inSite[np.isfinite(pos['lat'][inSite])]
+        pos['azm'][ind] = greatCircleAzm(site.geolat, site.geolon, pos['lat'][ind], pos['lon'][ind])
+
+    # Convert to magnetic coordinates
+    if coords == 'mag':
+        import models.aacgm as aacgm
+        good = np.flatnonzero( np.isfinite(pos['lat']) )
+        mlat, mlon, _ = aacgm.aacgmConvNp(pos['lat'][good], pos['lon'][good], pos['alt'][good], 0)
+        pos['lat'][good] = mlat
+        pos['lon'][good] = mlon
+
+    return pos
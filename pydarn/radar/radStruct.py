@@ -28,6 +28,7 @@ class network(object):
         * :func:`network.getRadarByName`
         * :func:`network.getRadarByCode`
         * :func:`network.getRadarsByPosition`
+        * :func:`network.getRadarsByPositions`
         * :func:`network.getAllCodes`
     **Example**:
         ::
@@ -39,13 +40,41 @@ class network(object):
     written by Sebastien, 2012-08
     """
 
-    def __init__(self):
+    # Instance shared by every call to network(), and modification time of the DB it was read from
+    _shared = None
+    _sharedMtime = None
+
+    def __new__(cls, fresh=False):
+        """Return the process-wide network instance, unless it is missing, 
+        out of date with respect to the radar DB, or a fresh instance is requested
+        """
+        import os
+
+        dbname = _dbName()
+        mtime = os.path.getmtime(dbname) if os.path.isfile(dbname) else None
+        if fresh or cls._shared is None or cls._sharedMtime != mtime:
+            obj = object.__new__(cls)
+            obj._loaded = False
+            if not fresh and mtime is not None:
+                cls._shared, cls._sharedMtime = obj, mtime
+            return obj
+        return cls._shared
+
+    def __getnewargs__(self):
+        # Unpickled networks should never replace the shared instance
+        return (True,)
+
+    def __init__(self, fresh=False):
         """Default class constructor
+        All radars and sites are read with two queries on a single DB connection. 
+        The resulting object is shared by all callers (so that constructing a network 
+        is free after the first time), and is reloaded only if the DB is updated.
         
         **Belongs to**: :class:`network`
         
         **Args**: 
-            * **None**
+            * [**fresh**] (bool): read a new, private, copy of the network instead of the shared one 
+              (use this if you intend to modify the object)
         **Returns**:
             * **network** (obj)
                     
@@ -54,25 +83,35 @@ class network(object):
         import sqlite3 as lite
         import os
 
+        # The shared instance is already filled
+        if self._loaded: return
+
         self.radars = []
+        self.nradar = 0
         # Get DB name
-        rad_path = os.path.dirname( os.path.abspath( __file__ ) )
-        dbname = os.path.join(rad_path, 'radars.sqlite')
+        dbname = _dbName()
 
         if not os.path.isfile(dbname):
             print "%s not found" % dbname
             return
 
-        with lite.connect(dbname) as conn:
+        with lite.connect(dbname, detect_types=lite.PARSE_DECLTYPES) as conn:
             cur = conn.cursor()
-            cur.execute("select count() from rad")
-            self.nradar = cur.fetchone()[0]
-            cur.execute("select id from rad")
-            rows = cur.fetchall()
+            cur.execute('SELECT * FROM rad')
+            radRows = cur.fetchall()
+            cur.execute('SELECT * FROM hdw ORDER BY id, tval ASC')
+            hdwRows = cur.fetchall()
+
+        # Group hardware records by radar
+        sitesById = {}
+        for row in hdwRows:
+            sitesById.setdefault(row[0], []).append(row)
 
-        for row in rows:
+        for row in radRows:
             self.radars.append(radar())
-            self.radars[-1].fillFromSqlite(dbname, row[0])
+            self.radars[-1]._fillFromRows(row, sitesById.get(row[0], []))
+        self.nradar = len(self.radars)
+        self._loaded = True
             
     def __len__(self):
         """Object length (number of radars)
@@ -235,7 +274,7 @@ class network(object):
         **Args**: 
             * **lat**: latitude of given point in geographic coordinates
             * **lon**: longitude of given point in geographic coordinates
-            * **alt**: altitude of point above the Earth's surface in km
+            * **alt**: altitude of point above the Earth's surface in km (ignored: distances are computed at 300 km)
             * **[distMax]**: maximum distance of given point from radar
             * **[datetime]**: python datetime object (defaults to today)
         **Returns**:
@@ -249,49 +288,153 @@ class network(object):
                 radars = obj.getRadarsByPosition(67., 134., 300.)
                     
         written by Sebastien, 2012-08
+        """
+        # Distances have always been computed at 300 km here, whatever alt is
+        # (use getRadarsByPositions to take the altitude into account)
+        found = self.getRadarsByPositions(lat, lon, 300., distMax=distMax, datetime=datetime)
+        if len(found['point']) == 0: return False
+
+        byId = dict( (rad.id, rad) for rad in self.radars )
+        out = {'radars': [byId[radId] for radId in found['radId']], 
+                'dist': list(found['dist']), 
+                'beam': list(found['beam'])}
+        return out
+
+    def getRadarsByPositions(self, lat, lon, alt=300., distMax=4000., datetime=None):
+        """Get the radars able to see each one of a set of points on Earth
+        Points are matched against a spatial index of all radar sites (unit vectors on the sphere 
+        and hardware epochs), so that large numbers of points can be processed with a few 
+        vectorized operations per site.
+        
+        **Belongs to**: :class:`network`
+        
+        **Args**: 
+            * **lat**: latitude of given points in geographic coordinates (scalar or array)
+            * **lon**: longitude of given points in geographic coordinates (scalar or array)
+            * **[alt]**: altitude of given points above the Earth's surface in km (scalar or array)
+            * **[distMax]**: maximum distance of given points from radar
+            * **[datetime]**: python datetime object, or array of datetimes (one per point). Defaults to today
+        **Returns**:
+            * A dictionnary of arrays with one element per (point, radar) match, sorted by point then radar:
+                * 'point': index of the point in the (flattened) input arrays
+                * 'radId': ID of the radar seeing the point
+                * 'dist': distance from radar to point
+                * 'beam': beam seeing the point
+        **Example**:
+            ::
+
+                found = obj.getRadarsByPositions(lats, lons, 300., datetime=times)
+                    
         """
         from datetime import datetime as dt
         from utils import geoPack as geo
-        from numpy import sin, cos, arccos, dot, cross, sign
-        from math import radians, degrees
+        from utils import RePol, ReEqu
+        import numpy as np
         
-        if not datetime: datetime = dt.utcnow()
+        if datetime is None: datetime = dt.utcnow()
+
+        times = np.asarray(datetime, dtype='datetime64[us]')
+        shape = np.broadcast(np.asarray(lat), np.asarray(lon), np.asarray(alt), times).shape
+        lat = (np.zeros(shape) + np.asarray(lat, dtype='float')).ravel()
+        lon = (np.zeros(shape) + np.asarray(lon, dtype='float')).ravel()
+        alt = (np.zeros(shape) + np.asarray(alt, dtype='float')).ravel()
+        times = (np.zeros(shape, dtype='timedelta64[us]') + times).ravel()
+
+        # Unit vectors of all points
+        cLat = np.cos( np.radians(lat) )
+        pX = cLat * np.cos( np.radians(lon) )
+        pY = cLat * np.sin( np.radians(lon) )
+        pZ = np.sin( np.radians(lat) )
+        # Points within distMax of a site are within this angle of it (as long as both are above 
+        # the Earth's surface), plus a margin for the difference between geodetic and geocentric latitudes
+        rMin = min(RePol, ReEqu) + (min(0., alt.min()) if alt.size else 0.)
+        angMax = 2.*np.arcsin( min(1., .5*distMax/rMin) ) + np.radians(.5)
+        cosMax = np.cos( min(np.pi, angMax) )
+
+        outPnt, outRad, outDist, outBeam = [], [], [], []
+        index = self._positionIndex()
+        for iSit, site in enumerate(index['sites']):
+            # Candidate points: near the site, in the same hemisphere, at a time the site was in use
+            near = pX*index['x'][iSit] + pY*index['y'][iSit] + pZ*index['z'][iSit] >= cosMax
+            near &= site.geolat*lat >= 0.
+            near &= (times > index['tStart'][iSit]) & (times <= index['tEnd'][iSit])
+            pnt = np.flatnonzero(near)
+            if pnt.size == 0: continue
 
-        found = False
-        out = {'radars': [], 
-                'dist': [], 
-                'beam': []}
-        for iRad in xrange( self.nradar ):
-            site = self.radars[iRad].getSiteByDate(datetime)
-            # Skip if radar inactive at date
-            if (not site) and (self.radars[iRad].status != 1): continue
-            if not (self.radars[iRad].stTime <= datetime <= self.radars[iRad].edTime): continue
-            # Skip if radar in other hemisphere
-            if site.geolat*lat < 0.: continue
             distPnt = geo.calcDistPnt(site.geolat, site.geolon, site.alt, 
-                            distLat=lat, distLon=lon, distAlt=300.)
-            # Skip if radar too far
-            if distPnt['dist'] > distMax: continue
-            # minAz = (site.boresite % 360.)-abs(site.bmsep)*site.maxbeam/2
-            # maxAz = (site.boresite % 360.)+abs(site.bmsep)*site.maxbeam/2
+                            distLat=lat[pnt], distLon=lon[pnt], distAlt=alt[pnt])
+            dist = distPnt['dist']
+            # Angle between boresight and direction of the point
+            dAz = np.radians(distPnt['az'] - site.boresite)
+            deltAz = np.degrees( np.arccos( np.clip(np.cos(dAz), -1., 1.) ) )
             extFov = abs(site.bmsep)*site.maxbeam/2
-            ptBo = [cos(radians(site.boresite)), sin(radians(site.boresite))]
-            ptAz = [cos(radians(distPnt['az'])), sin(radians(distPnt['az']))]
-            deltAz = degrees( arccos( dot(ptBo, ptAz) ) )
-            # Skip if out of azimuth range
-            if not abs(deltAz) <= extFov: continue
-            if sign(cross(ptBo, ptAz)) >= 0:
-                beam = int( site.maxbeam/2 + round( deltAz/site.bmsep ) - 1 )
-            else:
-                beam = int( site.maxbeam/2 - round( deltAz/site.bmsep ) )
-            # Update output
-            found = True
-            out['radars'].append(self.radars[iRad])
-            out['dist'].append(distPnt['dist'])
-            out['beam'].append(beam)
+            good = (dist <= distMax) & (deltAz <= extFov)
+            if not good.any(): continue
+            beam = np.where(np.sin(dAz[good]) >= 0, 
+                site.maxbeam/2 + np.round(deltAz[good]/site.bmsep) - 1, 
+                site.maxbeam/2 - np.round(deltAz[good]/site.bmsep))
+
+            outPnt.append( pnt[good] )
+            outRad.append( np.repeat(index['iRad'][iSit], good.sum()) )
+            outDist.append( dist[good] )
+            outBeam.append( beam.astype('int') )
+
+        if outPnt:
+            outPnt, outRad = np.concatenate(outPnt), np.concatenate(outRad)
+            outDist, outBeam = np.concatenate(outDist), np.concatenate(outBeam)
+        else:
+            outPnt, outRad = np.empty(0, dtype='int'), np.empty(0, dtype='int')
+            outDist, outBeam = np.empty(0), np.empty(0, dtype='int')
+        order = np.lexsort( (outRad, outPnt) )
+
+        out = {'point': outPnt[order], 
+                'radId': np.array([self.radars[iRad].id for iRad in outRad[order]], dtype='int'), 
+                'dist': outDist[order], 
+                'beam': outBeam[order]}
+        return out
+
+    def _positionIndex(self):
+        """Spatial index of all radar sites, used by :func:`network.getRadarsByPositions`
+        Each site comes with its radar index, the unit vector of its location and the 
+        period ]tStart, tEnd] during which it was in use.
+        The index is built the first time it is needed.
+        
+        **Belongs to**: :class:`network`
+        """
+        import numpy as np
 
-        if found: return out
-        else: return found
+        index = getattr(self, '_posIndex', None)
+        if index is not None and index['nradar'] == self.nradar: return index
+
+        tMin, tMax = np.datetime64('0001-01-01', 'us'), np.datetime64('9999-12-31', 'us')
+        index = {'nradar': self.nradar, 'sites': [], 'iRad': [], 'tStart': [], 'tEnd': []}
+        for iRad, rad in enumerate(self.radars):
+            stTime = np.datetime64(rad.stTime, 'us') if rad.stTime else tMin
+            edTime = np.datetime64(rad.edTime, 'us') if rad.edTime else tMax
+            tPrev = tMin
+            for site in rad.sites[:rad.snum]:
+                tval = tMax if site.tval == -1 else np.datetime64(site.tval, 'us')
+                # Sites are only used while the radar is operating
+                tStart, tEnd = max(tPrev, stTime - np.timedelta64(1, 'us')), min(tval, edTime)
+                if tEnd > tStart:
+                    index['sites'].append(site)
+                    index['iRad'].append(iRad)
+                    index['tStart'].append(tStart)
+                    index['tEnd'].append(tEnd)
+                if site.tval == -1: break
+                tPrev = tval
+
+        lat = np.radians([site.geolat for site in index['sites']])
+        lon = np.radians([site.geolon for site in index['sites']])
+        index['x'] = np.cos(lat) * np.cos(lon)
+        index['y'] = np.cos(lat) * np.sin(lon)
+        index['z'] = np.sin(lat)
+        index['iRad'] = np.array(index['iRad'], dtype='int')
+        index['tStart'] = np.array(index['tStart'], dtype='datetime64[us]')
+        index['tEnd'] = np.array(index['tEnd'], dtype='datetime64[us]')
+
+        self._posIndex = index
+        return index
         
     def getAllCodes(self, datetime=None, hemi=None):
         """Get a list of all active radar codes
@@ -364,12 +507,11 @@ class radar(object):
             * **radar** (:class:`radar`)
 
         .. note:: you should provide either **code** OR **radId**, not both
+        .. note:: the radar is (deep) copied from the shared :class:`network`, so that no DB query is issued
                     
         written by Sebastien, 2012-08
         """
-        import sqlite3 as lite
-        import pickle
-        import os
+        import copy
 
         self.id = 0
         self.status = 0
@@ -385,24 +527,10 @@ class radar(object):
 
         # If a radar is requested...
         if code or radId:
-            rad_path = os.path.dirname( os.path.abspath( __file__ ) )
-            dbname = os.path.join(rad_path, 'radars.sqlite')
-
-            if not os.path.isfile(dbname):
-                print "%s not found" % dbname
-                return
-
-            # if the radar code was provided, look for corresponding id
-            if code:
-                with lite.connect(dbname) as conn:
-                    cur = conn.cursor()
-                    cur.execute('SELECT id,code FROM rad')
-                    rows = cur.fetchall()
-                for row in rows:
-                    if code in pickle.loads(row[1].encode('ascii')):
-                        radId = row[0]
-
-            self.fillFromSqlite(dbname, radId)
+            rad = network().getRadarByCode(code) if code else network().getRadarById(radId)
+            if rad:
+                # Deep copy, so that changes to this radar (or its sites) do not affect the shared network
+                self.__dict__.update(copy.deepcopy(rad.__dict__))
 
     def fillFromSqlite(self, dbname, radId):
         """fill radar structure from sqlite DB
@@ -429,26 +557,42 @@ class radar(object):
         with lite.connect(dbname, detect_types=lite.PARSE_DECLTYPES) as conn:
             cur = conn.cursor()
             cur.execute('SELECT * FROM rad WHERE id=?', (radId,))
-            
             row = cur.fetchone()
             if not row:
                 print 'Radar not found in DB: {}'.format(radId)
                 return
+            cur.execute('SELECT * FROM hdw WHERE id=? ORDER BY tval ASC', (radId,))
+            hdwRows = cur.fetchall()
+
+        self._fillFromRows(row, hdwRows)
 
-            self.id = row[0]
-            self.cnum = row[1]
-            self.code = pickle.loads(row[2].encode('ascii'))
-            self.name = row[3]
-            self.operator = row[4]
-            self.hdwfname = row[5]
-            self.status = row[6]
-            self.stTime = row[7]
-            self.edTime = row[8]
-            self.snum = row[9]
-            for ist in range(self.snum):
-                self.sites[ist].fillFromSqlite(dbname, radId, ind=ist)
-                self.sites.append(site())
-            del self.sites[-1]
+    def _fillFromRows(self, row, hdwRows):
+        """fill radar structure from a rad table row and its (time sorted) hdw table rows
+        
+        **Belongs to**: :class:`radar`
+        
+        **Args**: 
+            * **row** (tuple): row of the rad table
+            * **hdwRows** (list): rows of the hdw table for this radar, sorted by tval
+        **Returns**:
+            * **None**
+        """
+        import pickle
+
+        self.id = row[0]
+        self.cnum = row[1]
+        self.code = pickle.loads(row[2].encode('ascii'))
+        self.name = row[3]
+        self.operator = row[4]
+        self.hdwfname = row[5]
+        self.status = row[6]
+        self.stTime = row[7]
+        self.edTime = row[8]
+        self.snum = row[9]
+        self.sites = []
+        for hdwRow in hdwRows[:self.snum]:
+            self.sites.append(site())
+            self.sites[-1]._fillFromRow(hdwRow)
             
     def __len__(self):
         """ Object length (number of site updates)
@@ -511,18 +655,66 @@ class radar(object):
                     
         written by Sebastien, 2012-08
         """
-        found = False
-        for iSit in range( self.snum ):
-            if self.sites[iSit].tval == -1:
-                found = True
-                return self.sites[iSit]
-                break
-            elif self.sites[iSit].tval >= datetime:
-                found = True
-                return self.sites[iSit]
-        if not found:
+        from bisect import bisect_left
+
+        tvals = self._siteTimes()[0]
+        iSit = bisect_left(tvals, datetime)
+        if iSit < len(tvals):
+            return self.sites[iSit]
+        else:
             print 'getSiteByDate: could not get SITE for date {}'.format(datetime)
-            return found
+            return False
+
+    def sitesAt(self, times, index=False):
+        """Get the radar sites in use at each one of an array of times
+        
+        **Belongs to**: :class:`radar`
+        
+        **Args**: 
+            * **times** (list or array of datetime.datetime, or numpy datetime64 array)
+            * [**index**] (bool): return indices into **sites** instead of site objects
+        **Returns**:
+            * **sites** (numpy object array): one :class:`site` per time (None when no site is found), or
+            * **index** (numpy int array): one index into **sites** per time (-1 when no site is found)
+        **Example**:
+            ::
+
+                # Hardware configuration for each beam of a time series
+                sites = obj.sitesAt(times)
+        """
+        import numpy as np
+
+        tvals64 = self._siteTimes()[1]
+        times = np.asarray(times, dtype='datetime64[us]')
+        iSit = np.searchsorted(tvals64, times, side='left')
+        iSit = np.where(iSit < len(tvals64), iSit, -1)
+        if index: return iSit
+
+        sites = np.empty(len(tvals64)+1, dtype='object')
+        sites[:-1] = self.sites[:len(tvals64)]
+        return sites[iSit]
+
+    def _siteTimes(self):
+        """Sorted end times of the site configurations, as a list of datetimes (for bisect) and 
+        as a datetime64 array (for vectorized lookups). Built the first time it is needed.
+        
+        **Belongs to**: :class:`radar`
+        """
+        from datetime import datetime
+        import numpy as np
+
+        sites = self.sites[:self.snum]
+        cached = getattr(self, '_tvals', None)
+        if cached is not None and cached[2] == [id(s) for s in sites]: return cached
+
+        tvals = []
+        for s in sites:
+            # A tval of -1 indicates the current configuration
+            tvals.append(datetime.max if s.tval == -1 else s.tval)
+            if s.tval == -1: break
+        tvals64 = np.array(tvals, dtype='datetime64[us]')
+        self._tvals = (tvals, tvals64, [id(s) for s in sites])
+        return self._tvals
         
 
 
@@ -572,12 +764,11 @@ class site(object):
             * **site** (:class:`site`)
 
         .. note:: you should provide either **code** OR **radId**, not both
+        .. note:: the site is (deep) copied from the shared :class:`network`, so that no DB query is issued
                     
         written by Sebastien, 2012-08
         """
-        import sqlite3 as lite
-        import pickle
-        import os
+        import copy
 
         self.tval = 0.0
         self.geolat = 0.0
@@ -595,24 +786,12 @@ class site(object):
         self.maxgate = 0
         self.maxbeam = 0
         if radId or code: 
-            rad_path = os.path.dirname( os.path.abspath( __file__ ) )
-            dbname = os.path.join(rad_path, 'radars.sqlite')
-
-            if not os.path.isfile(dbname):
-                print "%s not found" % dbname
-                return
-
-            # if the radar code was provided, look for corresponding id
-            if code:
-                with lite.connect(dbname) as conn:
-                    cur = conn.cursor()
-                    cur.execute('SELECT id,code FROM rad')
-                    rows = cur.fetchall()
-                for row in rows:
-                    if code in pickle.loads(row[1].encode('ascii')):
-                        radId = row[0]
-
-            self.fillFromSqlite(dbname, radId, dt=dt)
+            rad = network().getRadarByCode(code) if code else network().getRadarById(radId)
+            if not rad: return
+            # Configuration in use at the requested date, or most recent configuration
+            tsite = rad.getSiteByDate(dt) if dt else (rad.sites[rad.snum-1] if rad.snum else False)
+            if tsite:
+                self.__dict__.update(copy.deepcopy(tsite.__dict__))
 
     def fillFromSqlite(self, dbname, radId, ind=-1, dt=None):
         """fill site structure from sqlite databse
@@ -647,23 +826,37 @@ class site(object):
                 cur.execute('SELECT * FROM hdw WHERE id=? ORDER BY tval ASC', (radId,))
                 row = cur.fetchall()[ind]
 
-            self.id = row[0]
-            self.tval = row[1]
-            self.geolat = row[2]
-            self.geolon = row[3]
-            self.alt = row[4]
-            self.boresite = row[5]
-            self.bmsep = row[6]
-            self.vdir = row[7]
-            self.tdiff = row[8]
-            self.phidiff = row[9]
-            self.recrise = row[10]
-            self.atten = row[11]
-            self.maxatten = row[12]
-            self.maxgate = row[13]
-            self.maxbeam = row[14]
-            self.interfer = pickle.loads(row[15].encode('ascii'))
-            
+        self._fillFromRow(row)
+
+    def _fillFromRow(self, row):
+        """fill site structure from a row of the hdw table
+        
+        **Belongs to**: :class:`site`
+        
+        **Args**: 
+            * **row** (tuple): row of the hdw table
+        **Returns**:
+            * **None**
+        """
+        import pickle
+
+        self.id = row[0]
+        self.tval = row[1]
+        self.geolat = row[2]
+        self.geolon = row[3]
+        self.alt = row[4]
+        self.boresite = row[5]
+        self.bmsep = row[6]
+        self.vdir = row[7]
+        self.tdiff = row[8]
+        self.phidiff = row[9]
+        self.recrise = row[10]
+        self.atten = row[11]
+        self.maxatten = row[12]
+        self.maxgate = row[13]
+        self.maxbeam = row[14]
+        self.interfer = pickle.loads(row[15].encode('ascii'))
+        
     def __len__(self):
         """
 Object length
@@ -731,3 +924,13 @@ Object string representation
         delta = np.degrees( np.arctan2(saz, caz) )
         beam = np.round( delta/self.bmsep + (self.maxbeam-1)/2. )
         return np.int_(beam)
+
+
+# *************************************************************
+def _dbName():
+    """Path to the radar information sqlite DB
+    """
+    import os
+
+    rad_path = os.path.dirname( os.path.abspath( __file__ ) )
+    return os.path.join(rad_path, 'radars.sqlite')
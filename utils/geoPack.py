@@ -28,6 +28,9 @@ This module contains the following functions:
     * :func: `utils.geoPack.greatCircleDist`:
         Calculates the distance in radians along a great circle path between two points.
 
+All coordinate transforms accept scalars or NumPy arrays of any shape; array inputs are 
+broadcast against each other and the outputs have the broadcast shape.
+
 Based on J.M. Ruohoniemi's geopack
 Based on R.J. Barnes radar.pro
 
@@ -286,7 +289,8 @@ def lspToLcar(X, Y, Z, inverse=False):
 # *************************************************************
 def calcDistPnt(origLat, origLon, origAlt, \
             dist=None, el=None, az=None, \
-            distLat=None, distLon=None, distAlt=None):
+            distLat=None, distLon=None, distAlt=None, \
+            asArray=False):
     """Calculate: 
         - the coordinates and altitude of a distant point given a point of origin, distance, azimuth and elevation, or 
         - the coordinates and distance of a distant point given a point of origin, altitude, azimuth and elevation, or 
@@ -294,6 +298,7 @@ def calcDistPnt(origLat, origLon, origAlt, \
         - the distance, azimuth between a point of origin and a distant point and the altitude of said distant point given 
         a point of origin, distant point and elevation angle.
     Input/output is in geodetic coordinates, distances are in km and angles in degrees.
+    Inputs can be scalars or arrays of any broadcastable shape.
 
     **Args**:
         * **origLat**: geographic latitude of point of origin [degree]
@@ -305,15 +310,21 @@ def calcDistPnt(origLat, origLon, origAlt, \
         * **[distLat]**: latitude [degree] of distant point
         * **[distLon]**: longitude [degree] of distant point
         * **[distAlt]**: altitide [km] of distant point
+        * **[asArray]**: return a structured array instead of a dictionary
     **Returns**:
         * **dict**: a dictionary containing all the information about origin and distant points and their relative positions
+        * or, if asArray is set, a structured array with one record per point and the same fields as the dictionary
     """
-    from math import sqrt, pi
+    from numpy import sqrt, pi
     import numpy
+
+    def _allSet(*args):
+        # Cannot use "None in [...]" here: it would compare arrays element-wise
+        return all(a is not None for a in args)
     
     # If all the input parameters (keywords) are set to 0, show a warning, and default to fint distance/azimuth/elevation
     if dist is None and el is None and az is None:
-        assert None not in [distLat, distLon, distAlt], 'calcDistPnt: Warning: Not enough keywords.'
+        assert _allSet(distLat, distLon, distAlt), 'calcDistPnt: Warning: Not enough keywords.'
 
         # Convert point of origin from geodetic to geocentric
         (gcLat, gcLon, origRe) = geodToGeoc(origLat, origLon)
@@ -330,7 +341,7 @@ def calcDistPnt(origLat, origLon, origAlt, \
         dist = sqrt( dX**2 + dY**2 + dZ**2 )
 
     elif distLat is None and distLon is None and distAlt is None:
-        assert None not in [dist, el, az], 'calcDistPnt: Warning: Not enough keywords.'
+        assert _allSet(dist, el, az), 'calcDistPnt: Warning: Not enough keywords.'
 
         # convert pointing azimuth and elevation to geocentric
         (gcLat, gcLon, origRe, gaz, gel) = geodToGeocAzEl(origLat, origLon, az, el)
@@ -346,7 +357,7 @@ def calcDistPnt(origLat, origLon, origAlt, \
         distRe = Re
 
     elif dist is None and distAlt is None and az is None:
-        assert None not in [distLat, distLon, el], 'calcDistPnt: Warning: Not enough keywords.'
+        assert _allSet(distLat, distLon, el), 'calcDistPnt: Warning: Not enough keywords.'
 
         # Convert point of origin from geodetic to geocentric
         (gcLat, gcLon, origRe) = geodToGeoc(origLat, origLon)
@@ -372,7 +383,7 @@ def calcDistPnt(origLat, origLon, origAlt, \
         dist = Dref*numpy.sin(theta)/numpy.cos(theta+numpy.radians(gel))
 
     elif distLat is None and distLon is None and dist is None:
-        assert None not in [distAlt, el, az], 'calcDistPnt: Warning: Not enough keywords.'
+        assert _allSet(distAlt, el, az), 'calcDistPnt: Warning: Not enough keywords.'
 
         # convert pointing azimuth and elevation to geocentric
         (gcLat, gcLon, origRe, gaz, gel) = geodToGeocAzEl(origLat, origLon, az, el)
@@ -399,6 +410,16 @@ def calcDistPnt(origLat, origLon, origAlt, \
     dictOut = {'origLat': origLat, 'origLon': origLon, 'origAlt': origAlt, \
                 'distLat': distLat, 'distLon': distLon, 'distAlt': distAlt, \
                 'az': az, 'el': el, 'dist': dist, 'origRe': origRe, 'distRe': distRe}
+
+    # Or pack everything in a structured array (one record per point)
+    if asArray:
+        names = ['origLat', 'origLon', 'origAlt', 'distLat', 'distLon', 'distAlt', 
+                'az', 'el', 'dist', 'origRe', 'distRe']
+        vals = numpy.broadcast_arrays( *[numpy.asarray(dictOut[n], dtype='float') for n in names] )
+        arrOut = numpy.empty(vals[0].shape, dtype=[(n, 'float') for n in names])
+        for n, v in zip(names, vals):
+            arrOut[n] = v
+        return arrOut
     
     return dictOut
 
@@ -160,16 +160,10 @@ class mapObj(basemap.Basemap):
       trans = coords+'-'+self.coords
       if trans in ['geo-mag','mag-geo']:
         flag = 0 if trans == 'geo-mag' else 1
-        try:
-          nx, ny = len(x), len(y)
-          xt = np.array(x)
-          yt = np.array(y)
-          shape = xt.shape    
-          y, x, _ = aacgm.aacgmConvArr(list(yt.flatten()), list(xt.flatten()), [0.]*nx, flag)
-          x = np.array(x).reshape(shape)
-          y = np.array(y).reshape(shape)
-        except TypeError as e:
+        if np.isscalar(x) and np.isscalar(y):
           y, x, _ = aacgm.aacgmConv(y, x, 0., flag)
+        else:
+          y, x, _ = aacgm.aacgmConvCached(y, x, 0., flag)
 
 
     if self.coords is 'geo':
@@ -184,16 +178,10 @@ class mapObj(basemap.Basemap):
         return basemap.Basemap.__call__(self, x, y, inverse=inverse)
       if 'mpl_toolkits' in callerFile and callerName is '_readboundarydata':
         if not inverse:
-          try:
-            nx, ny = len(x), len(y)
-            x = np.array(x)
-            y = np.array(y)
-            shape = x.shape
-            yout, xout, _ = aacgm.aacgmConvArr(list(y.flatten()), list(x.flatten()), [0.]*nx, 0)
-            xout = np.array(xout).reshape(shape)
-            yout = np.array(yout).reshape(shape)
-          except TypeError:
+          if np.isscalar(x) and np.isscalar(y):
             yout, xout, _ = aacgm.aacgmConv(y, x, 0., 0)
+          else:
+            yout, xout, _ = aacgm.aacgmConvCached(y, x, 0., 0)
           return basemap.Basemap.__call__(self, xout, yout, inverse=inverse)
         else:
           return basemap.Basemap.__call__(self, x, y, inverse=inverse)
@@ -212,10 +200,8 @@ class mapObj(basemap.Basemap):
     import numpy as np
 
     if self.coords is 'mag':
-      nPts = len(self._boundarypolyll.boundary[:, 0])
-      lats, lons, _ = aacgm.aacgmConvArr(list(self._boundarypolyll.boundary[:, 1]), 
-              list(self._boundarypolyll.boundary[:, 0]), 
-              [0.]*nPts, 1)
+      lats, lons, _ = aacgm.aacgmConvCached(self._boundarypolyll.boundary[:, 1], 
+              self._boundarypolyll.boundary[:, 0], 0., 1)
       b = np.asarray([lons,lats]).T
       oldgeom = deepcopy(self._boundarypolyll)
       newgeom = _geoslib.Polygon(b).fix()